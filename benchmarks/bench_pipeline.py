@@ -0,0 +1,143 @@
+"""
+Benchmark of a full run on synthetic doc sets of 100, 1,000 and 10,000 topics.
+
+Times navtable parsing, `calculate_item_type()`, `calculate_filepaths()`, the download from a local HTTP stub,
+`update_index_pages()`, each SphinxHandler pass on its own, and the single-pass `convert()`.
+Each size is run twice on fresh copies of the doc set: once with the individual passes, once with `convert()`.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_pipeline [--sizes 100 1000 10000] [--jobs 8] [--output results.json]
+
+To catch regressions, save the results of a reference run with `--output`, and compare later runs with
+`--baseline results.json`. The command exits with status 1 if a stage is slower than the baseline by more than
+`--tolerance` (default 25%), ignoring stages that take less than 10 ms.
+"""
+
+import argparse
+import json
+import logging
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.docset import INSTANCE, docset_server, generate_docset
+from doh.testing import StubServer
+from doh.discourse_handler import DiscourseHandler, parse_discourse_navigation_table
+from doh.profiling import StageProfiler
+from doh.sphinx_handler import SphinxHandler
+
+# Stages shorter than this are too noisy to compare with a baseline
+MIN_COMPARED_SECONDS = 0.01
+
+def run_pipeline(docset, server: StubServer, docs_directory: Path, jobs: int, individual_passes: bool) -> list:
+    """
+    Runs all steps on a doc set and returns the measurements of each stage (see `StageProfiler.stage()`).
+    """
+    config = {'instance': INSTANCE, 'home_topic_id': docset.home_topic_id, 'generate_h1': False,
+              'docs_directory': docs_directory, 'jobs': jobs}
+    session = server.session(config)
+    profiler = StageProfiler(session)
+    home_topic = docset.topics[docset.home_topic_id]
+
+    with profiler.stage('parse_navtable'):
+        parse_discourse_navigation_table(home_topic)
+    with profiler.stage('generate_items'):
+        discourse_docs = DiscourseHandler(config, docset.navtable, session=session)
+    with profiler.stage('calculate_item_type'):
+        discourse_docs.calculate_item_type()
+    with profiler.stage('calculate_filepaths'):
+        discourse_docs.calculate_filepaths()
+    with profiler.stage('download'):
+        discourse_docs.download()
+
+    sphinx_docs = SphinxHandler(discourse_docs, config)
+    with profiler.stage('update_index_pages'):
+        sphinx_docs.update_index_pages()
+
+    if individual_passes:
+        with profiler.stage('replace_href_anchors'):
+            sphinx_docs.replace_href_anchors()
+        with profiler.stage('update_links'):
+            sphinx_docs.update_links()
+        with profiler.stage('replace_discourse_metadata'):
+            sphinx_docs.replace_discourse_metadata(truncate_comments=True)
+        with profiler.stage('replace_discourse_notes'):
+            sphinx_docs.replace_discourse_notes()
+        with profiler.stage('generate_tocs'):
+            sphinx_docs.generate_tocs()
+    else:
+        with profiler.stage('convert'):
+            sphinx_docs.convert(sphinx_docs.pipeline_stages(truncate_comments=True))
+
+    return profiler.stages
+
+def run_benchmarks(sizes: list, jobs: int, depth: int, link_density: float, note_density: float,
+                   topic_size: int) -> dict:
+    """
+    Returns the stage measurements for each size, e.g. `{'1000': {'download': {...}, ...}}`.
+    """
+    results = {}
+    for size in sizes:
+        docset = generate_docset(size, depth=depth, link_density=link_density, note_density=note_density,
+                                 topic_size=topic_size)
+        stages = {}
+        with docset_server(docset) as server:
+            for individual_passes in (True, False):
+                with tempfile.TemporaryDirectory() as directory:
+                    for stage in run_pipeline(docset, server, Path(directory), jobs, individual_passes):
+                        stages.setdefault(stage['name'], stage)
+        results[str(size)] = stages
+
+        print(f"\n{size} topics")
+        for name, stage in stages.items():
+            print(f"  {name:<28} {stage['seconds']:>9.3f} s  {stage['bytes_written'] / 1024:>10.1f} KiB written")
+
+    return results
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Returns a description of each stage that is slower than in the baseline by more than `tolerance`.
+    """
+    regressions = []
+    for size, stages in results.items():
+        for name, stage in stages.items():
+            reference = baseline.get(size, {}).get(name)
+            if not reference or max(stage['seconds'], reference['seconds']) < MIN_COMPARED_SECONDS:
+                continue
+            if stage['seconds'] > reference['seconds'] * (1 + tolerance):
+                regressions.append(f"{name} at {size} topics: {stage['seconds']:.3f} s "
+                                   f"(baseline {reference['seconds']:.3f} s)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000], help='Numbers of topics.')
+    parser.add_argument('--jobs', type=int, default=8, help='Download and conversion jobs. Default is 8.')
+    parser.add_argument('--depth', type=int, default=4, help='Maximum nesting level of the navtable. Default is 4.')
+    parser.add_argument('--link-density', type=float, default=0.2, help='Probability of a link per line. Default is 0.2.')
+    parser.add_argument('--note-density', type=float, default=0.05, help='Probability of a note per line. Default is 0.05.')
+    parser.add_argument('--topic-size', type=int, default=4096, help='Approximate topic size in bytes. Default is 4096.')
+    parser.add_argument('--output', type=str, default=None, help='Save the results to a JSON file.')
+    parser.add_argument('--baseline', type=str, default=None, help='Compare with the results of a previous run.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown compared to the baseline. Default is 0.25.')
+    args = parser.parse_args()
+
+    logging.basicConfig(stream=sys.stdout, format="%(message)s", level=logging.ERROR)
+
+    results = run_benchmarks(args.sizes, args.jobs, args.depth, args.link_density, args.note_density, args.topic_size)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Synthetic Discourse documentation sets and a local HTTP stub that serves them, for the benchmarks.
+
+A synthetic doc set has a home topic with a navigation table and N topics. The nesting depth of the navigation
+table, the density of links and `[note]` blocks, and the size of the topics are configurable. Generation is
+deterministic for a given seed.
+
+    with docset_server(generate_docset(1000)) as server:
+        session = server.session(config)
+        handler = DiscourseHandler(config, session=session)
+"""
+
+import random
+
+from doh.testing import StubServer
+
+# Instance name used in the generated links, routed to the stub by `StubServer.session()` (see `doh/testing.py`)
+INSTANCE = 'bench.discourse.invalid'
+HOME_TOPIC_ID = 1000
+
+FILLER = ("Documentation text that explains how to configure and operate the software, with `inline code` "
+          "and some **emphasis**, like most lines of a real topic. ")
+
+class SyntheticDocSet:
+    """
+    A generated documentation set.
+
+    Attributes
+    ----------
+    home_topic_id : str
+    topics : dict
+        Topic IDs mapped to their raw markdown, in the format of the `/raw/{topic_id}` endpoint.
+        Includes the home topic.
+    navtable : str
+        Navigation table of the home topic, without the `[details=Navigation]` markers.
+    """
+
+    def __init__(self, home_topic_id: str, topics: dict, navtable: str) -> None:
+        self.home_topic_id = home_topic_id
+        self.topics = topics
+        self.navtable = navtable
+
+def raw_post(body: str, number: int = 1) -> str:
+    return f"author | 2024-01-01 00:00:00 UTC | #{number}\n\n{body}\n\n-------------------------\n\n"
+
+def generate_docset(topics: int, depth: int = 4, link_density: float = 0.2, note_density: float = 0.05,
+                    topic_size: int = 4096, seed: int = 0) -> SyntheticDocSet:
+    """
+    Generates a synthetic documentation set.
+
+    Parameters
+    ----------
+    topics : int
+        Number of topics, not counting the home topic.
+    depth : int, optional
+        Maximum nesting level of the navigation table, by default 4.
+    link_density : float, optional
+        Probability that a line of a topic links to another topic, by default 0.2.
+    note_density : float, optional
+        Probability that a line of a topic is followed by a `[note]` block, by default 0.05.
+    topic_size : int, optional
+        Approximate size of each topic in bytes, by default 4096.
+    seed : int, optional
+        Random seed, by default 0.
+    """
+    rng = random.Random(seed)
+    topic_ids = [HOME_TOPIC_ID + 1 + i for i in range(topics)]
+
+    rows = [f"| 0 | home | [Home](/t/{HOME_TOPIC_ID}) |"]
+    level = 0
+    for i, topic_id in enumerate(topic_ids):
+        # go one level deeper, stay, or climb back up; the first row is always at level 1
+        level = rng.randint(1, min(depth, level + 1))
+        if level < depth and rng.random() < 0.05:
+            # folder without a landing page, followed by its first child
+            rows.append(f"| {level} | group-{i} | [Group {i}]() |")
+            level += 1
+        rows.append(f"| {level} | topic-{i} | [Topic {i}](/t/topic-{i}/{topic_id}) |")
+
+    navtable = "| Level | Path | Navlink |\n|-------|------|---------|\n" + '\n'.join(rows)
+
+    raw_topics = {str(HOME_TOPIC_ID): raw_post(f"# Home\n\nWelcome.\n\n[details=Navigation]\n\n{navtable}\n\n[/details]")}
+    for i, topic_id in enumerate(topic_ids):
+        lines = [f"# Topic {i}", "", f'<a href="#heading--intro"><h2 id="heading--intro">Introduction</h2></a>', ""]
+        size = 0
+        while size < topic_size:
+            line = FILLER
+            if rng.random() < link_density:
+                target = rng.choice(topic_ids)
+                line += f"See [topic {target}](/t/topic/{target}#heading--intro). "
+            lines.append(line)
+            if rng.random() < note_density:
+                lines.extend(['', '[note type="caution"]', 'Check the configuration first.', '[/note]', ''])
+            size += len(line) + 1
+        raw_topics[str(topic_id)] = raw_post('\n'.join(lines)) + raw_post("A comment.", number=2)
+
+    return SyntheticDocSet(str(HOME_TOPIC_ID), raw_topics, navtable)
+
+def docset_server(docset: SyntheticDocSet) -> StubServer:
+    """
+    Returns a local HTTP stub that serves the topics of a synthetic doc set at `/raw/{topic_id}`.
+    """
+    return StubServer({f"/raw/{topic_id}": text for topic_id, text in docset.topics.items()})
@@ -1,6 +1,7 @@
 """doh module"""
 
 from doh.discourse_handler import DiscourseHandler
+from doh.async_handler import AsyncDiscourseHandler
 from doh.sphinx_handler import SphinxHandler
 
-__all__ = ["DiscourseHandler", "SphinxHandler"]
\ No newline at end of file
+__all__ = ["DiscourseHandler", "AsyncDiscourseHandler", "SphinxHandler"]
\ No newline at end of file
@@ -0,0 +1,456 @@
+from .discourse_handler import *
+from .discourse_handler import _check_response
+from .session import (DEFAULT_TIMEOUT, DEFAULT_MAX_RETRIES, BACKOFF_BASE, BACKOFF_MAX, RETRY_STATUS_CODES,
+                      RequestStatistics, parse_retry_after)
+from urllib.parse import urlsplit
+from requests.structures import CaseInsensitiveDict
+from requests.utils import default_user_agent, get_encoding_from_headers
+import asyncio
+import random
+import ssl
+import weakref
+
+# Settings that need the blocking `DiscourseSession` (response cache, snapshots) or its threads (topic store)
+UNSUPPORTED_SETTINGS = ('cache_directory', 'store_directory', 'record', 'replay')
+
+# Sessions by event loop and instance: {loop: {instance: AsyncDiscourseSession}}
+_sessions = weakref.WeakKeyDictionary()
+
+async def read_response(reader: asyncio.StreamReader, url: str, max_size: int = DEFAULT_MAX_TOPIC_SIZE) -> tuple:
+    """
+    Reads an HTTP/1.1 response to a GET request: the status line, the headers, and a body delimited by
+    `Content-Length`, by chunked transfer encoding, or by the end of the connection.
+
+    Parameters
+    ----------
+    reader : asyncio.StreamReader
+    url : str
+        URL of the request, used in error messages and as the URL of the response.
+    max_size : int, optional
+        Maximum size of the body in bytes, by default 20 MiB.
+
+    Returns
+    -------
+    tuple
+        `(response, keep_alive)`: a `requests.Response` with its content, and whether the connection
+        can be reused for another request.
+
+    Raises
+    ------
+    ValueError
+        If the body (or its announced `Content-Length`) is larger than `max_size`.
+    requests.exceptions.ConnectionError
+        If the response is malformed.
+    asyncio.IncompleteReadError
+        If the connection is closed before the end of the response.
+    """
+    status_line = await reader.readline()
+    try:
+        version, status, reason = (status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+        status = int(status)
+    except ValueError:
+        raise requests.exceptions.ConnectionError(f"{url} returned an invalid status line: {status_line!r}")
+
+    headers = CaseInsensitiveDict()
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip(), value.strip()
+        headers[name] = f"{headers[name]}, {value}" if name in headers else value
+
+    keep_alive = version == 'HTTP/1.1' and 'close' not in headers.get('Connection', '').lower()
+    length = headers.get('Content-Length', '')
+    if status == 304 or status == 204 or 100 <= status < 200:
+        body = b''
+    elif 'chunked' in headers.get('Transfer-Encoding', '').lower():
+        chunks, size = [], 0
+        while True:
+            chunk_size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+            if chunk_size == 0:
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''): # trailers
+                    pass
+                break
+            size += chunk_size
+            if size > max_size:
+                raise ValueError(f"{url} is larger than the maximum topic size of {max_size} bytes")
+            chunks.append(await reader.readexactly(chunk_size))
+            await reader.readline()
+        body = b''.join(chunks)
+    elif length.isdigit():
+        if int(length) > max_size:
+            raise ValueError(f"{url} is {int(length)} bytes, more than the maximum topic size of {max_size} bytes")
+        body = await reader.readexactly(int(length))
+    else:
+        body = await reader.read(max_size + 1)
+        if len(body) > max_size:
+            raise ValueError(f"{url} is larger than the maximum topic size of {max_size} bytes")
+        keep_alive = False
+
+    response = requests.Response()
+    response.status_code, response.reason, response.headers, response.url = status, reason, headers, url
+    response.encoding = get_encoding_from_headers(headers)
+    response._content = body
+    return response, keep_alive
+
+class AsyncDiscourseSession:
+    """
+    Asyncio HTTP/1.1 client shared by all `AsyncDiscourseHandler` objects that download from one Discourse instance
+    on one event loop (see `get_async_session()`).
+
+    Connections are kept alive and reused, so only the first requests to a host pay for the TCP and TLS handshakes.
+    At most `limit` requests are in flight at once, however many documentation sets use the session.
+    As in `DiscourseSession`, rate-limited responses (429), server errors, connection errors and timeouts are retried
+    up to `max_retries` times, after the delay requested by the server or with jittered exponential backoff,
+    and a rate-limited response pauses all requests of the session.
+    Responses are read in full, up to the maximum size given to `get()`. There is no response cache.
+
+    Parameters
+    ----------
+    instance : str
+        Discourse instance, e.g. 'discourse.charmhub.io'.
+    limit : int, optional
+        Maximum number of requests in flight, and of idle connections kept open, by default 1.
+    timeout : float, optional
+        Timeout in seconds for each attempt of a request, including its body, by default 30.
+    max_retries : int, optional
+        Maximum number of retries per request, by default 5.
+    base_url : str, optional
+        URL that replaces `https://{instance}` in the requested URLs, e.g. a local stub server.
+        By default, requests go to the instance.
+
+    Attributes
+    ----------
+    instance : str
+    limit : int
+    timeout : float
+    max_retries : int
+    base_url : str
+    cache : None
+        No response cache, for compatibility with `DiscourseSession`.
+    stats : RequestStatistics
+    """
+
+    def __init__(self, instance: str, limit: int = 1, timeout: float = DEFAULT_TIMEOUT,
+                 max_retries: int = DEFAULT_MAX_RETRIES, base_url: str = None) -> None:
+        self.instance = instance
+        self.limit = max(1, limit)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_url = base_url or f"https://{instance}"
+        self.cache = None
+        self.stats = RequestStatistics()
+
+        self._semaphore = asyncio.Semaphore(self.limit)
+        self._connections = {} # idle connections by (scheme, host, port)
+        self._resume_at = 0.0
+        self._ssl_context = None
+
+    async def get(self, url: str, headers: dict = None, max_size: int = DEFAULT_MAX_TOPIC_SIZE) -> requests.Response:
+        """
+        Sends a GET request, retrying rate-limited responses, server errors, connection errors and timeouts.
+
+        Returns
+        -------
+        requests.Response
+            The response, with its content. After `max_retries` retries, the last response is returned.
+
+        Raises
+        ------
+        requests.exceptions.ConnectionError, requests.exceptions.Timeout
+            If the last attempt failed without a response.
+        ValueError
+            If the body is larger than `max_size`.
+        """
+        attempt = 0
+        while True:
+            async with self._semaphore:
+                self.stats.add(throttled_time=await self.__wait_for_pause(), requests=1)
+                response = None
+                start = time.perf_counter()
+                try:
+                    response = await asyncio.wait_for(self.__send(url, headers or {}, max_size), self.timeout)
+                except asyncio.TimeoutError:
+                    error = requests.exceptions.Timeout(f"{url} timed out after {self.timeout}s")
+                except requests.exceptions.ConnectionError as e:
+                    error = e
+                finally:
+                    self.stats.add_latency(time.perf_counter() - start)
+
+            if response is None:
+                if attempt >= self.max_retries:
+                    self.stats.add(errors=1)
+                    raise error
+                logging.debug(f"{url} failed ({error}). Retrying...")
+            else:
+                self.stats.add(bytes=len(response.content))
+                if response.status_code not in RETRY_STATUS_CODES:
+                    return response
+                if response.status_code == 429:
+                    self.stats.add(throttled=1)
+                if attempt >= self.max_retries:
+                    self.stats.add(errors=1)
+                    return response
+                logging.debug(f"{url} returned {response.status_code}. Retrying...")
+
+            delay = parse_retry_after(response) if response is not None else None
+            if response is not None and response.status_code == 429:
+                self._resume_at = max(self._resume_at, time.monotonic() + (delay or 0.0))
+            if delay is None:
+                delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+            await asyncio.sleep(delay)
+            self.stats.add(retries=1, throttled_time=delay)
+            attempt += 1
+
+    async def close(self) -> None:
+        """
+        Closes the idle connections.
+        """
+        connections = [connection for idle in self._connections.values() for connection in idle]
+        self._connections = {}
+        for _, writer in connections:
+            writer.close()
+        for _, writer in connections:
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def __wait_for_pause(self) -> float:
+        """
+        Waits until the pause requested by a rate-limited response is over. Returns the time waited in seconds.
+        """
+        throttled_time = 0.0
+        while True:
+            now = time.monotonic()
+            pause = self._resume_at - now
+            if pause <= 0:
+                return throttled_time
+            await asyncio.sleep(pause)
+            throttled_time += time.monotonic() - now
+
+    async def __send(self, url: str, headers: dict, max_size: int) -> requests.Response:
+        """
+        Sends one attempt of a request, on an idle connection if there is one.
+        A request that fails on an idle connection, which the server may have closed meanwhile, is sent again
+        on a new connection.
+        """
+        target = urlsplit(url.replace(f"https://{self.instance}", self.base_url, 1))
+        key = (target.scheme, target.hostname, target.port or (443 if target.scheme == 'https' else 80))
+        path = (target.path or '/') + (f"?{target.query}" if target.query else '')
+        request = ''.join([f"GET {path} HTTP/1.1\r\n", f"Host: {target.netloc}\r\n",
+                           f"User-Agent: {default_user_agent()}\r\n", "Accept: */*\r\n", "Connection: keep-alive\r\n"]
+                          + [f"{name}: {value}\r\n" for name, value in headers.items()] + ["\r\n"]).encode('latin-1')
+
+        idle = self._connections.get(key)
+        if idle:
+            try:
+                return await self.__exchange(key, idle.pop(), request, url, max_size)
+            except requests.exceptions.ConnectionError as e:
+                logging.debug(f"Reused connection to {target.netloc} failed ({e}). Reconnecting...")
+
+        try:
+            connection = await asyncio.open_connection(key[1], key[2], ssl=self.__ssl_context(key[0]),
+                                                       server_hostname=key[1] if key[0] == 'https' else None)
+        except OSError as e:
+            raise requests.exceptions.ConnectionError(f"Could not connect to {target.netloc}: {e}") from e
+        return await self.__exchange(key, connection, request, url, max_size)
+
+    async def __exchange(self, key: tuple, connection: tuple, request: bytes, url: str, max_size: int) -> requests.Response:
+        """
+        Sends a request on a connection and reads its response. The connection is kept for the next request
+        if the server allows it, and closed otherwise.
+        """
+        reader, writer = connection
+        try:
+            writer.write(request)
+            await writer.drain()
+            response, keep_alive = await read_response(reader, url, max_size)
+        except (OSError, asyncio.IncompleteReadError) as e:
+            writer.close()
+            raise requests.exceptions.ConnectionError(f"{url}: {e or 'connection closed by the server'}") from e
+        except BaseException:
+            writer.close() # e.g. cancelled by a timeout in the middle of the response
+            raise
+
+        idle = self._connections.setdefault(key, [])
+        if keep_alive and len(idle) < self.limit:
+            idle.append(connection)
+        else:
+            writer.close()
+        return response
+
+    def __ssl_context(self, scheme: str) -> ssl.SSLContext:
+        if scheme != 'https':
+            return None
+        if self._ssl_context is None:
+            # same certificate authorities as `requests`
+            self._ssl_context = ssl.create_default_context(cafile=requests.certs.where())
+        return self._ssl_context
+
+def get_async_session(configuration: dict, base_url: str = None) -> AsyncDiscourseSession:
+    """
+    Returns the `AsyncDiscourseSession` of the instance of a configuration on the running event loop,
+    and creates it from the `jobs`, `timeout` and `max_retries` settings if there is none.
+
+    All handlers of an instance on a loop share this session, and so its connections and its limit of
+    `jobs` requests in flight, which is set by the first configuration.
+
+    Parameters
+    ----------
+    configuration : dict
+        A dictionary containing settings from `config.yaml` or the command line.
+    base_url : str, optional
+        Base URL of the session if it is created (see `AsyncDiscourseSession`).
+    """
+    sessions = _sessions.setdefault(asyncio.get_running_loop(), {})
+    instance = configuration['instance']
+    if instance not in sessions:
+        max_retries = configuration.get('max_retries')
+        sessions[instance] = AsyncDiscourseSession(
+            instance, limit=int(configuration.get('jobs', 1)), timeout=float(configuration.get('timeout') or DEFAULT_TIMEOUT),
+            max_retries=DEFAULT_MAX_RETRIES if max_retries is None else int(max_retries), base_url=base_url)
+    return sessions[instance]
+
+async def close_async_sessions() -> None:
+    """
+    Closes the connections of all sessions of the running event loop. New sessions are created on next use.
+    """
+    sessions = _sessions.pop(asyncio.get_running_loop(), {})
+    for session in sessions.values():
+        await session.close()
+
+async def fetch_raw_markdown_async(url: str, session: AsyncDiscourseSession, max_size: int = DEFAULT_MAX_TOPIC_SIZE,
+                                   validators: dict = None) -> tuple:
+    """
+    Asyncio variant of `fetch_raw_markdown()`, without a response cache.
+
+    Returns
+    -------
+    tuple
+        `(text, validators)`. `text` is the raw markdown content if the request is successful, None if the server
+        answered `304 Not Modified` to the given `validators`, and otherwise an empty string.
+    """
+    try:
+        response = await session.get(url, validators, max_size)
+    except (ValueError, requests.exceptions.RequestException) as e:
+        logging.error(f"ERROR: {e}.")
+        return '', {}
+    if validators and response.status_code == 304:
+        logging.debug(f"{url} not modified since the previous run")
+        return None, dict(validators)
+    if not _check_response(response, url):
+        return '', {}
+
+    return response.text, response_validators(response)
+
+class AsyncDiscourseHandler(DiscourseHandler):
+    """
+    Asyncio variant of `DiscourseHandler`, to mirror many documentation sets at once on one event loop.
+
+    Create it with `await AsyncDiscourseHandler.create(configuration)`, which fetches the navigation table.
+    `calculate_item_type()` and `calculate_filepaths()` work as in `DiscourseHandler`, and `await download_async()`
+    replaces `download()`. `SphinxHandler` then converts the files as usual.
+
+    Requests go through the `AsyncDiscourseSession` of the instance (see `get_async_session()`), so all handlers
+    of an instance share its connections and its limit of `config['jobs']` requests in flight.
+    Files are written in the default executor of the event loop, since asyncio has no asynchronous file I/O.
+
+    Incremental downloads and both backends are supported. The response cache, the topic store and snapshots
+    are not, since they are tied to the blocking `DiscourseSession`.
+
+    Parameters
+    ----------
+    configuration : dict
+        A dictionary containing settings from `config.yaml`.
+    index_topic_raw : str
+        Raw content of the index topic. Required, since the constructor cannot fetch it without blocking.
+    session : AsyncDiscourseSession, optional
+        Session to use. By default, the session of the instance on the running event loop.
+
+    Raises
+    ------
+    ValueError
+        If `index_topic_raw` is empty, or the configuration uses unsupported settings.
+    """
+
+    def __init__(self, configuration: dict, index_topic_raw: str = '', session: AsyncDiscourseSession = None) -> None:
+        if not index_topic_raw:
+            raise ValueError("Use `await AsyncDiscourseHandler.create()` to fetch the navigation table.")
+        super().__init__(configuration, index_topic_raw, session)
+
+    @classmethod
+    async def create(cls, configuration: dict, session: AsyncDiscourseSession = None) -> 'AsyncDiscourseHandler':
+        """
+        Creates a handler and fetches the navigation table of its home topic.
+
+        Parameters
+        ----------
+        configuration : dict
+            A dictionary containing settings from `config.yaml`.
+        session : AsyncDiscourseSession, optional
+            Session to use. By default, the session of the instance on the running event loop.
+        """
+        handler = cls.__new__(cls)
+        await asyncio.to_thread(handler._setup, configuration, session or get_async_session(configuration))
+
+        url = handler._index_topic_url()
+        index_topic_raw, _ = await fetch_raw_markdown_async(url, handler._session)
+        logging.info(f"\nParsing navigation table in index topic {url}...")
+        handler._generate_items_list(parse_discourse_navigation_table(index_topic_raw))
+        return handler
+
+    def _setup(self, configuration: dict, session: AsyncDiscourseSession = None) -> None:
+        unsupported = [name for name in UNSUPPORTED_SETTINGS if configuration.get(name)]
+        if unsupported:
+            raise ValueError(f"AsyncDiscourseHandler does not support the {', '.join(unsupported)} setting(s).")
+        super()._setup(configuration, session or get_async_session(configuration))
+
+    async def _download_item_async(self, item: DiscourseItem) -> int:
+        """
+        Downloads a single topic. Runs as a task of `download_async()`.
+
+        In incremental mode, the request is conditional on the validators recorded by the previous run.
+        If the download fails, the topic file is not written and the item is marked as unchanged,
+        so that a previous version of the file, if any, is kept as is.
+
+        Returns
+        -------
+        int
+            Number of bytes written.
+        """
+        logging.debug(
+            f"\nDownloading '{item.title}' to '{item.filepath}' from URL '{item.url}'...")
+
+        if self.config.get('backend') == 'json':
+            url = f"https://{self.config['instance']}/t/{item.topic_id}.json?include_raw=true"
+            text, _ = await fetch_raw_markdown_async(url, self._session, self._max_topic_size())
+            text = first_post_markdown(text, item.topic_id)
+        else:
+            validators = self._manifest.validators(item.topic_id) if self.config.get('incremental') else {}
+            text, item.validators = await fetch_raw_markdown_async(item.url, self._session, self._max_topic_size(),
+                                                                   validators)
+            if text is None:
+                return self._keep_unmodified_item(item)
+
+        item.raw_digest = digest_text(text)
+        if item.raw_digest == EMPTY_DIGEST:
+            return self._skip_failed_item(item)
+        if self._is_unchanged(item):
+            return 0
+
+        return await asyncio.to_thread(write_topic, item.filepath, text)
+
+    async def download_async(self) -> None:
+        """
+        Downloads all topics from their URLs into the paths returned by calculate_filepaths(), as in `download()`.
+
+        All topics are scheduled at once; the session bounds the number of requests in flight.
+        """
+        topics = await asyncio.to_thread(self._prepare_download)
+
+        start = time.perf_counter()
+        sizes = await asyncio.gather(*(self._download_item_async(item) for item in topics))
+
+        self._log_download(topics, list(sizes), time.perf_counter() - start, self._session.limit)
@@ -0,0 +1,145 @@
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+DEFAULT_CACHE_SIZE = 100 * 1024 * 1024  # 100 MiB
+
+class ResponseCache:
+    """
+    Persistent cache of raw responses, keyed by URL.
+
+    Each entry is stored as two files named after the SHA-256 digest of the URL: `<key>.body` with the response
+    text, and `<key>.json` with the URL and its validators (`ETag` and `Last-Modified`).
+    The validators are sent with the next request for the same URL, so that the server can answer
+    `304 Not Modified` and the cached body is reused.
+
+    When the total size of the bodies exceeds `max_size`, the least recently used entries are evicted.
+    The modification time of the body file is used as the last access time.
+
+    Parameters
+    ----------
+    directory : str or Path
+        Directory that holds the cache. Created if it doesn't exist.
+    max_size : int, optional
+        Maximum total size of the cached bodies in bytes, by default 100 MiB.
+
+    Attributes
+    ----------
+    directory : Path
+    max_size : int
+    hits : int
+        Number of `304 Not Modified` responses served from the cache.
+    """
+
+    def __init__(self, directory, max_size: int = DEFAULT_CACHE_SIZE) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.hits = 0
+
+        self._lock = threading.Lock()
+        self._size = sum(f.stat().st_size for f in self.directory.glob('*.body'))
+
+    def __key(self, url: str) -> str:
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def __write(self, path: Path, data: bytes) -> None:
+        """
+        Writes a file atomically, so that concurrent readers never see partial entries.
+        The temporary file is removed if the write fails.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.lexists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def validators(self, url: str) -> dict:
+        """
+        Returns the conditional request headers for a cached URL.
+
+        Returns
+        -------
+        dict
+            `If-None-Match` and/or `If-Modified-Since` headers, or an empty dict if the URL is not cached.
+        """
+        key = self.__key(url)
+        if not (self.directory / f"{key}.body").exists():
+            return {}
+
+        try:
+            with open(self.directory / f"{key}.json", 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def read(self, url: str) -> str:
+        """
+        Returns the cached text of a URL and marks the entry as recently used.
+
+        Returns
+        -------
+        str
+            Cached text, or None if the entry was evicted in the meantime.
+        """
+        body_path = self.directory / f"{self.__key(url)}.body"
+        try:
+            text = body_path.read_bytes().decode('utf-8')
+            os.utime(body_path)
+        except OSError:
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return text
+
+    def store(self, url: str, text: str, etag: str = None, last_modified: str = None) -> None:
+        """
+        Stores a response. Responses without validators are not cached, since they can never be revalidated.
+        """
+        if not etag and not last_modified:
+            return
+
+        key = self.__key(url)
+        body_path = self.directory / f"{key}.body"
+        body = text.encode('utf-8')
+        meta = {'url': url, 'etag': etag, 'last_modified': last_modified}
+
+        with self._lock:
+            if body_path.exists():
+                self._size -= body_path.stat().st_size
+            self.__write(self.directory / f"{key}.json", json.dumps(meta).encode('utf-8'))
+            self.__write(body_path, body)
+            self._size += len(body)
+
+            if self._size > self.max_size:
+                self.__evict()
+
+    def __evict(self) -> None:
+        """
+        Removes the least recently used entries until the cache fits in `max_size`. Must be called with the lock held.
+        """
+        bodies = sorted(self.directory.glob('*.body'), key=lambda f: f.stat().st_mtime)
+        for body_path in bodies:
+            if self._size <= self.max_size:
+                break
+            size = body_path.stat().st_size
+            body_path.unlink(missing_ok=True)
+            body_path.with_suffix('.json').unlink(missing_ok=True)
+            self._size -= size
+            logging.debug(f"Evicted {body_path.name} from the response cache")
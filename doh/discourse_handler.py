@@ -1,32 +1,322 @@
 from slugify import slugify
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import json
 import logging
 import re
 import sys
+import time
 import requests
-import csv
+from .session import DiscourseSession, create_session
+from .manifest import SyncManifest, digest_text
+from .store import open_store
+from .files import atomic_write_lines, replace_file, io_counters
+import hashlib
+import os
+import tempfile
 
-def get_raw_markdown(url: str) -> str:
+# Topics larger than this are not downloaded, unless `config['max_topic_size']` is set
+DEFAULT_MAX_TOPIC_SIZE = 20 * 1024 * 1024  # 20 MiB
+# Size of the chunks read from the network and written to disk
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Digest of an empty topic, which is what failed downloads return
+EMPTY_DIGEST = digest_text('')
+
+def iter_limited_content(response: requests.Response, url: str, max_size: int):
+    """
+    Yields the body of a streamed response in chunks, and stops with an error if it exceeds `max_size` bytes.
+
+    Raises
+    ------
+    ValueError
+        If the body (or its announced `Content-Length`) is larger than `max_size`.
+    """
+    length = response.headers.get('Content-Length')
+    if length and length.isdigit() and int(length) > max_size:
+        raise ValueError(f"{url} is {int(length)} bytes, more than the maximum topic size of {max_size} bytes")
+
+    size = 0
+    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_size:
+            raise ValueError(f"{url} is larger than the maximum topic size of {max_size} bytes")
+        yield chunk
+
+def response_validators(response: requests.Response) -> dict:
+    """
+    Returns the conditional request headers that revalidate a response (`If-None-Match` and/or `If-Modified-Since`),
+    in the same format as `ResponseCache.validators()`.
+    """
+    headers = {}
+    if response.headers.get('ETag'):
+        headers['If-None-Match'] = response.headers['ETag']
+    if response.headers.get('Last-Modified'):
+        headers['If-Modified-Since'] = response.headers['Last-Modified']
+    return headers
+
+def _conditional_get(url: str, session: requests.Session = None, validators: dict = None) -> tuple:
+    """
+    Sends a streamed GET request, with the validators of the response cache of the session if it has one,
+    or else with the given `validators`.
+
+    Returns
+    -------
+    tuple
+        `(response, cached_text, validators)`. `cached_text` is the cached markdown if the server answered
+        `304 Not Modified` to the validators of the cache, in which case the response is already closed.
+        Otherwise it is None. If the server answered `304 Not Modified` to the given `validators`, the response
+        is closed and its status code is 304. `validators` are the headers that revalidate the returned contents.
+    """
+    cache = getattr(session, 'cache', None)
+    headers = (cache.validators(url) if cache else {}) or dict(validators or {})
+
+    response = (session or requests).get(url, headers=headers, stream=True)
+    if response.status_code == 304:
+        response.close()
+        text = cache.read(url) if cache else None
+        if text is not None:
+            logging.debug(f"{url} not modified, using cached copy")
+            return response, text, response_validators(response) or headers
+        if validators and headers == validators:
+            logging.debug(f"{url} not modified since the previous run")
+            return response, None, headers
+        response = (session or requests).get(url, stream=True) # cache entry was evicted since the request was sent
+
+    return response, None, response_validators(response)
+
+def _check_response(response: requests.Response, url: str) -> bool:
+    """
+    Logs failed responses. 404 responses are only logged in debug mode.
+    """
+    if response.status_code == 404:
+        logging.debug(f"{url} not found")
+        return False
+    if not response.ok:
+        logging.error(f"ERROR: {url} returned {response.status_code} {response.reason}.")
+        return False
+    return True
+
+def fetch_raw_markdown(url: str, session: requests.Session = None, max_size: int = DEFAULT_MAX_TOPIC_SIZE,
+                       validators: dict = None) -> tuple:
+    """
+    Queries a URL and returns its raw markdown contents, with the headers that revalidate them.
+
+    If the session has a response cache, the request is conditional: a `304 Not Modified` response
+    returns the cached markdown instead of downloading it again. Otherwise, the request is conditional
+    on the given `validators`, if any.
+
+    Parameters
+    ----------
+    url : str
+        Full URL of the raw markdown content (e.g. 'https://discourse.charmhub.io/raw/9729').
+    session : requests.Session, optional
+        Session used to send the request, e.g. a pooled `DiscourseSession`.
+        Default is None, which sends a one-off request.
+    max_size : int, optional
+        Maximum size of the response in bytes, by default 20 MiB. Larger responses are discarded
+        as soon as they exceed it.
+    validators : dict, optional
+        Conditional request headers recorded with a previous copy of the contents (see `response_validators()`).
+
+    Returns
+    -------
+    tuple
+        `(text, validators)`. `text` is the raw markdown content if the request is successful, None if the server
+        answered `304 Not Modified` to the given `validators`, and otherwise an empty string.
+    """
+    try:
+        response, text, response_headers = _conditional_get(url, session, validators)
+    except requests.exceptions.RequestException as e:
+        logging.error(f"ERROR: {e}.")
+        return '', {}
+    if text is not None:
+        return text, response_headers
+    if validators and response.status_code == 304:
+        return None, response_headers
+
+    with response:
+        if not _check_response(response, url):
+            return '', {}
+        try:
+            response._content = b''.join(iter_limited_content(response, url, max_size))
+        except (ValueError, requests.exceptions.RequestException) as e:
+            logging.error(f"ERROR: {e}.")
+            return '', {}
+    if hasattr(session, 'stats'):
+        session.stats.add(bytes=len(response.content))
+
+    cache = getattr(session, 'cache', None)
+    if cache:
+        cache.store(url, response.text, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+    return response.text, response_headers
+
+def get_raw_markdown(url: str, session: requests.Session = None, max_size: int = DEFAULT_MAX_TOPIC_SIZE) -> str:
     """
     Queries a URL and returns its raw markdown contents. If the response fails, returns an empty string.
 
+    If the session has a response cache, the request is conditional: a `304 Not Modified` response
+    returns the cached markdown instead of downloading it again.
+
     Parameters
     ----------
     url : str
         Full URL of the raw markdown content (e.g. 'https://discourse.charmhub.io/raw/9729').
+    session : requests.Session, optional
+        Session used to send the request, e.g. a pooled `DiscourseSession`.
+        Default is None, which sends a one-off request.
+    max_size : int, optional
+        Maximum size of the response in bytes, by default 20 MiB. Larger responses are discarded
+        as soon as they exceed it.
 
     Returns
     -------
     str
         Raw markdown content if the request is successful, otherwise an empty string.
     """
+    return fetch_raw_markdown(url, session, max_size)[0]
 
-    response = requests.get(url)
-    if not response.ok:
-        logging.debug(f"{url} not found")
+def stream_raw_markdown(url: str, directory: Path, session: requests.Session = None,
+                        max_size: int = DEFAULT_MAX_TOPIC_SIZE, validators: dict = None) -> tuple:
+    """
+    Downloads raw markdown to a temporary file, chunk by chunk, without holding the whole topic in memory.
+
+    The caller moves the temporary file to its final path (see `files.replace_file()`) or deletes it.
+    If the request fails, or the topic is larger than `max_size`, nothing is left on disk.
+    If `validators` are given, the request is conditional, and nothing is downloaded if the server answers
+    `304 Not Modified`.
+
+    Parameters
+    ----------
+    url : str
+        Full URL of the raw markdown content (e.g. 'https://discourse.charmhub.io/raw/9729').
+    directory : Path
+        Directory of the temporary file. Must be on the same file system as the final path.
+    session : requests.Session, optional
+        Session used to send the request. Default is None, which sends a one-off request.
+    max_size : int, optional
+        Maximum size of the topic in bytes, by default 20 MiB.
+    validators : dict, optional
+        Conditional request headers recorded by a previous download (see `response_validators()`).
+        Default is None. The validators of the response cache of the session take precedence.
+
+    Returns
+    -------
+    tuple
+        `(tmp_path, digest, size, validators)` with the path of the temporary file, the SHA-256 digest and the size
+        of its contents, and the headers that revalidate them. If the server answered `304 Not Modified` to the given
+        `validators`, `tmp_path` and `digest` are None. Returns None if the download failed.
+    """
+    try:
+        response, text, response_headers = _conditional_get(url, session, validators)
+    except requests.exceptions.RequestException as e:
+        logging.error(f"ERROR: {e}.")
+        return None
+    if text is None and response.status_code == 304:
+        return None, None, 0, response_headers
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.download.', suffix='.tmp')
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as f, response:
+            if text is not None:
+                chunks = [text.encode('utf-8')]
+            elif _check_response(response, url):
+                chunks = iter_limited_content(response, url, max_size)
+            else:
+                chunks = None
+            for chunk in chunks or []:
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+    except (ValueError, requests.exceptions.RequestException) as e:
+        logging.error(f"ERROR: {e}.")
+        chunks = None
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    if chunks is None:
+        os.unlink(tmp_path)
+        return None
+
+    if text is None:
+        if hasattr(session, 'stats'):
+            session.stats.add(bytes=size)
+        cache = getattr(session, 'cache', None)
+        if cache:
+            with open(tmp_path, 'r', encoding='utf-8') as f:
+                cache.store(url, f.read(), response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+    return Path(tmp_path), digest.hexdigest(), size, response_headers
+
+def format_raw_post(post: dict) -> str:
+    """
+    Formats a post from the Discourse JSON API like the `/raw/{topic_id}` endpoint does.
+
+    Parameters
+    ----------
+    post : dict
+        A post from a `post_stream`, with the 'username', 'updated_at', 'post_number' and 'raw' keys.
+
+    Returns
+    -------
+    str
+        The post in the format `user | timestamp | #number`, followed by its raw markdown and the comment delimiter.
+    """
+    updated_at = datetime.fromisoformat(post['updated_at'].replace('Z', '+00:00'))
+    return (f"{post['username']} | {updated_at.strftime('%Y-%m-%d %H:%M:%S UTC')} | #{post['post_number']}\n\n"
+            f"{post['raw']}\n\n"
+            "-------------------------\n\n")
+
+def get_json_markdown(base_url: str, topic_id: str, session: requests.Session = None,
+                      max_size: int = DEFAULT_MAX_TOPIC_SIZE) -> str:
+    """
+    Downloads the first post of a topic through the Discourse JSON API, in the same format as the `/raw` endpoint.
+
+    A single request (`/t/{topic_id}.json?include_raw=true`) returns the first post with its raw markdown.
+    Replies are not downloaded, since the conversion removes them (see `SphinxHandler.replace_discourse_metadata()`).
+
+    Parameters
+    ----------
+    base_url : str
+        Base URL of the Discourse instance, e.g. 'https://discourse.charmhub.io'.
+    topic_id : str
+        Topic ID, e.g. '9729'.
+    session : requests.Session, optional
+        Session used to send the request. Default is None.
+    max_size : int, optional
+        Maximum size of the response in bytes, by default 20 MiB.
+
+    Returns
+    -------
+    str
+        Raw markdown of the first post, or an empty string if the request fails.
+    """
+    text = get_raw_markdown(f"{base_url}/t/{topic_id}.json?include_raw=true", session, max_size)
+    return first_post_markdown(text, topic_id)
+
+def first_post_markdown(text: str, topic_id: str) -> str:
+    """
+    Returns the first post of a `/t/{topic_id}.json?include_raw=true` response, in the same format as the `/raw` endpoint,
+    or an empty string if the response is empty or has no first post.
+    """
+    try:
+        topic = json.loads(text) if text else {}
+    except ValueError:
+        logging.error(f"ERROR: Invalid JSON response for topic {topic_id}.")
+        topic = {}
+
+    posts = [post for post in topic.get('post_stream', {}).get('posts', [])
+             if post.get('post_number') == 1 and post.get('raw') is not None]
+    if not posts:
+        if topic:
+            logging.error(f"ERROR: The JSON response for topic {topic_id} has no first post.")
         return ''
 
-    return response.text
+    return format_raw_post(posts[0])
 
 def search_for_navtable(text: str) -> str:
     """
@@ -56,6 +346,70 @@ def search_for_navtable(text: str) -> str:
     # Return content inside markers (i.e. the navtable)
     return match.group(1).strip()
 
+# Separator row between the header and the body of a markdown table, e.g. '|-------|:----:|---|'
+NAVTABLE_SEPARATOR_PATTERN = re.compile(r"\|?(?:\s*:?-+:?\s*\|)*\s*:?-+:?\s*\|?\s*")
+
+# 'Navlink' column: [title](link)
+NAVLINK_PATTERN = re.compile(r"\[(.*?)]\((.*?)\)")
+
+def tokenize_navigation_table(table: str, first_line: int = 1) -> list:
+    """
+    Splits a navigation table into rows in a single pass over its lines.
+
+    The first row is the header, and its cells are used as column names. The separator row after the header
+    is skipped, as are blank lines. Malformed rows are reported with their line number:
+    lines that are not table rows are skipped, cells beyond the header are ignored,
+    and a 'Level' that is not a number exits the program.
+
+    Parameters
+    ----------
+    table : str
+        Markdown table.
+    first_line : int, optional
+        Line number of the first line of `table` in its topic, used in messages, by default 1.
+
+    Returns
+    -------
+    list
+        `(line_number, row)` tuples, where `row` maps the column names to the cells of the row.
+        Missing cells are omitted.
+    """
+    header = None
+    rows = []
+    for line_number, line in enumerate(table.split('\n'), start=first_line):
+        cells = line.split('|')
+        if len(cells) == 1:
+            if line.strip():
+                logging.warning(f"WARNING: Navigation table line {line_number} is not a table row. Skipping: '{line.strip()}'")
+            continue
+
+        # leading and trailing pipes are optional
+        if not cells[0].strip():
+            del cells[0]
+        if cells and not cells[-1].strip():
+            del cells[-1]
+
+        if header is None:
+            header = [cell.strip() for cell in cells]
+            continue
+        if not rows and NAVTABLE_SEPARATOR_PATTERN.fullmatch(line):
+            continue
+
+        if len(cells) > len(header):
+            logging.warning(f"WARNING: Navigation table line {line_number} has {len(cells)} columns instead of "
+                            f"{len(header)}. Ignoring the extra columns.")
+        row = dict(zip(header, map(str.strip, cells)))
+
+        level = row.get('Level', '')
+        if level and not level.isdigit():
+            logging.error(f"ERROR: Navigation table line {line_number}: 'Level' must be a number, not '{level}'. "
+                          "Exiting program.")
+            sys.exit(1)
+
+        rows.append((line_number, row))
+
+    return rows
+
 def parse_discourse_navigation_table(index_topic_markdown: str, search=True) -> list:
     """
     Extracts the navigation table from a raw Discourse topic.
@@ -64,6 +418,9 @@ def parse_discourse_navigation_table(index_topic_markdown: str, search=True) ->
     ----------
     index_topic_markdown : str
         Raw markdown content of the index topic.
+    search : bool, optional
+        If True (default), looks for the table between the `[details=Navigation]` markers.
+        Otherwise, `index_topic_markdown` is the table itself.
 
     Returns
     -------
@@ -75,40 +432,53 @@ def parse_discourse_navigation_table(index_topic_markdown: str, search=True) ->
    
     # Search for markers surrounding the navigation table
     table = ""
+    first_line = 1
     if search:
         table = search_for_navtable(index_topic_markdown)
         if not table:
             sys.exit("ERROR: Navigation table not found. Exiting program.")
+        first_line = index_topic_markdown[:index_topic_markdown.find(table)].count('\n') + 1
     else:
         table = index_topic_markdown
-        
-    # Convert Markdown table to list[dict[str, str]] by parsing as CSV
-    # (https://stackoverflow.com/a/78254495)
-    rows: list[dict] = list(csv.DictReader(table.split("\n"), delimiter="|"))
 
-    if not rows:
-        sys.exit("ERROR: Navigation table is seemingly empty. Exiting program.")
+    navigation_table = [row for _, row in tokenize_navigation_table(table, first_line)]
 
-    # Remove row after heading ("|---|---|---|")
-    rows = rows[1:]
+    if not navigation_table:
+        sys.exit("ERROR: Navigation table is seemingly empty. Exiting program.")
 
-    navigation_table = []
-    for row in rows:
-        cleaned_row = {}
-        for key, value in row.items():
-            if key != "" and value:
-                cleaned_row[key.strip()] = value.strip()
-            elif not value:
-                continue
-            
-        navigation_table.append(cleaned_row)
-    
     return navigation_table
 
-def download_topic(path: str, url : str = None) -> None:
+def write_topic(path: str, text: str) -> int:
+    """
+    Writes raw markdown to a file.
+
+    Parameters
+    ----------
+    path : str
+        Relative path to the file, e.g. '/docs/topic'. The suffix is replaced by '.md'.
+    text : str
+        Raw markdown content.
+
+    Returns
+    -------
+    int
+        Number of bytes written to the file.
+    """
+    output_path = Path(path).with_suffix('.md')
+    # replace the file instead of writing into it, since it may be a hardlink to the topic store
+    size = atomic_write_lines(output_path, [text])
+
+    logging.info(f"Downloaded {output_path}.")
+    return size
+
+def download_topic(path: str, url : str = None, session: requests.Session = None,
+                   max_size: int = DEFAULT_MAX_TOPIC_SIZE) -> int:
     """
     Downloads a Discourse topic to a markdown file.
 
+    The topic is streamed to a temporary file, which replaces the markdown file once complete.
+    If the download fails, the markdown file is left as it was.
+
     Parameters
     ----------
     path : str
@@ -116,14 +486,27 @@ def download_topic(path: str, url : str = None) -> None:
     url : str, optional
         URL of the raw Discourse topic, e.g. 'https://discourse.charmhub.io/raw/9729'. 
         Default is None.
-    """
-    text = get_raw_markdown(url)
+    session : requests.Session, optional
+        Session used to send the request. Default is None.
+    max_size : int, optional
+        Maximum size of the topic in bytes, by default 20 MiB.
 
+    Returns
+    -------
+    int
+        Number of bytes written to the file, or 0 if the download failed.
+    """
     output_path = Path(path).with_suffix('.md')
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(text)
+    download = stream_raw_markdown(url, output_path.parent, session, max_size)
+    if download is None:
+        return 0
+
+    tmp_path, _, size, _ = download
+    replace_file(tmp_path, output_path)
+    io_counters.add(bytes_written=size, files_touched=1)
 
     logging.info(f"Downloaded {output_path}.")
+    return size
 
 class DiscourseItem:
     """
@@ -149,6 +532,12 @@ class DiscourseItem:
         Whether the item is the home topic.
     isValid : bool
         If False, the item will be ignored.
+    isChanged : bool
+        If False, the topic is unchanged since the last incremental run and its file is not processed again.
+    raw_digest : str
+        Digest of the downloaded raw markdown.
+    validators : dict
+        Conditional request headers that revalidate the downloaded raw markdown, if the server sent any.
     title : str
     topic_id : str
     url : str
@@ -159,34 +548,42 @@ class DiscourseItem:
     filepath : Path
     isFolder : bool
     isTopic : bool
+
+    Items use `__slots__` instead of a `__dict__`, since large aggregated navigation trees hold many of them.
     """
 
-    navtable_level = 0
-    navtable_path = ''
-    navtable_navlink = ''
+    __slots__ = ('navtable_level', 'navtable_path', 'navtable_navlink',
+                 'isHomeTopic', 'isValid', 'isChanged', 'raw_digest', 'validators',
+                 'title', 'topic_id', 'url', 'filename',
+                 'filepath', 'isFolder', 'isTopic')
 
-    isHomeTopic = False
-    isValid = True
+    def __init__(self, navtable_row: dict, configuration) -> None:
+        self.navtable_level = 0
+        self.navtable_path = ''
+        self.navtable_navlink = ''
 
-    title = ''
-    topic_id = ''
-    url = ''
-    filename = ''
-    
-    filepath = Path()
-    isFolder = False
-    isTopic = True
+        self.isHomeTopic = False
+        self.isValid = True
+        self.isChanged = True
+        self.raw_digest = ''
+        self.validators = {}
+
+        self.title = ''
+        self.topic_id = ''
+        self.url = ''
+        self.filename = ''
+
+        self.filepath = Path()
+        self.isFolder = False
+        self.isTopic = True
 
-    def __init__(self, navtable_row: dict, configuration) -> None:
         if not navtable_row:
             self.isValid = False
             return
 
-        self.config = configuration
-
         # Get 'Level' from navigation table
         # For consistent filepath calculations across different Navtables, the default level of root items must be 1.
-        if navtable_row['Level']:
+        if navtable_row.get('Level'):
             self.navtable_level = int(navtable_row['Level'])
         else:
             self.isValid = False # item is not valid if 'Level' column is empty
@@ -195,18 +592,18 @@ class DiscourseItem:
             self.navtable_level = 1  # level 0 items are treated as level 1 items
 
         # Get 'Path' (i.e.the Discourse URL slug) from navigation table
-        self.navtable_path = navtable_row['Path']
+        self.navtable_path = navtable_row.get('Path', '')
 
         # Get 'Navlink' from navigation table
-        self.navtable_navlink = navtable_row['Navlink']
+        self.navtable_navlink = navtable_row.get('Navlink', '')
         if not self.navtable_navlink:
             self.isValid = False # item is not valid if 'Navlink' column is empty
             return
 
         # Parse title, topic ID, and URL from the 'Navlink' column
-        self.__parse_navtable_navlink()
+        self.__parse_navtable_navlink(configuration['instance'])
 
-        if self.topic_id == self.config['home_topic_id']:
+        if self.topic_id == configuration['home_topic_id']:
             self.isHomeTopic = True
 
         # Set filename parameter
@@ -225,7 +622,7 @@ class DiscourseItem:
         self.filename = path.stem
         self.title = self.filename
 
-    def __parse_navtable_navlink(self):
+    def __parse_navtable_navlink(self, instance: str):
         """
         Parses 'Navlink' item to obtain `_url` and `_title`.
 
@@ -233,7 +630,7 @@ class DiscourseItem:
         """            
         # Look for capture groups "title" and "link" in the format [<title>](<link>)
         # E.g. [Example page](/t/123) will return "Example page" and "/t/123"
-        match = re.fullmatch(r"\[(.*?)]\((.*?)\)", self.navtable_navlink)
+        match = NAVLINK_PATTERN.fullmatch(self.navtable_navlink)
         if not match:
             self.title = self.navtable_navlink
             logging.debug(
@@ -245,7 +642,7 @@ class DiscourseItem:
 
         if link == '':
             return
-        elif link.startswith("http") and self.config['instance'] not in link:
+        elif link.startswith("http") and instance not in link:
             logging.debug(
                 f"This row has an external link. This item will be ignored.")
             self.isValid = False
@@ -258,8 +655,8 @@ class DiscourseItem:
                 f"ERROR: Topic ID is not valid for item 'Level: {self.navtable_level}, Path: {self.navtable_path}, Navlink: {self.navtable_navlink}'."
                  "\nMake sure the format of the 'Navlink' is '[Title](/t/123)', '[Title](/t/slug/123)', or empty. Exiting program.")
             sys.exit(1)
-        self.url = f"https://{self.config['instance']}/raw/{self.topic_id}"
-        
+        self.url = f"https://{instance}/raw/{self.topic_id}"
+
 class DiscourseHandler:
     """
     Manages one set of Discourse documentation.
@@ -271,38 +668,132 @@ class DiscourseHandler:
         A dictionary containing settings from `config.yaml`.
     index_topic_raw : str, optional
         Raw content of the index topic, by default ''.
+    session : DiscourseSession, optional
+        Session to use, e.g. one shared with other handlers for the same instance.
+        By default, a new session is created from the configuration.
 
     Attributes
     ----------
     config : dict
         A dictionary containing settings from `config.yaml`.
+    download_statistics : dict
+        Number of 'topics', 'unchanged' topics, 'bytes' written and 'seconds' spent by the last download.
     _items : list
         List of DiscourseItem objects.
+    _session : DiscourseSession
+        Pooled HTTP session used for every request to the Discourse instance.
+    _manifest : SyncManifest
+        Topics processed by the previous run. Used to skip unchanged topics if `config['incremental']` is set.
+    _topic_index : dict
+        Topic IDs mapped to their item in `_items`. If a topic appears more than once, the last item is used.
+    _path_index : dict
+        File paths mapped to their item in `_items`.
     """
 
-    def __init__(self, configuration: dict, index_topic_raw: str = '') -> None:
+    def __init__(self, configuration: dict, index_topic_raw: str = '', session: DiscourseSession = None) -> None:
+        self._setup(configuration, session)
+
+        if index_topic_raw:
+            navtable_raw = parse_discourse_navigation_table(index_topic_raw, search=False)
+        else:
+            navtable_raw = parse_discourse_navigation_table(self._fetch_index_topic())
+        self._generate_items_list(navtable_raw)
+
+    def _setup(self, configuration: dict, session: DiscourseSession = None) -> None:
+        """
+        Initializes the attributes of the handler, without any network access.
+        """
         self.config = configuration
 
+        self._session = session or create_session(self.config)
+        self.download_statistics = {}
+        self._manifest = SyncManifest(self.config['docs_directory'])
+        self._store = open_store(self.config['store_directory']) if self.config.get('store_directory') else None
         self._items = []
-        self.__generate_items_list(index_topic_raw)
+        self._topic_index = {}
+        self._path_index = {}
 
-    def __generate_items_list(self, index_topic_raw: str = '') -> None:
+    def add_item(self, item: DiscourseItem) -> None:
         """
-        Populates `_items` with `DiscourseItem` objects generated from the navigation table.
+        Appends an item to `_items` and adds it to the topic ID and path indexes.
         """
-        if not index_topic_raw:
-            if not self.config['home_topic_id'].isdigit():
-                raise ValueError(f"Index topic ID '{self.config['home_topic_id']}' contains non-digit characters. Make sure to exclude '/t/'.")
-            
-            self._index_topic_url = f"https://{self.config['instance']}/raw/{self.config['home_topic_id']}"
-            index_topic_raw = get_raw_markdown(self._index_topic_url)
+        self._items.append(item)
+        if item.topic_id:
+            self._topic_index[item.topic_id] = item
+        self._path_index[item.filepath] = item
 
-            logging.info(f"\nParsing navigation table in index topic {self._index_topic_url}...")
-            
-            navtable_raw = parse_discourse_navigation_table(index_topic_raw)
-        else:
-            navtable_raw = parse_discourse_navigation_table(index_topic_raw, search=False)
+    def update_item_filepath(self, item: DiscourseItem, path: Path) -> None:
+        """
+        Updates the file path of an item and keeps the path index up to date.
+        """
+        if self._path_index.get(item.filepath) is item:
+            del self._path_index[item.filepath]
+        item.update_filepath(path)
+        self._path_index[item.filepath] = item
+
+    def get_item(self, topic_id: str) -> DiscourseItem:
+        """
+        Returns the item with the given topic ID, or None if the topic is not in the navigation table.
+        """
+        return self._topic_index.get(topic_id)
+
+    def get_item_by_path(self, path: Path) -> DiscourseItem:
+        """
+        Returns the item with the given file path, or None if there is no such item.
+        """
+        return self._path_index.get(Path(path))
+
+    def topics(self, changed_only: bool = False) -> list:
+        """
+        Returns the items that are topics, in navigation table order.
+
+        Parameters
+        ----------
+        changed_only : bool, optional
+            If True, only returns topics that changed since the last incremental run, by default False.
+        """
+        if changed_only:
+            return [item for item in self._items if item.isTopic and item.isChanged]
+        return [item for item in self._items if item.isTopic]
+
+    def folders(self) -> list:
+        """
+        Returns the items that are folders, in navigation table order.
+        """
+        return [item for item in self._items if item.isFolder]
+
+    def home_item(self) -> DiscourseItem:
+        """
+        Returns the item of the home topic.
+        """
+        return self.get_item(self.config['home_topic_id'])
+
+    def __rebuild_path_index(self) -> None:
+        self._path_index = {item.filepath: item for item in self._items}
 
+    def _index_topic_url(self) -> str:
+        """
+        Returns the URL of the raw markdown of the home topic.
+        """
+        if not self.config['home_topic_id'].isdigit():
+            raise ValueError(f"Index topic ID '{self.config['home_topic_id']}' contains non-digit characters. Make sure to exclude '/t/'.")
+
+        return f"https://{self.config['instance']}/raw/{self.config['home_topic_id']}"
+
+    def _fetch_index_topic(self) -> str:
+        """
+        Downloads the raw markdown of the home topic, which contains the navigation table.
+        """
+        url = self._index_topic_url()
+        index_topic_raw = get_raw_markdown(url, self._session)
+
+        logging.info(f"\nParsing navigation table in index topic {url}...")
+        return index_topic_raw
+
+    def _generate_items_list(self, navtable_raw: list) -> None:
+        """
+        Populates `_items` with `DiscourseItem` objects generated from the rows of the navigation table.
+        """
         logging.info(f"\nGenerating discourse navigation items...")
         for row in navtable_raw:
             logging.debug(f"  {row}")
@@ -310,14 +801,13 @@ class DiscourseHandler:
             if not item.isValid:
                 logging.debug(f"Row {row} is not valid. Skipping.")
                 continue
-            self._items.append(item)
+            self.add_item(item)
 
         # If index/home page was not in the navtable, add to items manually
-        index_topic = [x for x in self._items if x.topic_id == self.config['home_topic_id']]
-        if not index_topic:
+        if not self.home_item():
             index_navlink = f"[Home](/t/{self.config['home_topic_id']})"
             index_row = {'Level': '1', 'Path': 'index', 'Navlink': index_navlink}
-            self._items.append(DiscourseItem(index_row, self.config))
+            self.add_item(DiscourseItem(index_row, self.config))
 
     def calculate_item_type(self) -> None:
         """
@@ -387,15 +877,225 @@ class DiscourseHandler:
                 elif self._items[i].isFolder:
                     self._items[i].filepath = self.config['docs_directory'] / path
 
-    def download(self) -> None:
+            self.__rebuild_path_index()
+
+    def __layout_digest(self) -> str:
         """
-        Downloads all topics from their URLs into the paths returned by calculate_filepaths()
+        Returns a digest of the file layout and of the settings that affect the converted files.
+
+        Paths are relative to the docs directory, so that a staged run (see `StagedDirectory`) matches the previous run.
         """
-        logging.debug("")
+        layout = [self.config['instance'], self.config['home_topic_id'], str(self.config.get('generate_h1'))]
+        if self.config.get('explicit_toctrees'):
+            layout.append('explicit_toctrees')
         for item in self._items:
-            if item.isTopic:
-                logging.debug(
-                    f"\nDownloading '{item.title}' to '{item.filepath}' from URL '{item.url}'...")
-                
-                item.filepath.parent.mkdir(parents=True, exist_ok=True) # make sure parent folders exist
-                download_topic(path=item.filepath, url=item.url)
\ No newline at end of file
+            path = Path(item.filepath).relative_to(self.config['docs_directory'])
+            layout.append(f"{item.topic_id}|{path}|{item.isFolder}|{item.isTopic}|{item.title}")
+
+        return digest_text('\n'.join(layout))
+
+    def _download_item(self, item: DiscourseItem) -> int:
+        """
+        Downloads a single topic. Runs inside a worker thread of `download()`.
+
+        With the 'raw' backend and no topic store, the topic is streamed to a temporary file, which replaces
+        the topic file once complete. In incremental mode, the request is conditional on the validators recorded
+        by the previous run, so that an unchanged topic is not downloaded at all.
+        Otherwise, it is fetched in memory (up to the maximum topic size).
+        If the download fails, the topic file is not written and the item is marked as unchanged,
+        so that a previous version of the file, if any, is kept as is.
+
+        Returns
+        -------
+        int
+            Number of bytes written.
+        """
+        logging.debug(
+            f"\nDownloading '{item.title}' to '{item.filepath}' from URL '{item.url}'...")
+        output_path = item.filepath.with_suffix('.md')
+
+        if not self._store and self.config.get('backend', 'raw') == 'raw':
+            # no conditional requests while recording, so that the snapshot holds the topic rather than a 304
+            conditional = self.config.get('incremental') and not self.config.get('record')
+            validators = self._manifest.validators(item.topic_id) if conditional else {}
+            download = stream_raw_markdown(item.url, output_path.parent, self._session, self._max_topic_size(),
+                                           validators)
+            if download is None:
+                return self._skip_failed_item(item)
+
+            tmp_path, item.raw_digest, size, item.validators = download
+            if tmp_path is None:
+                return self._keep_unmodified_item(item)
+            if self._is_unchanged(item):
+                os.unlink(tmp_path)
+                return 0
+
+            replace_file(tmp_path, output_path)
+            io_counters.add(bytes_written=size, files_touched=1)
+            logging.info(f"Downloaded {output_path}.")
+            return size
+
+        if self._store:
+            item.raw_digest = self._store.fetch(self.config['instance'], item.topic_id, self.config.get('backend', 'raw'),
+                                                lambda validators: self.__fetch_topic(item, validators))
+        else:
+            text, _ = self.__fetch_topic(item)
+            item.raw_digest = digest_text(text)
+
+        if not item.raw_digest or item.raw_digest == EMPTY_DIGEST:
+            return self._skip_failed_item(item)
+        if self._is_unchanged(item):
+            return 0
+
+        if self._store:
+            size = self._store.materialize(item.raw_digest, output_path)
+            logging.info(f"Downloaded {output_path}.")
+            return size
+
+        return write_topic(item.filepath, text)
+
+    def _max_topic_size(self) -> int:
+        return int(self.config.get('max_topic_size') or DEFAULT_MAX_TOPIC_SIZE)
+
+    def _is_unchanged(self, item: DiscourseItem) -> bool:
+        """
+        Marks the item as unchanged if `config['incremental']` is set and its digest matches the last run.
+        """
+        if self.config.get('incremental') and self._manifest.is_unchanged(item.topic_id, item.raw_digest):
+            item.isChanged = False
+            logging.debug(f"'{item.title}' is unchanged since the last run. Skipping.")
+            return True
+        return False
+
+    def _keep_unmodified_item(self, item: DiscourseItem) -> int:
+        """
+        Marks an item as unchanged after a `304 Not Modified` response to the validators of the previous run,
+        which already converted the topic.
+        """
+        entry = self._manifest.topics.get(item.topic_id)
+        if not entry:
+            # e.g. a `304 Not Modified` replayed from a snapshot, for a topic that was never downloaded here
+            return self._skip_failed_item(item)
+        item.raw_digest = entry['digest']
+        item.isChanged = False
+        logging.debug(f"'{item.title}' was not modified since the last run. Skipping.")
+        return 0
+
+    def _skip_failed_item(self, item: DiscourseItem) -> int:
+        """
+        Marks an item whose download failed as unchanged, so that its file is neither written nor converted.
+        """
+        item.isChanged = False
+        item.raw_digest = ''
+        logging.error(f"ERROR: Could not download '{item.title}'. {item.filepath.with_suffix('.md')} was not updated.")
+        return 0
+
+    def __fetch_topic(self, item: DiscourseItem, validators: dict = None) -> tuple:
+        """
+        Fetches the raw markdown of a topic with the configured backend.
+
+        With the 'raw' backend, the request is conditional on `validators`, unless responses are being recorded
+        (see `create_session()`).
+
+        Returns
+        -------
+        tuple
+            `(text, validators)`, as returned by `fetch_raw_markdown()`. The 'json' backend returns no validators.
+        """
+        if self.config.get('backend') == 'json':
+            return get_json_markdown(f"https://{self.config['instance']}", item.topic_id, self._session,
+                                     self._max_topic_size()), {}
+        if self.config.get('record'):
+            validators = None
+        return fetch_raw_markdown(item.url, self._session, self._max_topic_size(), validators)
+
+    def _prepare_download(self) -> list:
+        """
+        Compares the layout with the previous run and creates the parent folders of all topics.
+
+        Returns
+        -------
+        list
+            Items to download.
+        """
+        logging.debug("")
+        topics = self.topics()
+
+        self._manifest.check_layout(self.__layout_digest())
+
+        # create parent folders up front so that workers only write files
+        for item in topics:
+            item.filepath.parent.mkdir(parents=True, exist_ok=True)
+
+        return topics
+
+    def _log_download(self, topics: list, sizes: list, elapsed: float, jobs: int) -> None:
+        """
+        Logs the throughput of a download, and the number of cached and unchanged topics.
+        """
+        elapsed = max(elapsed, 1e-9)
+        unchanged = len([item for item in topics if not item.isChanged])
+        self.download_statistics = {'topics': len(topics), 'unchanged': unchanged, 'bytes': sum(sizes), 'seconds': elapsed}
+
+        total_kib = sum(sizes) / 1024
+        logging.info(
+            f"\nDownloaded {len(topics)} topics ({total_kib:.1f} KiB) in {elapsed:.2f}s with {jobs} job(s): "
+            f"{len(topics) / elapsed:.1f} topics/s, {total_kib / elapsed:.1f} KiB/s.")
+
+        if self._session.cache:
+            logging.info(f"Reused {self._session.cache.hits} cached responses.")
+
+        if self._store:
+            logging.info(f"Topic store: {self._store.fetched} topics fetched, {self._store.reused} reused from other doc sets, "
+                         f"{self._store.revalidated} unchanged since they were stored.")
+
+        if self.config.get('incremental'):
+            logging.info(f"Skipped {unchanged} unchanged topics.")
+
+    def download(self) -> None:
+        """
+        Downloads all topics from their URLs into the paths returned by calculate_filepaths().
+
+        Topics are fetched concurrently by up to `config['jobs']` worker threads (default 1).
+        The file layout does not depend on the number of jobs.
+
+        By default, topics are fetched from the `/raw/{topic_id}` endpoint. If `config['backend']` is 'json',
+        only their first post is fetched, through the JSON API (see `get_json_markdown()`).
+
+        If `config['incremental']` is set, topics whose raw markdown is unchanged since the last run
+        are not written, and are marked with `isChanged = False` so that SphinxHandler skips them.
+        With the 'raw' backend, topics are requested with the `ETag`/`Last-Modified` validators of the last run,
+        so that unchanged topics are not downloaded if the server supports conditional requests.
+        Other topics are downloaded and compared by digest.
+
+        If `config['store_directory']` is set, topics go through the shared `TopicStore`: a topic is requested
+        at most once per process, even if several doc sets list it, and later runs revalidate the stored copy
+        with a conditional request.
+        """
+        topics = self._prepare_download()
+        jobs = max(1, int(self.config.get('jobs', 1)))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            sizes = list(executor.map(self._download_item, topics))
+
+        self._log_download(topics, sizes, time.perf_counter() - start, jobs)
+
+    def log_statistics(self) -> None:
+        """
+        Logs the request counters of the session: requests, retries, rate-limited responses,
+        throttled time and bytes received.
+        """
+        logging.info(f"\nHTTP statistics: {self._session.stats.summary()}.")
+
+    def save_manifest(self) -> None:
+        """
+        Records the downloaded topics and their final file paths for the next incremental run.
+
+        Call after all SphinxHandler steps, once the files are in their final location.
+        Also saves the index of the topic store, if one is configured, and deletes its unreferenced objects.
+        """
+        self._manifest.save(self._items)
+        if self._store:
+            self._store.save()
+            self._store.gc() # no topics are being fetched once the doc sets are downloaded
@@ -1,42 +1,98 @@
 import argparse
 import shutil
-from .sphinx_handler import *
+from .runner import *
 
 def launch():
 
     parser = argparse.ArgumentParser(prog='discourse-offline-helper (doh)',
                                      description='Download Discourse docs and convert to Sphinx/RTD markdown.')
-    parser.add_argument('-i', '--instance', type=str, help="Discourse instance to download from. E.g. 'discourse.ubuntu.com'", required=True)
-    parser.add_argument('-t', '--home_topic_id', type=str, help="Topic ID of home page containing navigation table. E.g. '123'", required=True)
+    parser.add_argument('-i', '--instance', type=str, help="Discourse instance to download from. E.g. 'discourse.ubuntu.com'. Required unless --batch is used.", default=None)
+    parser.add_argument('-t', '--home_topic_id', type=str, help="Topic ID of home page containing navigation table. E.g. '123'. Required unless --batch is used.", default=None)
+    parser.add_argument('--batch', type=str, help='YAML file listing several documentation sets to mirror in one run, in the format of config.yaml. Each set is saved in <docs_directory>/<name>/ unless it sets its own docs_directory.', default=None)
     parser.add_argument('-d', '--docs_directory', type=str, help='Local path to save the downloaded docs. Default is docs/src/', default='docs/src/')
+    parser.add_argument('--pool_size', type=int, help='Maximum number of open connections to the Discourse instance. Default is 10, or the number of jobs if higher.', default=None)
+    parser.add_argument('--timeout', type=float, help='Timeout in seconds for each request to the Discourse instance. Default is 30.', default=None)
+    parser.add_argument('--max_retries', type=int, help='Maximum number of retries for rate-limited or failed requests. Default is 5.', default=None)
+    parser.add_argument('--cache_directory', type=str, help='Directory for a persistent response cache. Cached topics are revalidated with conditional requests. Disabled by default.', default=None)
+    parser.add_argument('--cache_size', type=int, help='Maximum size of the response cache in MiB. Default is 100.', default=None)
+    parser.add_argument('--store_directory', type=str, help='Directory for a content-addressed topic store shared by doc sets and runs. Each topic is downloaded once per run, and revalidated with a conditional request in later runs. Disabled by default.', default=None)
+    parser.add_argument('--record', type=str, help='Record every response in a snapshot file (SQLite) that can be used with --replay.', default=None)
+    parser.add_argument('--replay', type=str, help='Read all responses from a snapshot file recorded with --record, without network access.', default=None)
+    parser.add_argument('--max_topic_size', type=float, help='Maximum size of a topic in MiB. Larger topics are not downloaded, and their previous version is kept. Default is 20.', default=None)
+    parser.add_argument('--backend', type=str, choices=['raw', 'json'], help="Endpoint used to download topics: 'raw' (/raw/<id>, with replies) or 'json' (/t/<id>.json, first post only). Default is 'raw'.", default='raw')
     parser.add_argument('--navtable', type=str, help='Path to a .md or .txt file with a custom navigation table.', default=None)
     parser.add_argument('--generate_h1', action="store_true", help='Generate h1 headings from topic titles.')
+    parser.add_argument('--explicit_toctrees', action="store_true", help='List the pages of each index in its toctree in navigation table order, instead of using glob patterns.')
+    parser.add_argument('-j', '--jobs', type=int, help='Number of topics to download concurrently, and of processes used to convert them. Default is 1.', default=1)
+    parser.add_argument('--incremental', action="store_true", help='Only process topics that changed since the last run in the same docs directory.')
+    parser.add_argument('--staged', action="store_true", help='Build the output in a scratch copy of the docs directory and swap it into place only if the whole run succeeds.')
+    parser.add_argument('--streaming', action="store_true", help='Stream each file through the conversion line by line instead of loading it in memory.')
+    parser.add_argument('--profile', action="store_true", help='Log the time, file I/O and HTTP latency of each step.')
+    parser.add_argument('--profile_report', type=str, help='Save the time, file I/O and HTTP latency of each step to a JSON file. Implies --profile.', default=None)
+    parser.add_argument('--profile_cprofile', type=str, help='Run each step under cProfile and save the statistics of the slowest one to this file. The measured times then include the overhead of cProfile. Implies --profile.', default=None)
+    parser.add_argument('--plan', action="store_true", help='Print the output layout (files, renames, new index files and link targets) as JSON, without downloading topics or writing files.')
     parser.add_argument('--debug', action="store_true", help="Increase log verbosity")
 
     args = parser.parse_args()
 
+    if not args.batch and not (args.instance and args.home_topic_id):
+        parser.error("the following arguments are required: -i/--instance, -t/--home_topic_id (or --batch)")
+
     config = {}
-    instance = args.instance
-    if '://' in instance:
-        instance = instance.split('://')[1]
-    if 'www.' in instance:
-        instance = instance.split('www.')[1]
-    config['instance'] = args.instance
-
-    home_topic_id = args.home_topic_id
-    if not home_topic_id.isdigit():
-        sys.exit("ERROR: --home_topic_id must be a number. E.g. '1234'.")
-    config['home_topic_id'] = args.home_topic_id
+    if not args.batch:
+        config['instance'] = normalize_instance(args.instance)
+
+        home_topic_id = args.home_topic_id
+        if not home_topic_id.isdigit():
+            sys.exit("ERROR: --home_topic_id must be a number. E.g. '1234'.")
+        config['home_topic_id'] = args.home_topic_id
 
     config['generate_h1'] = args.generate_h1
+    config['explicit_toctrees'] = args.explicit_toctrees
 
     config['docs_directory'] = args.docs_directory
+    config['incremental'] = args.incremental
+    config['streaming'] = args.streaming
+    config['staged'] = args.staged
+
+    if args.jobs < 1:
+        sys.exit("ERROR: --jobs must be at least 1.")
+    config['jobs'] = args.jobs
+
+    if args.pool_size is not None and args.pool_size < 1:
+        sys.exit("ERROR: --pool_size must be at least 1.")
+    config['pool_size'] = args.pool_size
+    if args.timeout is not None and args.timeout <= 0:
+        sys.exit("ERROR: --timeout must be a positive number of seconds.")
+    config['timeout'] = args.timeout
+    if args.max_retries is not None and args.max_retries < 0:
+        sys.exit("ERROR: --max_retries must be 0 or more.")
+    config['max_retries'] = args.max_retries
+
+    config['backend'] = args.backend
+    if args.max_topic_size is not None and args.max_topic_size <= 0:
+        sys.exit("ERROR: --max_topic_size must be a positive number of MiB.")
+    config['max_topic_size'] = int(args.max_topic_size * 1024 * 1024) if args.max_topic_size else None
+
+    config['cache_directory'] = args.cache_directory
+    config['store_directory'] = args.store_directory
+
+    if args.record and args.replay:
+        sys.exit("ERROR: --record and --replay cannot be used together.")
+    if args.replay and not os.path.exists(args.replay):
+        sys.exit(f"ERROR: Snapshot {args.replay} not found.")
+    config['record'] = args.record
+    config['replay'] = args.replay
+    if args.cache_size is not None:
+        if args.cache_size < 1:
+            sys.exit("ERROR: --cache_size must be at least 1.")
+        config['cache_size'] = args.cache_size * 1024 * 1024
 
     logging_level = logging.INFO
     if args.debug: 
         logging_level = logging.DEBUG
     logging.basicConfig(
-        stream=sys.stdout,
+        stream=sys.stderr if args.plan else sys.stdout, # keep stdout for the JSON plan
         format="%(message)s",
         level=logging_level     
     )
@@ -45,28 +101,42 @@ def launch():
     # if os.path.exists(args.docs_directory):
     #     shutil.rmtree(args.docs_directory)
         
+    profile = args.profile or args.profile_report or args.profile_cprofile
+
+    if args.plan:
+        if args.batch or profile or args.record:
+            sys.exit("ERROR: --plan cannot be used with --batch, --record or --profile options.")
+        # no cache or topic store, so that nothing is written
+        config['cache_directory'] = None
+        config['store_directory'] = None
+        navtable = read_navtable(args.navtable) if args.navtable else ''
+        print(plan_docset(config, navtable).to_json())
+        return
+
+    if args.batch:
+        # Several documentation sets, sharing connection pools per instance
+        if profile:
+            sys.exit("ERROR: --profile options cannot be used with --batch, since doc sets are downloaded concurrently.")
+        if args.navtable:
+            sys.exit("ERROR: --navtable cannot be used with --batch. Set 'navtable' for each documentation set in the batch file instead.")
+        if not run_batch(load_batch_file(args.batch, config), args.jobs):
+            sys.exit(1)
+        return
+
     # Step 1: Download and process a Discourse documentation set
-    discourse_docs = None
-    if args.navtable:
-        navtable = ""
-        with open(args.navtable, 'r') as f:
-            navtable = f.read()
-        discourse_docs = DiscourseHandler(config, navtable)
-    else:
-        discourse_docs = DiscourseHandler(config)
-
-    discourse_docs.calculate_item_type() # determine if item is a folder, page, or both
-    discourse_docs.calculate_filepaths() # calculate local file paths
-    discourse_docs.download() # download raw markdown files from Discourse
-
-    # Step 2: Convert local discourse docs to a Sphinx/RTD-compatible format (markdown only)
-    sphinx_docs = SphinxHandler(discourse_docs, config)
-
-    sphinx_docs.update_index_pages() # create or rename landing pages as index files
-
-    sphinx_docs.replace_href_anchors() # replace headings with <a href=...
-    sphinx_docs.update_links() # replace discourse links with local file paths
-
-    sphinx_docs.replace_discourse_metadata(truncate_comments=True) # remove timestamp and comments, adds h1 headings.
-    sphinx_docs.replace_discourse_notes() # replace [note] admonitions
-    sphinx_docs.generate_tocs() # generate toctree for each index file
\ No newline at end of file
+    profiler = StageProfiler(cprofile=bool(args.profile_cprofile))
+    navtable = read_navtable(args.navtable) if args.navtable else ''
+    with staged_output(config):
+        discourse_docs = download_docset(config, navtable, profiler=profiler)
+
+        # Step 2: Convert local discourse docs to a Sphinx/RTD-compatible format (markdown only)
+        convert_docset(discourse_docs, profiler)
+
+    discourse_docs.log_statistics() # requests, retries and throttled time
+
+    if profile:
+        profiler.log_report()
+    if args.profile_report:
+        profiler.save_report(args.profile_report)
+    if args.profile_cprofile:
+        profiler.dump_hottest_stage(args.profile_cprofile)
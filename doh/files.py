@@ -0,0 +1,278 @@
+from pathlib import Path
+from typing import Iterable
+import ctypes
+import errno
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import threading
+
+# read once at import, since os.umask() can only be read by changing it
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+class IOCounters:
+    """
+    Process-wide counters of the topic files read and written, used by the stage profiler.
+
+    Attributes
+    ----------
+    bytes_read : int
+    bytes_written : int
+    files_touched : int
+        Number of files read, written or renamed.
+    """
+
+    FIELDS = ('bytes_read', 'bytes_written', 'files_touched')
+
+    def __init__(self) -> None:
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.files_touched = 0
+        self._lock = threading.Lock()
+
+    def add(self, **counters) -> None:
+        """
+        Adds to one or more counters, e.g. `add(bytes_read=1024, files_touched=1)`. Thread-safe.
+        """
+        with self._lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self) -> dict:
+        """
+        Returns the current values of the counters.
+        """
+        with self._lock:
+            return {name: getattr(self, name) for name in self.FIELDS}
+
+io_counters = IOCounters()
+
+def atomic_write_lines(path: Path, lines: Iterable[str]) -> int:
+    """
+    Writes lines to a temporary file next to `path` and renames it over `path` once complete.
+
+    Readers of `path` see either the old or the new contents, never a partial file. `lines` is consumed lazily,
+    so it can be a generator that reads from `path` itself. The permissions of an existing file are kept.
+
+    Parameters
+    ----------
+    path : Path
+        File to write.
+    lines : Iterable[str]
+        Lines to write, including their line endings.
+
+    Returns
+    -------
+    int
+        Number of bytes written.
+    """
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+        size = os.path.getsize(tmp_path)
+        replace_file(tmp_path, path)
+    except BaseException:
+        if os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    io_counters.add(bytes_written=size, files_touched=1)
+    return size
+
+def replace_file(tmp_path: Path, path: Path) -> None:
+    """
+    Renames a complete temporary file over `path`, keeping the permissions of an existing file.
+
+    Temporary files from `tempfile.mkstemp()` are only readable by their owner, so new files get the default
+    permissions (0o666 minus the umask) instead.
+    """
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+
+    os.chmod(tmp_path, mode)
+    os.replace(tmp_path, path)
+
+def _link_or_copy(source: str, destination: str) -> None:
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+def fsync_tree(path: Path) -> None:
+    """
+    Flushes every file and folder under `path` to disk.
+    """
+    for root, directories, files in os.walk(path):
+        for name in files:
+            file_path = os.path.join(root, name)
+            if os.path.islink(file_path):
+                continue
+            fd = os.open(file_path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        fsync_directory(root)
+
+def fsync_directory(path: Path) -> None:
+    """
+    Flushes the entries of a folder (e.g. after a rename) to disk, where the platform supports it.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+# renameat2() arguments, see `exchange_paths()`
+_AT_FDCWD = -100
+_RENAME_EXCHANGE = 2
+
+def exchange_paths(first: Path, second: Path) -> None:
+    """
+    Atomically swaps two paths, e.g. a folder and a symlink, with `renameat2(RENAME_EXCHANGE)`.
+
+    Raises
+    ------
+    OSError
+        If the platform or file system doesn't support it (`ENOSYS` or `EINVAL`), or if the swap fails.
+    """
+    try:
+        renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+    except (AttributeError, OSError):
+        raise OSError(errno.ENOSYS, "renameat2() is not available")
+
+    if renameat2(_AT_FDCWD, os.fsencode(first), _AT_FDCWD, os.fsencode(second), _RENAME_EXCHANGE) != 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error), str(first), None, str(second))
+
+class StagedDirectory:
+    """
+    Scratch build of an output folder, swapped into place once complete.
+
+    `path` is a symlink to the current build, a hidden sibling folder named `.<name>.build-*`. `create()` makes
+    a new build that starts as a copy of the current one. Files are hardlinked, not copied, which is safe because
+    every write to an output file replaces it with a new file (see `atomic_write_lines()`). The run then writes
+    to the new build only, so `path` keeps its previous contents until `commit()` flushes the new build to disk
+    and points `path` at it. `discard()` removes it instead, e.g. after a failure.
+
+    The swap is a single rename of a temporary symlink over `path`, so readers always find `path`, with either
+    the previous or the new contents. If `path` is still a plain folder (before the first staged run), it is
+    exchanged with the symlink in one `renameat2(RENAME_EXCHANGE)` call on Linux. Elsewhere, it takes two renames
+    once, between which `path` is missing.
+
+    Parameters
+    ----------
+    path : str or Path
+        Output folder. It doesn't have to exist.
+
+    Attributes
+    ----------
+    path : Path
+    staging_path : Path
+        New build, set by `create()`.
+    """
+
+    def __init__(self, path) -> None:
+        self.path = Path(os.path.abspath(path))
+        self.staging_path = None
+
+    def create(self) -> Path:
+        """
+        Creates a new build as a hardlinked copy of `path`.
+
+        Returns
+        -------
+        Path
+            The new build.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.staging_path = Path(tempfile.mkdtemp(dir=self.path.parent, prefix=f".{self.path.name}.build-"))
+        os.chmod(self.staging_path, 0o777 & ~_UMASK) # mkdtemp() folders are only readable by their owner
+
+        if self.path.is_dir():
+            shutil.copytree(self.path, self.staging_path, symlinks=True, copy_function=_link_or_copy,
+                            dirs_exist_ok=True)
+
+        logging.debug(f"Staging the output of {self.path} in {self.staging_path}")
+        return self.staging_path
+
+    def commit(self) -> None:
+        """
+        Flushes the new build to disk and points `path` at it. The previous build is deleted.
+        """
+        fsync_tree(self.staging_path)
+
+        # named after the new build, whose name is unique
+        link = self.staging_path.with_name(f"{self.staging_path.name}.link")
+        os.symlink(self.staging_path.name, link)
+        try:
+            previous = self.__previous_build()
+            if os.path.isdir(self.path) and not os.path.islink(self.path):
+                previous = self.__exchange(link)
+            else:
+                os.replace(link, self.path)
+        except BaseException:
+            if os.path.lexists(link):
+                os.unlink(link)
+            raise
+        fsync_directory(self.path.parent)
+
+        if previous:
+            shutil.rmtree(previous, ignore_errors=True)
+        logging.info(f"\nSwapped the staged output into {self.path}.")
+        self.staging_path = None
+
+    def __previous_build(self) -> Path:
+        """
+        Returns the build that `path` points to, if it is one, so that it can be deleted once replaced.
+        Symlinks to other folders are replaced, but their target is left alone.
+        """
+        if not os.path.islink(self.path):
+            return None
+        target = self.path.parent / os.readlink(self.path)
+        if target.parent != self.path.parent or not target.name.startswith(f".{self.path.name}.build-"):
+            return None
+        return target
+
+    def __exchange(self, link: Path) -> Path:
+        """
+        Replaces the plain folder at `path` with the symlink `link`. Returns the path of the previous folder.
+        """
+        try:
+            exchange_paths(link, self.path)
+            return link
+        except OSError as e:
+            if e.errno not in (errno.ENOSYS, errno.EINVAL):
+                raise
+
+        logging.debug(f"Atomic exchange not supported. {self.path} is briefly missing while it becomes a symlink.")
+        backup = self.staging_path.with_name(f"{self.staging_path.name}.old")
+        os.rename(self.path, backup)
+        try:
+            os.replace(link, self.path)
+        except OSError:
+            os.rename(backup, self.path)
+            raise
+        return backup
+
+    def discard(self) -> None:
+        """
+        Deletes the new build, leaving `path` as it was.
+        """
+        if self.staging_path:
+            shutil.rmtree(self.staging_path, ignore_errors=True)
+            logging.info(f"Discarded the staged output. {self.path} was not modified.")
+        self.staging_path = None
@@ -0,0 +1,207 @@
+from pathlib import Path
+import json
+import logging
+import re
+from .files import atomic_write_lines
+
+LINKS_FILENAME = '.doh-links.json'
+LINK_REPORT_FILENAME = '.doh-link-report.json'
+
+# Markdown link, e.g. '[Some guide](https://example.com/guide "Title")'
+MARKDOWN_LINK_PATTERN = re.compile(r"\[[^\]]*\]\((?P<target>[^)\s]+)[^)]*\)")
+# Discourse heading with a manual anchor, e.g. '<h2 id="heading--parameters">'
+HEADING_ID_PATTERN = re.compile(r'<h[1-6] id="(?:heading--)?(?P<id>[^"]+)"')
+# Markdown heading, e.g. '## Set parameters'
+MARKDOWN_HEADING_PATTERN = re.compile(r"^#{1,6}\s+(?P<title>.+?)\s*#*\s*$")
+# Relative link to a Discourse topic, e.g. '/t/some-guide/123', '/t/123' or '/t/123/4' (a post of topic 123).
+# The slug is optional and can't be all digits, so that digits in the slug are not taken for the topic ID.
+TOPIC_LINK = r"/t/(?:(?!\d+/)[^/#?)\s]+/)?(?P<topic_id>\d+)"
+TOPIC_LINK_PATTERN = re.compile(TOPIC_LINK)
+# Markdown link to a Discourse topic, e.g. '[Some guide](/t/some-guide/123#some-heading)'
+DISCOURSE_LINK_PATTERN = re.compile(r"\[(?P<text>[^\]]+)]\((?P<link>" + TOPIC_LINK + r"[^)]*)\)")
+
+def new_link_record(path: str) -> dict:
+    """
+    Returns an empty record of the links of one topic file.
+
+    Keys
+    ----
+    path : str
+        Output file, relative to the docs directory.
+    anchors : list
+        Anchors defined by the headings of the file.
+    anchor_refs : list
+        Anchors referenced by links within the file, e.g. 'parameters' for '[Parameters](#parameters)'.
+    links : list
+        `[topic_id, anchor]` of each link to a topic of the navigation table. `anchor` is '' if there is none.
+    outside : list
+        Links to topics that are not in the navigation table.
+    unresolved : list
+        Links to the Discourse instance that don't point to a topic, or that use its full URL.
+    external : list
+        Links to other sites.
+    """
+    return {'path': path, 'anchors': [], 'anchor_refs': [], 'links': [], 'outside': [], 'unresolved': [], 'external': []}
+
+def heading_anchor(title: str) -> str:
+    """
+    Returns the anchor of a markdown heading, e.g. 'Set up: the basics' -> 'set-up-the-basics'.
+    """
+    return re.sub(r"\s+", '-', re.sub(r"[^\w\s-]", '', title.strip().lower()))
+
+def record_headings(record: dict, line: str) -> None:
+    """
+    Adds the anchors defined by a line of Discourse markdown to a link record.
+    """
+    for match in HEADING_ID_PATTERN.finditer(line):
+        record['anchors'].append(match.group('id'))
+    match = MARKDOWN_HEADING_PATTERN.match(line)
+    if match:
+        record['anchors'].append(heading_anchor(match.group('title')))
+
+def record_links(record: dict, line: str, instance: str) -> None:
+    """
+    Adds the links of a line to a link record, except relative links to topics (`/t/<slug>/<id>`),
+    which are recorded by `SphinxHandler` when it rewrites them.
+    """
+    for match in MARKDOWN_LINK_PATTERN.finditer(line):
+        target = match.group('target')
+        if target.startswith('#'):
+            record['anchor_refs'].append(target[1:].replace('heading--', '', 1))
+        elif target.startswith('/t/') and TOPIC_LINK_PATTERN.match(target):
+            continue
+        elif target.startswith('/'):
+            record['unresolved'].append(target)
+        elif target.startswith(('http://', 'https://')):
+            host = target.split('/')[2]
+            if host == instance or host == f"www.{instance}":
+                record['unresolved'].append(target)
+            else:
+                record['external'].append(target)
+
+class LinkGraph:
+    """
+    Graph of the links between the topics of a documentation set, recorded while they are converted.
+
+    The graph is saved as compact JSON in `<docs_directory>/.doh-links.json`: topic IDs mapped to the link record
+    of their file (see `new_link_record()`). Topics that are not converted again by an incremental run keep
+    their record from the previous run.
+
+    Parameters
+    ----------
+    docs_directory : str or Path
+
+    Attributes
+    ----------
+    pages : dict
+        Topic IDs mapped to link records.
+    """
+
+    def __init__(self, docs_directory) -> None:
+        self.docs_directory = Path(docs_directory)
+        self.pages = {}
+
+        try:
+            with open(self.docs_directory / LINKS_FILENAME, 'r', encoding='utf-8') as f:
+                self.pages = json.load(f).get('pages', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError):
+            logging.warning(f"WARNING: Could not read {self.docs_directory / LINKS_FILENAME}. It will be rebuilt.")
+
+    def update(self, topic_ids: list, records: dict) -> None:
+        """
+        Replaces the records of converted topics, and drops topics that are no longer in the navigation table.
+
+        Parameters
+        ----------
+        topic_ids : list
+            Topic IDs in the navigation table.
+        records : dict
+            Topic IDs mapped to the link records of the topics converted by this run.
+        """
+        pages = {}
+        for topic_id in topic_ids:
+            record = records.get(topic_id, self.pages.get(topic_id))
+            if record is None:
+                continue
+            pages[topic_id] = {key: value if key == 'path' else self.__unique(value) for key, value in record.items()}
+        self.pages = pages
+
+    @staticmethod
+    def __unique(values: list) -> list:
+        unique = []
+        seen = set()
+        for value in values:
+            key = tuple(value) if isinstance(value, list) else value
+            if key not in seen:
+                seen.add(key)
+                unique.append(value)
+        return unique
+
+    def report(self, home_topic_id: str, missing: set = frozenset()) -> dict:
+        """
+        Analyses the graph.
+
+        Parameters
+        ----------
+        home_topic_id : str
+        missing : set, optional
+            IDs of the topics of the navigation table that have no file, e.g. because their download failed.
+
+        Returns
+        -------
+        dict
+            - 'orphans': files of topics that no other topic links to, except the home page.
+            - 'broken': `{'file', 'link'}` of each link to a missing anchor, or to a topic without a file.
+            - 'unresolved': `{'file', 'link'}` of each link to the Discourse instance that doesn't point to a topic.
+            - 'outside_navtable': `{'file', 'link'}` of each link to a topic that is not in the navigation table.
+            - 'external': number of distinct links to other sites.
+        """
+        linked = set()
+        report = {'orphans': [], 'broken': [], 'unresolved': [], 'outside_navtable': [], 'external': 0}
+        external = set()
+
+        for topic_id, page in self.pages.items():
+            anchors = set(page['anchors'])
+            for anchor in page['anchor_refs']:
+                if anchor not in anchors:
+                    report['broken'].append({'file': page['path'], 'link': f"#{anchor}"})
+
+            for target_id, anchor in page['links']:
+                if target_id != topic_id:
+                    linked.add(target_id)
+                target = self.pages.get(target_id)
+                if target_id in missing:
+                    report['broken'].append({'file': page['path'], 'link': f"/t/{target_id}"})
+                elif target and anchor and anchor not in target['anchors']:
+                    report['broken'].append({'file': page['path'], 'link': f"{target['path']}#{anchor}"})
+
+            report['unresolved'].extend({'file': page['path'], 'link': link} for link in page['unresolved'])
+            report['outside_navtable'].extend({'file': page['path'], 'link': link} for link in page['outside'])
+            external.update(page['external'])
+
+        report['orphans'] = sorted(page['path'] for topic_id, page in self.pages.items()
+                                   if topic_id not in linked and topic_id != home_topic_id)
+        report['external'] = len(external)
+        return report
+
+    def save(self, report: dict) -> None:
+        """
+        Writes the graph to `.doh-links.json`, and the report to `.doh-link-report.json`.
+        """
+        atomic_write_lines(self.docs_directory / LINKS_FILENAME,
+                           [json.dumps({'pages': self.pages}, separators=(',', ':'), sort_keys=True)])
+        atomic_write_lines(self.docs_directory / LINK_REPORT_FILENAME, [json.dumps(report, indent=1)])
+
+        logging.debug(f"Saved link graph {self.docs_directory / LINKS_FILENAME}")
+
+def log_link_report(report: dict, path: Path) -> None:
+    """
+    Logs a summary of a link report, and each broken link.
+    """
+    logging.info(f"\nLinks: {len(report['broken'])} broken, {len(report['unresolved'])} unresolved, "
+                 f"{len(report['outside_navtable'])} outside the navigation table, {len(report['orphans'])} orphan pages, "
+                 f"{report['external']} external links. See {path}.")
+    for link in report['broken']:
+        logging.warning(f"  Broken link in {link['file']}: {link['link']}")
@@ -0,0 +1,171 @@
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+from .files import atomic_write_lines
+
+MANIFEST_FILENAME = '.doh-manifest.json'
+MANIFEST_VERSION = 1
+CHANGES_FILENAME = '.doh-changes.json'
+
+def digest_text(text: str) -> str:
+    """
+    Returns the SHA-256 hex digest of a string.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def digest_file(path: Path) -> str:
+    """
+    Returns the SHA-256 hex digest of the contents of a file.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class SyncManifest:
+    """
+    Record of the topics processed by the previous run in a docs directory.
+
+    The manifest is stored as JSON in `<docs_directory>/.doh-manifest.json`. For each topic ID, it keeps the digest
+    of the raw markdown and the path of the converted file, relative to the docs directory, as well as the
+    validators of the response (`ETag`/`Last-Modified`), if the server sent any. The validators are sent with the
+    next request for the topic, so that an unchanged topic is not downloaded again.
+    It also keeps a digest of the layout (file paths and conversion settings). If the layout changes, every topic
+    is treated as changed, since links and toctrees in otherwise unchanged files may need to be rewritten.
+    Finally, it keeps the digest of each output file and the entries of each toctree, which are compared
+    with the next run to list the changed files (see `SphinxHandler.write_change_manifest()`).
+
+    Parameters
+    ----------
+    docs_directory : str or Path
+        Docs directory that contains the manifest.
+
+    Attributes
+    ----------
+    path : Path
+        Path of the manifest file.
+    layout : str
+        Layout digest recorded by the previous run.
+    topics : dict
+        Topic IDs mapped to `{'digest': ..., 'path': ..., 'validators': ...}` entries from the previous run.
+    outputs : dict
+        Output files, relative to the docs directory, mapped to the digest of their contents.
+    toctrees : dict
+        Index files mapped to the list of files in their toctree.
+    output_times : dict
+        Output files of the previous run mapped to their `(atime_ns, mtime_ns)` when the manifest was read,
+        before this run rewrites them.
+    """
+
+    def __init__(self, docs_directory) -> None:
+        self.docs_directory = Path(docs_directory)
+        self.path = self.docs_directory / MANIFEST_FILENAME
+        self.layout = ''
+        self.topics = {}
+        self.outputs = {}
+        self.toctrees = {}
+        self.output_times = {}
+        self._layout_matches = False
+
+        if not self.path.exists():
+            return
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            logging.warning(f"WARNING: Could not read {self.path}. All topics will be processed.")
+            return
+
+        if data.get('version') != MANIFEST_VERSION:
+            return
+        self.layout = data.get('layout', '')
+        self.topics = data.get('topics', {})
+        self.outputs = data.get('outputs', {})
+        self.toctrees = data.get('toctrees', {})
+
+        for path in self.outputs:
+            try:
+                info = os.stat(self.docs_directory / path)
+            except OSError:
+                continue
+            self.output_times[path] = (info.st_atime_ns, info.st_mtime_ns)
+
+    def check_layout(self, layout: str) -> bool:
+        """
+        Compares the current layout digest with the one from the previous run.
+
+        Returns
+        -------
+        bool
+            True if the layout is unchanged.
+        """
+        self._layout_matches = bool(self.layout) and layout == self.layout
+        self.layout = layout
+        if self.topics and not self._layout_matches:
+            logging.info("\nLayout changed since the last run. All topics will be processed.")
+
+        return self._layout_matches
+
+    def is_unchanged(self, topic_id: str, digest: str) -> bool:
+        """
+        Checks whether a topic can be skipped.
+
+        A topic is unchanged if the layout matches, its raw markdown has the same digest as in the previous run,
+        and the converted file still exists.
+        """
+        if not self._layout_matches:
+            return False
+
+        entry = self.topics.get(topic_id)
+        if not entry or entry.get('digest') != digest:
+            return False
+
+        return (self.docs_directory / entry['path']).exists()
+
+    def validators(self, topic_id: str) -> dict:
+        """
+        Returns the conditional request headers recorded for a topic, if a `304 Not Modified` answer
+        means that the topic can be skipped: the layout matches and the converted file still exists.
+
+        Returns
+        -------
+        dict
+            `If-None-Match` and/or `If-Modified-Since` headers, or an empty dict.
+        """
+        entry = self.topics.get(topic_id)
+        if not self._layout_matches or not entry or not entry.get('validators'):
+            return {}
+
+        if not (self.docs_directory / entry['path']).exists():
+            return {}
+        return dict(entry['validators'])
+
+    def save(self, items: list) -> None:
+        """
+        Writes the manifest for the given items.
+
+        Parameters
+        ----------
+        items : list
+            `DiscourseItem` objects with their final file paths.
+        """
+        topics = {}
+        for item in items:
+            if item.isTopic and item.topic_id and item.raw_digest:
+                path = Path(item.filepath).with_suffix('.md').relative_to(self.docs_directory)
+                topics[item.topic_id] = {'digest': item.raw_digest, 'path': str(path)}
+                if item.validators:
+                    topics[item.topic_id]['validators'] = item.validators
+
+        self.topics = topics
+        self.docs_directory.mkdir(parents=True, exist_ok=True)
+        # replaced rather than rewritten, since it may be hardlinked from a staged copy (see `StagedDirectory`)
+        data = {'version': MANIFEST_VERSION, 'layout': self.layout, 'topics': topics,
+                'outputs': self.outputs, 'toctrees': self.toctrees}
+        atomic_write_lines(self.path, [json.dumps(data, indent=1, sort_keys=True)])
+
+        logging.debug(f"Saved manifest {self.path}")
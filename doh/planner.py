@@ -0,0 +1,183 @@
+from pathlib import Path
+import json
+import logging
+import os
+from .discourse_handler import DiscourseHandler, DiscourseItem
+from .files import atomic_write_lines, io_counters
+
+class OutputPlan:
+    """
+    Final layout of a documentation set, computed from the navigation table before any file is touched.
+
+    Created by `plan_output()` once `calculate_item_type()` and `calculate_filepaths()` have run.
+    `apply()` then performs all the disk operations in one ordered batch: renames first, then new index files,
+    and only then updates the items of the handler, so that `_items` is never modified while it is iterated over.
+
+    Attributes
+    ----------
+    docs_directory : Path
+    renames : list
+        `(item, source, target)` for each topic that becomes an index page. `target` is the final file path
+        of the item, and the source and target files are `.md` files.
+    index_files : list
+        `(folder, path, text)` for each folder without a landing page, where `path` is the index file to create.
+    link_targets : dict
+        Topic IDs mapped to the absolute path of their final file, without suffix, e.g. {'123': '/how-to/some-guide'}.
+    files : list
+        One dictionary per output file, in navigation table order, with the 'path', 'topic_id', 'title' and 'url' keys.
+    conflicts : list
+        Output paths claimed by more than one item.
+    """
+
+    def __init__(self, docs_directory) -> None:
+        self.docs_directory = Path(docs_directory)
+        self.renames = []
+        self.index_files = []
+        self.link_targets = {}
+        self.files = []
+        self.conflicts = []
+
+    def __relative(self, path: Path) -> str:
+        return str(Path(path).relative_to(self.docs_directory))
+
+    def apply(self, discourse_docs: DiscourseHandler) -> None:
+        """
+        Performs the renames and creates the index files of the plan, then updates the items of `discourse_docs`.
+
+        Topics marked as unchanged by an incremental download are not renamed, since their file is already
+        at its final path. If a landing page failed to download and has no previous version, a placeholder index
+        is written instead, so that the toctree of the parent folder doesn't point at a missing page.
+        """
+        for conflict in self.conflicts:
+            logging.warning(f"WARNING: Several navigation items are saved as {conflict}. Only the last one is kept.")
+
+        for item, source, target in self.renames:
+            if item.isChanged:
+                os.rename(source.with_suffix('.md'), target.with_suffix('.md'))
+                io_counters.add(files_touched=1)
+                logging.debug(f"Renamed {source} to {target}")
+            elif not target.with_suffix('.md').exists():
+                # the landing page failed to download and has no previous version: the folder still needs an index
+                title = item.title if item.isHomeTopic else target.parent.name
+                atomic_write_lines(target.with_suffix('.md'), [index_placeholder(title, discourse_docs.config['generate_h1'])])
+                item.isChanged = True # converted like a new index file, so that it gets a toctree
+                logging.warning(f"WARNING: Created a placeholder for the missing landing page {target.with_suffix('.md')}.")
+
+        for folder, path, text in self.index_files:
+            atomic_write_lines(path, [text])
+            logging.debug(f"Created {path}.")
+
+        for item, source, target in self.renames:
+            discourse_docs.update_item_filepath(item, target)
+
+        for folder, path, text in self.index_files:
+            new_item_row = {'Level': '1', 'Path': 'index', 'Navlink': '[Index]()'}
+            new_item = DiscourseItem(new_item_row, discourse_docs.config)
+            new_item.update_filepath(path)
+            discourse_docs.add_item(new_item)
+
+    def to_dict(self) -> dict:
+        """
+        Returns the plan as a JSON-serializable dictionary, with paths relative to the docs directory.
+        """
+        return {
+            'docs_directory': str(self.docs_directory),
+            'files': self.files,
+            'renames': [{'source': self.__relative(source.with_suffix('.md')), 'target': self.__relative(target.with_suffix('.md'))}
+                        for item, source, target in self.renames],
+            'index_files': [self.__relative(path) for folder, path, text in self.index_files],
+            'links': self.link_targets,
+            'conflicts': self.conflicts,
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=1)
+
+def index_placeholder(name: str, generate_h1: bool) -> str:
+    """
+    Returns the contents of an index file for a folder without a landing page, e.g. '# How-To' for 'how-to'.
+    With `generate_h1`, the heading is left to `replace_discourse_metadata()`.
+    """
+    return "\n" if generate_h1 else f"\n# {name.title()}\n"
+
+def plan_output(discourse_docs: DiscourseHandler) -> OutputPlan:
+    """
+    Computes the final layout of a documentation set without any disk or network access.
+
+    Equivalent to what `SphinxHandler.update_index_pages()` does on disk:
+
+    - The home page is renamed to `index.md`.
+    - Each folder with a landing page has it renamed to `index.md`.
+    - Each folder without a landing page gets a new `index.md` file.
+
+    Must run after `calculate_item_type()` and `calculate_filepaths()`.
+
+    Parameters
+    ----------
+    discourse_docs : DiscourseHandler
+
+    Returns
+    -------
+    OutputPlan
+    """
+    config = discourse_docs.config
+    plan = OutputPlan(config['docs_directory'])
+    final_paths = {}
+
+    for item in discourse_docs._items:
+        final_path = item.filepath
+        if item.isHomeTopic:
+            final_path = item.filepath.parent / 'index'
+            plan.renames.append((item, item.filepath, final_path))
+        if item.isFolder:
+            if item.isTopic:
+                final_path = item.filepath.parent / 'index.md'
+                plan.renames.append((item, item.filepath, final_path))
+            else:
+                index_file = item.filepath / 'index.md'
+                plan.index_files.append((item, index_file, index_placeholder(item.filepath.name, config['generate_h1'])))
+                final_path = index_file
+        final_paths[id(item)] = final_path
+
+        plan.files.append({'path': str(final_path.with_suffix('.md').relative_to(plan.docs_directory)),
+                           'topic_id': item.topic_id, 'title': item.title, 'url': item.url})
+
+    seen = set()
+    for entry in plan.files:
+        if entry['path'] in seen and entry['path'] not in plan.conflicts:
+            plan.conflicts.append(entry['path'])
+        seen.add(entry['path'])
+
+    for topic_id, item in discourse_docs._topic_index.items():
+        plan.link_targets[topic_id] = f"/{final_paths[id(item)].relative_to(plan.docs_directory).with_suffix('')}"
+
+    return plan
+
+def toctree_entries(paths: list) -> dict:
+    """
+    Maps each index file among `paths` to the files that belong in its toctree: the other files of its folder
+    and the index files of its subfolders, without suffix and in the order of `paths`.
+
+    Parameters
+    ----------
+    paths : list
+        Output files relative to the docs directory, e.g. the 'path' of each entry of `OutputPlan.files`.
+
+    Returns
+    -------
+    dict
+        E.g. {'index.md': ['tutorial/index', 'how-to/index'], 'tutorial/index.md': ['tutorial/set-up']}
+    """
+    entries = {path: [] for path in paths if Path(path).name == 'index.md'}
+    for path in paths:
+        path = Path(path)
+        if path.name == 'index.md':
+            if path.parent == Path('.'):
+                continue # the home page is the root of the toctree
+            index = path.parent.parent / 'index.md'
+        else:
+            index = path.parent / 'index.md'
+        if str(index) in entries and str(path.with_suffix('')) not in entries[str(index)]:
+            entries[str(index)].append(str(path.with_suffix('')))
+
+    return entries
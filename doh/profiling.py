@@ -0,0 +1,117 @@
+from contextlib import contextmanager
+import cProfile
+import json
+import logging
+import math
+import time
+from .files import io_counters
+
+def percentile(values: list, fraction: float) -> float:
+    """
+    Returns the nearest-rank percentile of a list of numbers, e.g. `percentile(latencies, 0.9)`, or 0 if it is empty.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+class StageProfiler:
+    """
+    Measures each step of a run: wall time, topic file I/O and HTTP latency.
+
+    Wrap each step in `with profiler.stage(name):`. The I/O counters are process-wide (see `files.IOCounters`),
+    so stages should not overlap. Latencies are taken from the statistics of `session`, if set.
+
+    Parameters
+    ----------
+    session : DiscourseSession, optional
+        Session whose request latencies are attributed to the stages, by default None.
+    cprofile : bool, optional
+        If True, each stage also runs under `cProfile`, and `dump_hottest_stage()` can save the statistics
+        of the slowest one, by default False. Only the main process is profiled. The measured times then include
+        the overhead of `cProfile`, which both reports point out.
+
+    Attributes
+    ----------
+    stages : list
+        One dictionary per completed stage, in order. See `stage()`.
+    """
+
+    def __init__(self, session=None, cprofile: bool = False) -> None:
+        self.session = session
+        self.cprofile = cprofile
+        self.stages = []
+        self._profiles = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Measures the enclosed block as a stage. Records 'name', 'seconds', 'bytes_read', 'bytes_written',
+        'files_touched', 'requests' and the 'latency_p50', 'latency_p90', 'latency_p99' and 'latency_max' of its
+        requests in seconds.
+        """
+        latencies = self.session.stats.latencies if self.session else []
+        first_request = len(latencies)
+        io_before = io_counters.snapshot()
+        profile = cProfile.Profile() if self.cprofile else None
+
+        start = time.perf_counter()
+        if profile:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+            elapsed = time.perf_counter() - start
+
+            io_after = io_counters.snapshot()
+            latencies = (self.session.stats.latencies if self.session else [])[first_request:]
+            result = {'name': name, 'seconds': elapsed}
+            result.update({field: io_after[field] - io_before[field] for field in io_after})
+            result['requests'] = len(latencies)
+            for label, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0)):
+                result[f"latency_{label}"] = percentile(latencies, fraction)
+
+            self.stages.append(result)
+            if profile:
+                self._profiles[len(self.stages) - 1] = profile
+
+    def log_report(self) -> None:
+        """
+        Logs the stages as a table.
+        """
+        if self.cprofile:
+            logging.info("\nTimes include the overhead of cProfile.")
+        total = sum(stage['seconds'] for stage in self.stages) or 1e-9
+        logging.info(f"\n{'Stage':<22} {'Time (s)':>9} {'%':>5} {'KiB read':>9} {'KiB written':>11} {'Files':>6} "
+                     f"{'Requests':>8} {'p50 (ms)':>9} {'p90 (ms)':>9} {'p99 (ms)':>9}")
+        for stage in self.stages:
+            logging.info(f"{stage['name']:<22} {stage['seconds']:>9.3f} {100 * stage['seconds'] / total:>5.1f} "
+                         f"{stage['bytes_read'] / 1024:>9.1f} {stage['bytes_written'] / 1024:>11.1f} "
+                         f"{stage['files_touched']:>6} {stage['requests']:>8} {stage['latency_p50'] * 1000:>9.1f} "
+                         f"{stage['latency_p90'] * 1000:>9.1f} {stage['latency_p99'] * 1000:>9.1f}")
+
+    def save_report(self, path: str) -> None:
+        """
+        Writes the stages as JSON: `{"total_seconds": ..., "cprofile": ..., "stages": [...]}`.
+        `cprofile` is True if the times include the overhead of `cProfile`.
+        """
+        report = {'total_seconds': sum(stage['seconds'] for stage in self.stages), 'cprofile': self.cprofile,
+                  'stages': self.stages}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1)
+
+        logging.info(f"\nSaved profile report to {path}.")
+
+    def dump_hottest_stage(self, path: str) -> None:
+        """
+        Saves the `cProfile` statistics of the slowest stage, in the `pstats` format. Requires `cprofile=True`.
+        """
+        if not self._profiles:
+            return
+        index = max(self._profiles, key=lambda i: self.stages[i]['seconds'])
+        self._profiles[index].dump_stats(path)
+
+        logging.info(f"Saved cProfile statistics of the slowest stage ({self.stages[index]['name']}) to {path}. "
+                     f"View them with 'python -m pstats {path}'.")
@@ -0,0 +1,287 @@
+from .sphinx_handler import *
+from .profiling import StageProfiler
+from .files import StagedDirectory
+from contextlib import contextmanager
+import threading
+import yaml
+
+def download_docset(config: dict, navtable: str = '', session: DiscourseSession = None,
+                    profiler: StageProfiler = None) -> DiscourseHandler:
+    """
+    Step 1: Downloads and processes a Discourse documentation set.
+
+    Parameters
+    ----------
+    config : dict
+        Settings of the documentation set.
+    navtable : str, optional
+        Custom navigation table, by default ''. If empty, the navigation table is fetched from the home topic.
+    session : DiscourseSession, optional
+        Session to use, e.g. one shared with other documentation sets of the same instance.
+    profiler : StageProfiler, optional
+        Profiler that measures each step, by default None. Its session is set to the session of the handler.
+
+    Returns
+    -------
+    DiscourseHandler
+    """
+    session = session or create_session(config)
+    profiler = profiler or StageProfiler()
+    profiler.session = session
+
+    with profiler.stage('navtable'):
+        discourse_docs = DiscourseHandler(config, navtable, session=session)
+
+    with profiler.stage('calculate_item_type'):
+        discourse_docs.calculate_item_type() # determine if item is a folder, page, or both
+    with profiler.stage('calculate_filepaths'):
+        discourse_docs.calculate_filepaths() # calculate local file paths
+    with profiler.stage('download'):
+        discourse_docs.download() # download raw markdown files from Discourse
+
+    return discourse_docs
+
+def plan_docset(config: dict, navtable: str = '') -> OutputPlan:
+    """
+    Computes the output layout of a documentation set, without downloading topics or writing files.
+
+    Only the home topic is requested, to read the navigation table, unless a custom navigation table is given.
+
+    Parameters
+    ----------
+    config : dict
+        Settings of the documentation set.
+    navtable : str, optional
+        Custom navigation table, by default ''. If empty, the navigation table is fetched from the home topic.
+
+    Returns
+    -------
+    OutputPlan
+    """
+    discourse_docs = DiscourseHandler(config, navtable)
+    discourse_docs.calculate_item_type()
+    discourse_docs.calculate_filepaths()
+
+    return plan_output(discourse_docs)
+
+def convert_docset(discourse_docs: DiscourseHandler, profiler: StageProfiler = None) -> SphinxHandler:
+    """
+    Step 2: Converts local discourse docs to a Sphinx/RTD-compatible format (markdown only).
+
+    Parameters
+    ----------
+    discourse_docs : DiscourseHandler
+        A documentation set downloaded with `download_docset()`.
+    profiler : StageProfiler, optional
+        Profiler that measures each step, by default None.
+
+    Returns
+    -------
+    SphinxHandler
+    """
+    profiler = profiler or StageProfiler()
+    sphinx_docs = SphinxHandler(discourse_docs, discourse_docs.config)
+
+    with profiler.stage('plan_output'):
+        plan = plan_output(discourse_docs) # final paths, renames, new index files and link targets
+    with profiler.stage('update_index_pages'):
+        sphinx_docs.update_index_pages(plan) # create or rename landing pages as index files
+
+    # Single pass over each file. Equivalent to running these steps in sequence:
+    # - replace_href_anchors(): replace headings with <a href=...
+    # - update_links(): replace discourse links with local file paths
+    # - replace_discourse_metadata(truncate_comments=True): remove timestamp and comments, adds h1 headings.
+    # - replace_discourse_notes(): replace [note] admonitions
+    # - generate_tocs(): generate toctree for each index file
+    with profiler.stage('convert'):
+        sphinx_docs.convert(sphinx_docs.pipeline_stages(truncate_comments=True))
+
+    with profiler.stage('write_link_graph'):
+        sphinx_docs.write_link_graph() # orphan pages, broken and unresolved links
+
+    with profiler.stage('write_change_manifest'):
+        sphinx_docs.write_change_manifest() # files added, modified and removed since the last run
+
+    with profiler.stage('save_manifest'):
+        discourse_docs.save_manifest() # record processed topics for the next --incremental run
+
+    return sphinx_docs
+
+@contextmanager
+def staged_output(config: dict):
+    """
+    If `config['staged']` is set, points `config['docs_directory']` at a scratch copy for the enclosed steps,
+    and swaps the copy into place if they succeed (see `StagedDirectory`). If they fail, the docs directory
+    is left as it was. Meanwhile, `config['output_directory']` keeps the docs directory, so that reports point
+    to the final files (see `SphinxHandler.output_path()`). Otherwise, does nothing.
+
+    Example
+    -------
+        with staged_output(config):
+            convert_docset(download_docset(config))
+    """
+    if not config.get('staged'):
+        yield
+        return
+
+    docs_directory = config['docs_directory']
+    staging = StagedDirectory(docs_directory)
+    config['docs_directory'] = str(staging.create())
+    config['output_directory'] = docs_directory
+    try:
+        yield
+    except BaseException:
+        staging.discard()
+        raise
+    finally:
+        config['docs_directory'] = docs_directory
+        del config['output_directory']
+
+    staging.commit()
+
+def read_navtable(path: str) -> str:
+    """
+    Returns the contents of a custom navigation table file.
+    """
+    with open(path, 'r') as f:
+        return f.read()
+
+def load_batch_file(path: str, defaults: dict) -> dict:
+    """
+    Reads the documentation sets of a batch file.
+
+    The batch file uses the format of `config.yaml`: each documentation set is a mapping under its name,
+    with at least `instance` and `home_topic_id`. Any other setting (`generate_h1`, `docs_directory`, `navtable`,
+    `backend`...) overrides the command line defaults for that set. By default, each set is saved in
+    `<docs_directory>/<name>/`.
+
+    Parameters
+    ----------
+    path : str
+        Path of the YAML batch file.
+    defaults : dict
+        Settings from the command line.
+
+    Returns
+    -------
+    dict
+        Names of the documentation sets mapped to their settings.
+    """
+    try:
+        with open(path, 'r') as f:
+            docsets = yaml.safe_load(f)
+    except (OSError, yaml.YAMLError) as e:
+        sys.exit(f"ERROR: Could not read batch file {path}: {e}")
+
+    if not isinstance(docsets, dict) or not docsets:
+        sys.exit(f"ERROR: Batch file {path} must map documentation set names to their settings.")
+
+    configs = {}
+    for name, settings in docsets.items():
+        if not isinstance(settings, dict) or 'instance' not in settings or 'home_topic_id' not in settings:
+            sys.exit(f"ERROR: Documentation set '{name}' in {path} must set 'instance' and 'home_topic_id'.")
+
+        config = dict(defaults)
+        config['docs_directory'] = os.path.join(defaults['docs_directory'], str(name))
+        config.update(settings)
+        config['instance'] = normalize_instance(str(config['instance']))
+        config['home_topic_id'] = str(config['home_topic_id'])
+        if not config['home_topic_id'].isdigit():
+            sys.exit(f"ERROR: 'home_topic_id' of documentation set '{name}' must be a number. E.g. '1234'.")
+        configs[str(name)] = config
+
+    return configs
+
+def normalize_instance(instance: str) -> str:
+    """
+    Removes the scheme and 'www.' prefix from a Discourse instance. E.g. 'https://www.example.com' -> 'example.com'.
+    """
+    if '://' in instance:
+        instance = instance.split('://')[1]
+    if 'www.' in instance:
+        instance = instance.split('www.')[1]
+    return instance
+
+def run_batch(configs: dict, jobs: int) -> bool:
+    """
+    Mirrors several documentation sets in one process.
+
+    Documentation sets of the same instance share one `DiscourseSession`, and so its connection pool,
+    rate limiter and statistics. The number of requests in flight across all instances is bounded by `jobs`.
+    Documentation sets are downloaded concurrently, then converted one after the other, each with up to `jobs`
+    processes. A documentation set that fails is reported and does not stop the others. With `staged` set,
+    each documentation set is swapped into place once converted, and a failed one keeps its previous output.
+
+    Parameters
+    ----------
+    configs : dict
+        Names of the documentation sets mapped to their settings, as returned by `load_batch_file()`.
+    jobs : int
+        Maximum number of requests in flight across all documentation sets.
+
+    Returns
+    -------
+    bool
+        True if all documentation sets succeeded.
+    """
+    global_limit = threading.BoundedSemaphore(jobs)
+    sessions = {}
+    for config in configs.values():
+        if config['instance'] not in sessions:
+            sessions[config['instance']] = create_session(config, global_limit)
+
+    results = {name: {'status': 'ok', 'handler': None, 'unresolved': 0, 'seconds': 0.0, 'staging': None}
+               for name in configs}
+
+    def download(name: str) -> None:
+        config = configs[name]
+        start = time.perf_counter()
+        try:
+            navtable = read_navtable(config['navtable']) if config.get('navtable') else ''
+            if config.get('staged'):
+                results[name]['staging'] = StagedDirectory(config['docs_directory'])
+                config['output_directory'] = config['docs_directory']
+                config['docs_directory'] = str(results[name]['staging'].create())
+            results[name]['handler'] = download_docset(config, navtable, sessions[config['instance']])
+        except (SystemExit, Exception) as e:
+            logging.error(f"ERROR: Documentation set '{name}' failed: {e}")
+            results[name]['status'] = 'failed'
+        results[name]['seconds'] += time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=min(jobs, len(configs))) as executor:
+        list(executor.map(download, configs))
+
+    for name, result in results.items():
+        start = time.perf_counter()
+        try:
+            if result['status'] == 'ok':
+                result['unresolved'] = len(convert_docset(result['handler']).unresolved_links)
+            if result['staging']:
+                configs[name]['docs_directory'] = configs[name].pop('output_directory')
+                if result['status'] == 'ok':
+                    result['staging'].commit()
+        except (SystemExit, Exception) as e:
+            logging.error(f"ERROR: Documentation set '{name}' failed: {e}")
+            result['status'] = 'failed'
+        if result['staging'] and result['status'] != 'ok':
+            result['staging'].discard()
+        result['seconds'] += time.perf_counter() - start
+
+    log_batch_summary(results, sessions)
+
+    return all(result['status'] == 'ok' for result in results.values())
+
+def log_batch_summary(results: dict, sessions: dict) -> None:
+    """
+    Logs a table with one row per documentation set, followed by the request statistics of each instance.
+    """
+    logging.info(f"\n{'Documentation set':<24} {'Topics':>7} {'Unchanged':>9} {'KiB':>10} {'Time (s)':>9} {'Unresolved':>10}  Status")
+    for name, result in results.items():
+        statistics = result['handler'].download_statistics if result['handler'] else {}
+        logging.info(f"{name:<24} {statistics.get('topics', 0):>7} {statistics.get('unchanged', 0):>9} "
+                     f"{statistics.get('bytes', 0) / 1024:>10.1f} {result['seconds']:>9.2f} "
+                     f"{result['unresolved']:>10}  {result['status']}")
+
+    logging.info("")
+    for instance, session in sessions.items():
+        logging.info(f"{instance}: {session.stats.summary()}")
@@ -0,0 +1,352 @@
+from email.utils import parsedate_to_datetime
+import logging
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from .cache import ResponseCache, DEFAULT_CACHE_SIZE
+from .snapshot import Snapshot, RecordingAdapter, ReplayAdapter, open_snapshot
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_MAX_RETRIES = 5
+
+# Exponential backoff: the n-th retry waits a random time between 0 and min(BACKOFF_MAX, BACKOFF_BASE * 2**n) seconds
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Responses that are worth retrying
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+def parse_retry_after(response: requests.Response) -> float:
+    """
+    Returns the number of seconds to wait before retrying, as requested by the server, or None.
+
+    Reads the `Retry-After` header (in seconds or as an HTTP date), then the `wait_seconds` field
+    that Discourse adds to the body of rate-limited responses.
+    """
+    value = response.headers.get('Retry-After')
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+
+    try:
+        return float(response.json()['extras']['wait_seconds'])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+class RequestStatistics:
+    """
+    Counters for the requests sent by a session during a run.
+
+    Attributes
+    ----------
+    requests : int
+        Number of requests sent, including retries.
+    retries : int
+    throttled : int
+        Number of rate-limited (429) responses.
+    throttled_time : float
+        Total time in seconds that requests waited because of rate limits and backoff.
+    bytes : int
+        Total size of the response bodies.
+    errors : int
+        Number of requests that still failed after all retries.
+    latencies : list
+        Duration in seconds of each request, in the order they completed, without the time spent waiting for a slot.
+    """
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.throttled_time = 0.0
+        self.bytes = 0
+        self.errors = 0
+        self.latencies = []
+        self._lock = threading.Lock()
+
+    def add(self, **counters) -> None:
+        """
+        Adds to one or more counters, e.g. `add(requests=1, bytes=1024)`. Thread-safe.
+        """
+        with self._lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def add_latency(self, seconds: float) -> None:
+        """
+        Records the duration of a request. Thread-safe.
+        """
+        with self._lock:
+            self.latencies.append(seconds)
+
+    def summary(self) -> str:
+        return (f"{self.requests} requests, {self.bytes / 1024:.1f} KiB received, {self.retries} retries, "
+                f"{self.throttled} rate-limited responses, {self.throttled_time:.1f}s throttled, {self.errors} failed")
+
+class RequestScheduler:
+    """
+    Limits the number of requests in flight and adapts it to the rate limits of the server.
+
+    The concurrency limit starts at `max_concurrency`. It is halved on each rate-limited response and grows back
+    by one request per window of successful requests (additive increase, multiplicative decrease).
+    When the server asks to wait (`Retry-After`, or a rate-limit header with no remaining requests),
+    all requests are paused until that time, not just the one that was rejected.
+
+    Parameters
+    ----------
+    max_concurrency : int
+        Maximum number of requests in flight.
+    """
+
+    def __init__(self, max_concurrency: int) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(self.max_concurrency)
+        self._active = 0
+        self._resume_at = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> float:
+        """
+        Waits for a free slot.
+
+        Returns
+        -------
+        float
+            Time in seconds spent waiting for a pause requested by the server.
+            Waits that end early (e.g. when another request frees its slot) only count for the time actually waited.
+        """
+        throttled_time = 0.0
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                pause = self._resume_at - now
+                if pause > 0:
+                    self._condition.wait(pause)
+                    throttled_time += time.monotonic() - now
+                elif self._active < int(self.limit):
+                    self._active += 1
+                    return throttled_time
+                else:
+                    self._condition.wait()
+
+    def release(self, response: requests.Response = None) -> None:
+        """
+        Frees a slot and adapts the limit to the response (None if the request failed without a response).
+        """
+        with self._condition:
+            self._active -= 1
+            if response is not None and response.status_code == 429:
+                self.limit = max(1.0, self.limit / 2)
+                self.pause(parse_retry_after(response) or 0.0)
+                logging.debug(f"Rate limited. Reduced concurrency to {int(self.limit)}.")
+            elif response is not None and response.ok:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+                self.__observe_rate_limit_headers(response)
+            self._condition.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """
+        Pauses all requests for the given number of seconds.
+        """
+        with self._condition:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+            self._condition.notify_all()
+
+    def __observe_rate_limit_headers(self, response: requests.Response) -> None:
+        """
+        Pauses until the rate-limit window resets if the server reports that no requests remain.
+        Supports the `RateLimit-*` and `X-RateLimit-*` headers.
+        """
+        headers = response.headers
+        remaining = headers.get('RateLimit-Remaining', headers.get('X-RateLimit-Remaining'))
+        reset = headers.get('RateLimit-Reset', headers.get('X-RateLimit-Reset'))
+        try:
+            if remaining is None or reset is None or int(remaining) > 0:
+                return
+            reset = float(reset)
+        except ValueError:
+            return
+
+        # some servers send the reset time as a Unix timestamp instead of a delay
+        if reset > 1e9:
+            reset -= time.time()
+        self.pause(max(0.0, reset))
+
+class DiscourseSession(requests.Session):
+    """
+    HTTP session shared by all requests made to one Discourse instance.
+
+    Connections are pooled and kept alive between requests, so only the first request to a host
+    pays for the TCP and TLS handshakes.
+
+    Requests go through a `RequestScheduler`, which adapts the number of concurrent requests to the rate limits
+    of the server. Rate-limited responses (429), server errors and connection errors are retried up to
+    `max_retries` times, after the delay requested by the server or with jittered exponential backoff.
+    The slot of a streamed request (`stream=True`) is held until its response is closed, so that the limit
+    also bounds the bodies being transferred: close streamed responses, e.g. with `with response:`.
+
+    Parameters
+    ----------
+    pool_size : int, optional
+        Maximum number of connections kept open per host, by default 10.
+        Should be at least the number of download jobs, otherwise extra connections are discarded after use.
+    timeout : float, optional
+        Timeout in seconds for connecting and for waiting on the server, by default 30.
+    cache : ResponseCache, optional
+        On-disk cache used for conditional requests, by default None.
+    max_retries : int, optional
+        Maximum number of retries per request, by default 5.
+    global_limit : threading.Semaphore, optional
+        Semaphore shared with other sessions to bound the total number of requests in flight, by default None.
+    snapshot : Snapshot, optional
+        Archive in which every response is recorded, by default None.
+    replay : bool, optional
+        If True, responses are read from `snapshot` instead of the network, by default False.
+
+    Attributes
+    ----------
+    pool_size : int
+    timeout : float
+    cache : ResponseCache
+    max_retries : int
+    scheduler : RequestScheduler
+    stats : RequestStatistics
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, timeout: float = DEFAULT_TIMEOUT,
+                 cache: ResponseCache = None, max_retries: int = DEFAULT_MAX_RETRIES,
+                 global_limit: threading.Semaphore = None, snapshot: Snapshot = None, replay: bool = False) -> None:
+        super().__init__()
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.cache = cache
+        self.max_retries = max_retries
+        self.scheduler = RequestScheduler(pool_size)
+        self.stats = RequestStatistics()
+        self.global_limit = global_limit
+
+        if snapshot is not None and replay:
+            adapter = ReplayAdapter(snapshot)
+        elif snapshot is not None:
+            adapter = RecordingAdapter(snapshot, pool_connections=pool_size, pool_maxsize=pool_size)
+        else:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        """
+        Sends a request, applying the session timeout unless one is given explicitly, and retrying
+        rate-limited responses, server errors and connection errors.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+
+        attempt = 0
+        while True:
+            self.stats.add(throttled_time=self.scheduler.acquire(), requests=1)
+            response = None
+            if self.global_limit:
+                self.global_limit.acquire()
+            start = time.perf_counter()
+            try:
+                response = super().request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= self.max_retries:
+                    self.stats.add(errors=1)
+                    raise
+                logging.debug(f"{url} failed ({e}). Retrying...")
+            finally:
+                self.stats.add_latency(time.perf_counter() - start)
+                if self.global_limit:
+                    self.global_limit.release()
+                if response is None or not kwargs.get('stream'):
+                    self.scheduler.release(response)
+
+            if response is not None:
+                if not kwargs.get('stream'):
+                    self.stats.add(bytes=len(response.content))
+                elif response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    self.__release_on_close(response)
+                else:
+                    response.content # read the (small) error body, which releases the connection
+                    self.scheduler.release(response)
+
+                if response.status_code not in RETRY_STATUS_CODES:
+                    return response
+                if response.status_code == 429:
+                    self.stats.add(throttled=1)
+                if attempt >= self.max_retries:
+                    self.stats.add(errors=1)
+                    return response
+                logging.debug(f"{url} returned {response.status_code}. Retrying...")
+
+            delay = parse_retry_after(response) if response is not None else None
+            if delay is None:
+                delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+            time.sleep(delay)
+            self.stats.add(retries=1, throttled_time=delay)
+            attempt += 1
+
+    def __release_on_close(self, response: requests.Response) -> None:
+        """
+        Makes `response.close()` free the scheduler slot of a streamed response, once.
+        """
+        close = response.close
+        once = threading.Lock()
+
+        def close_and_release() -> None:
+            try:
+                close()
+            finally:
+                if once.acquire(blocking=False):
+                    self.scheduler.release(response)
+
+        response.close = close_and_release
+
+def create_session(configuration: dict, global_limit: threading.Semaphore = None) -> DiscourseSession:
+    """
+    Creates a session from the `pool_size`, `timeout`, `jobs`, `cache_directory`, `cache_size`, `max_retries`,
+    `record` and `replay` settings of a configuration.
+
+    `record` and `replay` are paths of snapshot files. Both disable the response cache, so that the snapshot
+    holds complete responses rather than `304 Not Modified`. For the same reason, `DiscourseHandler` sends no
+    conditional requests while recording, even in incremental mode.
+
+    Parameters
+    ----------
+    configuration : dict
+        A dictionary containing settings from `config.yaml` or the command line.
+    global_limit : threading.Semaphore, optional
+        Semaphore shared by several sessions to bound their total number of requests in flight, by default None.
+
+    Returns
+    -------
+    DiscourseSession
+        A new session. The pool is never smaller than the number of download jobs.
+    """
+    jobs = int(configuration.get('jobs', 1))
+    pool_size = int(configuration.get('pool_size') or max(DEFAULT_POOL_SIZE, jobs))
+    timeout = float(configuration.get('timeout') or DEFAULT_TIMEOUT)
+    max_retries = configuration.get('max_retries')
+    if max_retries is None:
+        max_retries = DEFAULT_MAX_RETRIES
+
+    snapshot_path = configuration.get('replay') or configuration.get('record')
+    snapshot = open_snapshot(snapshot_path) if snapshot_path else None
+
+    cache = None
+    if configuration.get('cache_directory') and snapshot is None:
+        cache_size = int(configuration.get('cache_size') or DEFAULT_CACHE_SIZE)
+        cache = ResponseCache(configuration['cache_directory'], max_size=cache_size)
+
+    return DiscourseSession(pool_size=max(pool_size, jobs), timeout=timeout, cache=cache, max_retries=int(max_retries),
+                            global_limit=global_limit, snapshot=snapshot, replay=bool(configuration.get('replay')))
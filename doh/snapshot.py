@@ -0,0 +1,136 @@
+from pathlib import Path
+import json
+import logging
+import sqlite3
+import threading
+import zlib
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# Open snapshots, by resolved path, so that all sessions of a process share one connection
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+def open_snapshot(path) -> 'Snapshot':
+    """
+    Returns the `Snapshot` for a file, shared by all sessions in the process.
+
+    Parameters
+    ----------
+    path : str or Path
+        SQLite file of the snapshot. Created if it doesn't exist.
+    """
+    key = Path(path).resolve()
+    with _snapshots_lock:
+        if key not in _snapshots:
+            _snapshots[key] = Snapshot(key)
+        return _snapshots[key]
+
+class Snapshot:
+    """
+    Archive of HTTP responses in a single SQLite file, keyed by URL.
+
+    Each response is stored with its status code, reason, headers and zlib-compressed body.
+    A snapshot recorded with `RecordingAdapter` can be replayed with `ReplayAdapter`, so that a run
+    uses no network at all.
+
+    Parameters
+    ----------
+    path : str or Path
+        SQLite file of the snapshot. Created if it doesn't exist.
+
+    Attributes
+    ----------
+    path : Path
+    """
+
+    def __init__(self, path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS responses ("
+                                 "url TEXT PRIMARY KEY, status INTEGER, reason TEXT, headers TEXT, body BLOB)")
+
+    def record(self, url: str, response: requests.Response) -> None:
+        """
+        Stores a response, replacing any previous response for the same URL.
+        """
+        headers = json.dumps(dict(response.headers))
+        body = zlib.compress(response.content)
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                                     (url, response.status_code, response.reason, headers, body))
+
+    def lookup(self, url: str) -> tuple:
+        """
+        Returns the recorded response for a URL.
+
+        Returns
+        -------
+        tuple
+            `(status, reason, headers, body)`, or None if the URL was not recorded.
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT status, reason, headers, body FROM responses WHERE url = ?",
+                                           (url,)).fetchone()
+        if row is None:
+            return None
+
+        status, reason, headers, body = row
+        return status, reason, json.loads(headers), zlib.decompress(body)
+
+class RecordingAdapter(HTTPAdapter):
+    """
+    Transport adapter that sends requests over the network and records every response in a `Snapshot`.
+
+    `304 Not Modified` responses are not recorded: they have no body, and would replace the complete response
+    of an earlier request for the same URL, since a snapshot is keyed by URL only.
+    """
+
+    def __init__(self, snapshot: Snapshot, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.snapshot = snapshot
+
+    def send(self, request, **kwargs):
+        url = request.url
+        response = super().send(request, **kwargs)
+        if response.status_code != 304:
+            # reads the whole body, even for streamed requests, which then iterate over it in memory
+            self.snapshot.record(url, response)
+        return response
+
+class ReplayAdapter(BaseAdapter):
+    """
+    Transport adapter that answers requests from a `Snapshot` without any network access.
+
+    URLs that are not in the snapshot get a `404` response.
+    """
+
+    def __init__(self, snapshot: Snapshot) -> None:
+        super().__init__()
+        self.snapshot = snapshot
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+
+        recorded = self.snapshot.lookup(request.url)
+        if recorded is None:
+            logging.warning(f"WARNING: {request.url} is not in the snapshot {self.snapshot.path}.")
+            response.status_code, response.reason, response._content = 404, 'Not in snapshot', b''
+        else:
+            response.status_code, response.reason, headers, response._content = recorded
+            response.headers = CaseInsensitiveDict(headers)
+
+        response._content_consumed = True
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers) or 'utf-8'
+        return response
+
+    def close(self) -> None:
+        pass
@@ -1,11 +1,274 @@
 from .discourse_handler import *
+from .files import atomic_write_lines, io_counters
+from .manifest import CHANGES_FILENAME, digest_file
+from .links import LinkGraph, DISCOURSE_LINK_PATTERN, LINK_REPORT_FILENAME, new_link_record, record_headings, record_links, log_link_report
+from .planner import OutputPlan, plan_output, toctree_entries
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import chain
+from typing import Iterable, Iterator
 import os
 
+class DiscourseTagRewriter:
+    """
+    Replaces Discourse tags in square brackets (e.g. `[note]`, `[/note]`) in a single regex scan.
+
+    All tags are matched by one precompiled alternation, and each match is passed to the handler of its tag.
+    Support for a new tag (e.g. `[tab]`, `[details]`) only needs a new handler, not a new pass over the text.
+
+    Parameters
+    ----------
+    handlers : dict
+        Tag names mapped to functions `handler(closing, attributes)`, where `closing` is True for closing tags
+        (`[/note]`) and `attributes` is the raw text between the tag name and `]` (e.g. ` type="caution"`).
+        A handler returns the replacement text, or None to leave the tag unchanged.
+    """
+
+    def __init__(self, handlers: dict) -> None:
+        self.handlers = handlers
+
+        # longest names first, so that e.g. 'tabs' is not matched as 'tab' + attributes 's'
+        names = sorted(handlers, key=len, reverse=True)
+        self.pattern = re.compile(r"\[(/?)(" + "|".join(re.escape(name) for name in names) + r")([^\]\n]*)\]")
+
+    def __replacement(self, match) -> str:
+        closing, tag, attributes = match.groups()
+        new_value = self.handlers[tag](closing == '/', attributes)
+        if new_value is None:
+            return match.group(0)
+        return new_value
+
+    def sub(self, text: str) -> str:
+        """
+        Returns the text with all known tags replaced.
+        """
+        return self.pattern.sub(self.__replacement, text)
+
+# Keywords of `[note type=...]` mapped to MyST admonitions, in order of precedence
+NOTE_TYPES = [
+    ('caution', '```{caution}'),
+    ('information', '```{note}'),
+    ('negative', '```{warning}'),
+    ('positive', '```{tip}'),
+]
+
+def note_replacement(closing: bool, attributes: str) -> str:
+    """
+    Handler for `[note]` tags. See `SphinxHandler.replace_discourse_notes()`.
+    """
+    if closing:
+        return '```' if not attributes else None
+    if not attributes:
+        return '```{note}'
+    for keyword, directive in NOTE_TYPES:
+        if keyword in attributes:
+            return directive
+    return None
+
+# Fences of tab sets and tabs, longer than the fences of the notes and code blocks they can contain
+TABS_FENCE = '`````'
+TAB_FENCE = '````'
+# Title of a `[tab]`, e.g. 'Juju 3' in `[tab version="Juju 3"]`
+TAB_TITLE_PATTERN = re.compile(r'^\s*\w+="(?P<title>[^"]*)"')
+
+def tabs_replacement(closing: bool, attributes: str) -> str:
+    """
+    Handler for `[tabs]` tags. See `SphinxHandler.replace_discourse_notes()`.
+    """
+    if attributes:
+        return None
+    return TABS_FENCE if closing else f"{TABS_FENCE}{{tabs}}"
+
+def tab_replacement(closing: bool, attributes: str) -> str:
+    """
+    Handler for `[tab]` tags. See `SphinxHandler.replace_discourse_notes()`.
+    """
+    if closing:
+        return TAB_FENCE if not attributes else None
+    match = TAB_TITLE_PATTERN.match(attributes)
+    if not match:
+        return None
+    return f"{TAB_FENCE}{{group-tab}} {match.group('title')}"
+
+DISCOURSE_TAGS = DiscourseTagRewriter({'note': note_replacement, 'tabs': tabs_replacement, 'tab': tab_replacement})
+
+# State of a `convert()` worker process, set by `_init_convert_worker()`
+_worker_handler = None
+_worker_stages = None
+
+def _init_convert_worker(handler, stages: list) -> None:
+    global _worker_handler, _worker_stages
+    _worker_handler = handler
+    _worker_stages = stages
+
+def _convert_worker(item) -> tuple:
+    """
+    Converts one topic in a worker process of `SphinxHandler.convert()`.
+
+    Returns
+    -------
+    tuple
+        Unresolved links found in the topic, its link records (see `SphinxHandler.link_records`), and the I/O
+        counted while converting it (see `files.IOCounters`), to be added to the counters of the parent process.
+    """
+    _worker_handler.unresolved_links = []
+    _worker_handler.link_records = {}
+    before = io_counters.snapshot()
+    _worker_handler._convert_item(item, _worker_stages)
+    after = io_counters.snapshot()
+    return (_worker_handler.unresolved_links, _worker_handler.link_records,
+            {name: after[name] - before[name] for name in after})
+
 class SphinxHandler:
+    """
+    Converts a downloaded Discourse documentation set to Sphinx/RTD-compatible markdown.
+
+    Each step processes the files of all topics in `discourse_docs`, except topics marked as unchanged
+    by an incremental download (`isChanged = False`), which were already converted by a previous run.
+
+    The steps can be run one at a time (`replace_href_anchors()`, `update_links()`, etc.), which reads and writes
+    every file once per step, or all at once with `convert()`, which reads and writes every file only once.
+    Both are built on the same stages: generators that take a topic and its lines, and yield the updated lines.
+    If `config['streaming']` is set, `convert()` streams each file through the stages line by line, so memory use
+    does not depend on the size of the file. If `config['jobs']` is higher than 1, `convert()` distributes the topics
+    across that many processes (at most one per CPU core).
+
+    Parameters
+    ----------
+    discourse_docs : DiscourseHandler
+        Downloaded documentation set.
+    configuration : dict
+        A dictionary containing settings from `config.yaml`.
+
+    Attributes
+    ----------
+    unresolved_links : list
+        Links to topics that are not in the navigation table, found by the last `update_links()` or `convert()`.
+        Each entry is a dictionary with the 'file', 'text' and 'link' keys. 'file' is the final path of the file
+        (see `output_path()`).
+    plan : OutputPlan
+        Layout applied by `update_index_pages()`, or None before it runs.
+    link_records : dict
+        Topic IDs mapped to the links and anchors found in their file by `replace_href_anchors()` and `update_links()`
+        (or the same stages of `convert()`). See `links.new_link_record()` and `write_link_graph()`.
+    """
+
     def __init__(self, discourse_docs: DiscourseHandler, configuration: dict) -> None:
         self.config = configuration
 
         self._discourse_docs = discourse_docs
+        self.unresolved_links = []
+        self.link_records = {}
+        self.plan = None
+        self.__link_targets = None
+        self.__toctrees = {}
+
+    def __getstate__(self) -> dict:
+        """
+        Excludes the DiscourseHandler (and its HTTP session) when the handler is sent to a worker process.
+        Workers only need the configuration and the link targets, so the plan is excluded too.
+        """
+        state = self.__dict__.copy()
+        state['_discourse_docs'] = None
+        state['plan'] = None
+        return state
+
+    def output_path(self, path) -> Path:
+        """
+        Returns the final path of a file of the docs directory.
+
+        With `staged_output()`, `config['docs_directory']` is a scratch copy that no longer exists once the run
+        succeeds, and `config['output_directory']` is the docs directory it replaces. Paths in logs and reports
+        point to the latter.
+        """
+        docs_directory = Path(self.config['docs_directory'])
+        return Path(self.config.get('output_directory') or docs_directory) / Path(path).relative_to(docs_directory)
+
+    def __read_lines(self, item: DiscourseItem) -> list:
+        """
+        Returns the lines of a topic file. Exits if the file doesn't exist.
+        """
+        if not item.filepath.with_suffix('.md').exists():
+            logging.error(f"ERROR: File {item.filepath} not found. Exiting program")
+            sys.exit(1)
+        with open(item.filepath.with_suffix('.md'), 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        io_counters.add(bytes_read=item.filepath.with_suffix('.md').stat().st_size, files_touched=1)
+        return lines
+
+    def __write_lines(self, item: DiscourseItem, lines: Iterable[str]) -> None:
+        """
+        Replaces a topic file with the given lines.
+        """
+        atomic_write_lines(item.filepath.with_suffix('.md'), lines)
+
+    def __stream_lines(self, item: DiscourseItem) -> Iterator[str]:
+        """
+        Yields the lines of a topic file one at a time. Exits if the file doesn't exist.
+        """
+        if not item.filepath.with_suffix('.md').exists():
+            logging.error(f"ERROR: File {item.filepath} not found. Exiting program")
+            sys.exit(1)
+        io_counters.add(bytes_read=item.filepath.with_suffix('.md').stat().st_size, files_touched=1)
+        with open(item.filepath.with_suffix('.md'), 'r', encoding='utf-8') as f:
+            yield from f
+
+    def __topics(self) -> list:
+        """
+        Returns the topics that need to be converted.
+        """
+        return self._discourse_docs.topics(changed_only=True)
+
+    def _replace_discourse_metadata_stage(self, item: DiscourseItem, lines: Iterable[str],
+                                          truncate_comments: bool = True, custom_delimiter: str = None) -> Iterator[str]:
+        """
+        Stage of `replace_discourse_metadata()`. See that method for details.
+        """
+        lines = iter(lines)
+        first_line = next(lines, None)
+        if first_line is None:
+            logging.error(f"ERROR: File {item.filepath} is empty.")
+            return
+
+        # replace first line with autogenerated MyST heading target `(path-from-root)=`
+        # first line contains `user <username> | <timestamp> | #<number>`, which should be removed anyway
+        myst_target = slugify(str(item.filepath.relative_to(self.config['docs_directory']).with_suffix('')))
+        head = [f"({myst_target})=\n"]
+
+        # add h1 heading
+        if self.config['generate_h1']:
+            h1_heading = ''
+            if item.title == 'index':
+                if not item.isHomeTopic:
+                    # non-root index pages use the name of their parent folder
+                    h1_heading = f"# {item.filepath.parent.name.title()}\n"
+            else:
+                # normal pages use their title property extracted from the Navlink
+                h1_heading = f"# {item.title}\n"
+            head.append(h1_heading)
+
+        # ensure third line is empty
+        while len(head) < 3:
+            line = next(lines, None)
+            if line is None:
+                break
+            head.append(line)
+        if len(head) >= 3 and head[2] != '\n':
+            head.insert(2, '\n')
+
+        # remove all lines after the `comment_delimiter`
+        comment_delimiter = None
+        if truncate_comments:
+            comment_delimiter = '-------------------------\n'
+            if custom_delimiter:
+                comment_delimiter = custom_delimiter
+            elif item.isHomeTopic:
+                comment_delimiter = '## Navigation'
+
+        for line in chain(head, lines):
+            if comment_delimiter and comment_delimiter in line:
+                break
+            yield line
 
     def replace_discourse_metadata(self, truncate_comments: bool = True, custom_delimiter: str = None):
         """
@@ -23,55 +286,22 @@ class SphinxHandler:
             Custom delimiter to separate comments, by default None.
         """
         logging.info("\nRemoving Discourse metadata...")
-        for item in self._discourse_docs._items:
-            if item.isTopic:
-                lines = []
-                with open(item.filepath.with_suffix('.md'), 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-
-                if len(lines) == 0:
-                    logging.error(f"ERROR: File {item.filepath} is empty. Exiting program.")
-                    continue
-            
-                # replace first line with autogenerated MyST heading target `(path-from-root)=`
-                # first line contains `user <username> | <timestamp> | #<number>`, which should be removed anyway
-                myst_target = slugify(str(item.filepath.relative_to(self.config['docs_directory']).with_suffix('')))
-                lines[0] = f"({myst_target})=\n"
-
-                # add h1 heading
-                if self.config['generate_h1']:
-                    h1_heading = ''
-                    if item.title == 'index':
-                        if not item.isHomeTopic:
-                            # non-root index pages use the name of their parent folder
-                            h1_heading = f"# {item.filepath.parent.name.title()}\n"
-                    else:
-                        # normal pages use their title property extracted from the Navlink
-                        h1_heading = f"# {item.title}\n"
-                    lines.insert(1, h1_heading)
-                
-                # ensure third line is empty
-                if len(lines) >= 3 and lines[2] != '\n':
-                    lines.insert(2, '\n')
-
-                # remove all lines after the `comment_delimiter`
-                if truncate_comments:
-                    content_before_comments = []
-                    comment_delimiter = '-------------------------\n'
-                    if custom_delimiter:
-                        comment_delimiter = custom_delimiter
-                    elif item.isHomeTopic:
-                        comment_delimiter = '## Navigation'
-                    
-                    for line in lines:
-                        if comment_delimiter in line:
-                            break
-                        content_before_comments.append(line)
-
-                    lines = content_before_comments
-
-                with open(item.filepath.with_suffix('.md'), 'w', encoding='utf-8') as f:
-                        f.writelines(content_before_comments)
+        for item in self.__topics():
+            lines = self.__read_lines(item)
+            if len(lines) == 0:
+                logging.error(f"ERROR: File {item.filepath} is empty. Exiting program.")
+                continue
+
+            self.__write_lines(item, list(self._replace_discourse_metadata_stage(item, lines, truncate_comments, custom_delimiter)))
+
+    def _replace_discourse_notes_stage(self, item: DiscourseItem, lines: Iterable[str]) -> Iterator[str]:
+        """
+        Stage of `replace_discourse_notes()`. See that method for details.
+        """
+        for line in lines:
+            if '[' in line:
+                line = DISCOURSE_TAGS.sub(line)
+            yield line
 
     def replace_discourse_notes(self):
         """
@@ -81,30 +311,17 @@ class SphinxHandler:
         -----
         The following replacements are made:
         - `[note]` and `[/note]` -> ```{note}``` for default, caution, information, and positive notes.
-        - TODO: [tab][/tab] 
+        - `[tabs]`, `[tab version="Title"]` and their closing tags -> `{tabs}` and `{group-tab} Title` directives
+          (sphinx-tabs), with longer fences than notes and code blocks, so that tabs can contain them.
+
+        All tags are replaced in a single scan per line by `DISCOURSE_TAGS`.
         """
         logging.info("\nReplacing discourse markdown syntax...")
-        for item in self._discourse_docs._items:
-            if item.isTopic:
-                lines = []
-                with open(item.filepath.with_suffix('.md'), 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-
-                updated_lines = []
-                for line in lines:
-                    line = re.sub(r'\[note\]', r'```{note}', line)  # Replaces [note] with ```{note}
-                    line = re.sub(r'\[note.*?caution.*?\]', r'```{caution}', line)  # Replaces [note="caution"] with ```{caution}
-                    line = re.sub(r'\[note.*?information.*?\]', r'```{note}', line)  # Replaces [note="information"] with ```{note}
-                    line = re.sub(r'\[note.*?negative.*?\]', r'```{warning}', line)  # Replaces [note="negative"] with ```{note}
-                    line = re.sub(r'\[note.*?positive.*?\]', r'```{tip}', line)  # Replaces [note="information"] with ```{note}
-                    line = re.sub(r'\[/note\]', r'```', line)  # Replaces [/note] with ```
-
-                    updated_lines.append(line)
-
-                with open(item.filepath.with_suffix('.md'), 'w', encoding='utf-8') as f:
-                        f.writelines(updated_lines)
+        for item in self.__topics():
+            lines = self.__read_lines(item)
+            self.__write_lines(item, list(self._replace_discourse_notes_stage(item, lines)))
 
-    def update_index_pages(self):
+    def update_index_pages(self, plan: OutputPlan = None):
         """
         Ensures there is an index page for each parent folder.
 
@@ -112,41 +329,18 @@ class SphinxHandler:
         - For each folder:
             - If it has an identically named `.md` file, renames it to `index.md`.
             - Otherwise, creates a new `index.md` file.
+
+        The renames and new files are planned up front with `plan_output()`, then applied in one batch.
+
+        Parameters
+        ----------
+        plan : OutputPlan, optional
+            Plan computed by `plan_output()` for this documentation set. By default, it is computed here.
         """
         logging.info("\nUpdating index pages...")
 
-        for item in self._discourse_docs._items:           
-            if item.isHomeTopic:
-                # rename to 'index.md'
-                new_path = item.filepath.parent / 'index'
-                os.rename(item.filepath.with_suffix('.md'), new_path.with_suffix('.md'))
-                item.update_filepath(new_path)
-
-                logging.debug(f"Renamed {item.filepath} to {new_path}")
-            if item.isFolder:
-                if item.isTopic: 
-                    # already has index topic; just need to rename
-                    new_path = item.filepath.parent / 'index.md'
-                    os.rename(item.filepath.with_suffix('.md'), new_path.with_suffix('.md'))
-                    item.update_filepath(new_path)
-
-                    logging.debug(f"Renamed {item.filepath} to {new_path}")
-                else: 
-                    # does not have an index topic, need to create
-                    index_file = item.filepath / 'index.md'
-                    with open(index_file.with_suffix('.md'), 'w', encoding='utf-8') as f:
-                            if self.config['generate_h1']: # special handling for new index files
-                                f.write(f"\n")
-                            else:
-                                f.write(f"\n# {item.filepath.name.title()}\n")
-
-                    new_item_row = {'Level': '1', 'Path': 'index', 'Navlink': '[Index]()'}
-                    new_item = DiscourseItem(new_item_row, self.config)
-                    new_item.update_filepath(index_file)
-
-                    self._discourse_docs._items.append(new_item)
-
-                    logging.debug(f"Created {index_file}.")
+        self.plan = plan or plan_output(self._discourse_docs)
+        self.plan.apply(self._discourse_docs)
 
     def __href_heading_replacement(self, line):
         pattern = r'<a href="#[^"]*"><(h[1-6]) id="[^"]*">\s*(.*?)\s*</\1></a>'
@@ -155,6 +349,18 @@ class SphinxHandler:
         line_changed = new_line != line
         return new_line, line_changed
 
+    def _replace_href_anchors_stage(self, item: DiscourseItem, lines: Iterable[str]) -> Iterator[str]:
+        """
+        Stage of `replace_href_anchors()`. See that method for details. Also records the anchors of the headings.
+        """
+        record = self.__link_record(item)
+        for line in lines:
+            record_headings(record, line)
+            new_line, line_changed = self.__href_heading_replacement(line) # replace HTML with markdown heading
+            new_line = new_line.replace('#heading--', '#') # remove prefix in links that start with '#heading--'
+
+            yield new_line
+
     def replace_href_anchors(self):
         """
         Replaces headings with manual href anchors with normal markdown headings.
@@ -170,99 +376,387 @@ class SphinxHandler:
         logging.info("\nUpdating headings with href anchors...")
         any_changes = False
         
-        for item in self._discourse_docs._items:
-            if item.isTopic:
-                lines = []
-                if not item.filepath.with_suffix('.md').exists():
-                    logging.error(f"ERROR: File {item.filepath} not found. Exiting program")
-                    sys.exit(1)
-                with open(item.filepath.with_suffix('.md'), 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-
-                updated_lines = []
-                file_changed = False
-                
-                for line in lines:
-                    new_line, line_changed = self.__href_heading_replacement(line) # replace HTML with markdown heading
-                    new_line = new_line.replace('#heading--', '#') # remove prefix in links that start with '#heading--'
-
-                    updated_lines.append(new_line)
-                    file_changed = file_changed or line_changed or line != new_line
-
-                if file_changed:
-                    logging.debug(f"Replaced href anchor headings in {item.filepath}")
-                    any_changes = True
-                    with open(item.filepath.with_suffix('.md'), 'w', encoding='utf-8') as f:
-                        f.writelines(updated_lines)
+        for item in self.__topics():
+            lines = self.__read_lines(item)
+            updated_lines = list(self._replace_href_anchors_stage(item, lines))
+
+            if updated_lines != lines:
+                logging.debug(f"Replaced href anchor headings in {item.filepath}")
+                any_changes = True
+                self.__write_lines(item, updated_lines)
 
         return any_changes
 
-    def __link_replacement(self, match):
+    def __build_link_targets(self) -> None:
+        """
+        Maps each topic ID to the absolute path of its local file, e.g. {'123': '/how-to/some-guide'}.
+
+        Must run after `update_index_pages()`, once the file paths are final.
+        """
+        if self.plan:
+            self.__link_targets = self.plan.link_targets
+            return
+
+        self.__link_targets = {}
+        for topic_id, item in self._discourse_docs._topic_index.items():
+            self.__link_targets[topic_id] = f"/{item.filepath.relative_to(self.config['docs_directory']).with_suffix('')}"
+
+    def __link_record(self, item: DiscourseItem) -> dict:
+        """
+        Returns the link record of a topic in `link_records`, creating it if needed.
+        Generated index pages have no topic ID, and get a record that is not kept.
+        """
+        if item.topic_id not in self.link_records:
+            path = item.filepath.with_suffix('.md').relative_to(self.config['docs_directory'])
+            if not item.topic_id:
+                return new_link_record(str(path))
+            self.link_records[item.topic_id] = new_link_record(str(path))
+        return self.link_records[item.topic_id]
+
+    def __link_replacement(self, match, source: DiscourseItem, record: dict = None):
         """
         Finds the item in self.discourse_docs that corresponds to the given topic ID, and returns the absolute path
         to the corresponding local file.
 
+        If the topic is not in the navigation table, the link is pointed at the topic on the Discourse instance
+        and recorded in `unresolved_links`. Either way, the link is added to the link `record` of the source, if given.
+
         Returns
         -------
         str
             New hyperlink including the text and path.
         """
-        text = match.group(1)
-        topic_id = match.group(2)
-        
-        new_value = ''
-        for item in self._discourse_docs._items:
-            if item.topic_id == topic_id:
-                new_value = item.filepath.relative_to(self.config['docs_directory']).with_suffix('')
-        
-        return f"[{text}](/{new_value})"
+        text = match.group('text')
+        target = self.__link_targets.get(match.group('topic_id'))
+
+        if target is None:
+            self.unresolved_links.append({'file': str(self.output_path(source.filepath)), 'text': text,
+                                          'link': match.group('link')})
+            if record is not None:
+                record['outside'].append(match.group('link'))
+            return f"[{text}](https://{self.config['instance']}{match.group('link')})"
+
+        if record is not None:
+            anchor = match.group('link').partition('#')[2]
+            record['links'].append([match.group('topic_id'), anchor.replace('heading--', '', 1)])
+        return f"[{text}]({target})"
+
+    def _update_links_stage(self, item: DiscourseItem, lines: Iterable[str]) -> Iterator[str]:
+        """
+        Stage of `update_links()`. See that method for details.
+        """
+        if self.__link_targets is None:
+            self.__build_link_targets()
+
+        record = self.__link_record(item)
+        replacement = partial(self.__link_replacement, source=item, record=record)
+        # rows of the navigation table are not counted as links between pages
+        navtable_replacement = partial(self.__link_replacement, source=item)
+        for line in lines:
+            record_links(record, line, self.config['instance'])
+            if item.isHomeTopic and line.lstrip().startswith('|'):
+                yield DISCOURSE_LINK_PATTERN.sub(navtable_replacement, line)
+            else:
+                yield DISCOURSE_LINK_PATTERN.sub(replacement, line)
+
+    def report_unresolved_links(self) -> None:
+        """
+        Logs the links to topics that are not in the navigation table.
+        """
+        if not self.unresolved_links:
+            return
+
+        logging.warning(f"\nWARNING: Found {len(self.unresolved_links)} links to topics outside the navigation table. "
+                        f"They now point to https://{self.config['instance']}:")
+        for link in self.unresolved_links:
+            logging.warning(f"  {link['file']}: [{link['text']}]({link['link']})")
 
     def update_links(self):
         """
         Replaces local discourse links with local path to the equivalent file.
+
+        Links to topics that are not in the navigation table point to the Discourse instance instead,
+        and are listed by `report_unresolved_links()`.
         """
         logging.info("\nUpdating internal links...")
-        for item in self._discourse_docs._items:
-            if item.isTopic:
-                lines = []
-                if not item.filepath.with_suffix('.md').exists():
-                    logging.error(f"ERROR: File {item.filepath} not found. Exiting program")
-                    sys.exit(1)
-                with open(item.filepath.with_suffix('.md'), 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-
-                updated_lines = []
-                pattern = r"\[([^\]]+)]\(/t/[^)]*?(\d+)[^)]*\)"
-                for line in lines:
-                    new_line = re.sub(pattern, self.__link_replacement, line)
-                    updated_lines.append(new_line)
-
-                with open(item.filepath.with_suffix('.md'), 'w', encoding='utf-8') as f:
-                        f.writelines(updated_lines)
+        self.unresolved_links = []
+        self.__build_link_targets()
+        for item in self.__topics():
+            lines = self.__read_lines(item)
+            self.__write_lines(item, list(self._update_links_stage(item, lines)))
+
+        self.report_unresolved_links()
+
+    def __build_toctrees(self) -> None:
+        """
+        Maps each index file, relative to the docs directory, to the entries of its explicit toctree,
+        in navigation table order. Only used if `config['explicit_toctrees']` is set.
+
+        Must run after `update_index_pages()`, once the output plan is known. Topics that failed to download
+        and have no file are left out, as they would be by a `:glob:` pattern.
+        """
+        self.__toctrees = {}
+        if not self.config.get('explicit_toctrees') or self.plan is None:
+            return
+
+        docs_directory = Path(self.config['docs_directory'])
+        paths = [entry['path'] for entry in self.plan.files if (docs_directory / entry['path']).exists()]
+        for index, children in toctree_entries(paths).items():
+            folder = Path(index).parent
+            self.__toctrees[index] = [f"{Path(child).relative_to(folder)}\n" for child in children]
+
+    def __explicit_toctree_lines(self, item: DiscourseItem) -> list:
+        """
+        Returns the explicit `toctree` of an index file: its pages and subfolders in navigation table order.
+        """
+        index = str(item.filepath.with_suffix('.md').relative_to(self.config['docs_directory']))
+        toctree_directives = f"\n```{{toctree}}\n:titlesonly:\n:maxdepth: 2\n:hidden:\n\n"
+        home = ["Home <self>\n"] if item.isHomeTopic else []
+
+        return [toctree_directives] + home + self.__toctrees.get(index, [])
+
+    def __toctree_lines(self, item: DiscourseItem) -> list:
+        """
+        Returns the `toctree` to append to an index file, or an empty list if the item is not an index.
+        """
+        if not (item.title == 'index' or item.isHomeTopic):
+            return []
+
+        if self.config.get('explicit_toctrees'):
+            return self.__explicit_toctree_lines(item)
+
+        toctree_directives = f"\n```{{toctree}}\n:titlesonly:\n:maxdepth: 2\n:glob:\n:hidden:\n\n"
+        if item.isHomeTopic:
+            return [toctree_directives,
+                    "Home <self>\n",
+                    "tutorial*/index\n",
+                    "how*/index\n",
+                    "reference*/index\n",
+                    "explanation*/index\n",
+                    "*\n"]
+
+        return [toctree_directives,
+                "*\n",
+                "*/index\n"]
+
+    def _generate_tocs_stage(self, item: DiscourseItem, lines: Iterable[str]) -> Iterator[str]:
+        """
+        Stage of `generate_tocs()`. See that method for details.
+        """
+        yield from lines
+        yield from self.__toctree_lines(item)
 
     def generate_tocs(self):
         """
         Generates `toctree` for each index file
+
+        By default, toctrees use `:glob:` patterns. If `config['explicit_toctrees']` is set, they list the pages
+        and subfolders of each index explicitly, in navigation table order, so Sphinx doesn't need to glob the file system.
         """
         logging.info("\nGenerating toctrees for index files...")
+        self.__build_toctrees()
 
-        toctree_directives = f"\n```{{toctree}}\n:titlesonly:\n:maxdepth: 2\n:glob:\n:hidden:\n\n"
         for item in self._discourse_docs._items:
-            if item.title == 'index' or item.isHomeTopic:
-                if item.isHomeTopic:
-                    with open(item.filepath.with_suffix('.md'), 'a', encoding='utf-8') as f:
-                        f.write(toctree_directives)
-                        f.write("Home <self>\n")
-                        f.write("tutorial*/index\n")
-                        f.write("how*/index\n")
-                        f.write("reference*/index\n")
-                        f.write("explanation*/index\n")
-                        f.write("*\n")
-                else:
-                    with open(item.filepath.with_suffix('.md'), 'a', encoding='utf-8') as f:
-                        f.write(toctree_directives)
-                        f.write("*\n")
-                        f.write("*/index\n")
+            if not item.isChanged:
+                continue
+            toctree_lines = self.__toctree_lines(item)
+            if toctree_lines:
+                # rewrite instead of appending, since the file may be a hardlink to the topic store
+                self.__write_lines(item, chain(self.__read_lines(item), toctree_lines))
 
                 logging.debug(f"Created toctree for {item.filepath}")
 
+    def pipeline_stages(self, truncate_comments: bool = True, custom_delimiter: str = None) -> list:
+        """
+        Returns the stages run by `convert()`, in the same order as the individual steps in `doh.launch()`.
+
+        Each stage is a callable `stage(item, lines)` that yields the updated lines. To customize the conversion,
+        pass a modified list to `convert()`.
+
+        Parameters
+        ----------
+        truncate_comments : bool, optional
+            Passed to the `replace_discourse_metadata()` stage, by default True.
+        custom_delimiter : str, optional
+            Passed to the `replace_discourse_metadata()` stage, by default None.
+        """
+        return [
+            self._replace_href_anchors_stage,
+            self._update_links_stage,
+            partial(self._replace_discourse_metadata_stage,
+                    truncate_comments=truncate_comments, custom_delimiter=custom_delimiter),
+            self._replace_discourse_notes_stage,
+            self._generate_tocs_stage,
+        ]
+
+    def _convert_item(self, item: DiscourseItem, stages: list) -> None:
+        """
+        Runs the stages on one topic file. See `convert()`.
+        """
+        lines = self.__stream_lines(item) if self.config.get('streaming', False) else self.__read_lines(item)
+        for stage in stages:
+            lines = stage(item, lines)
+
+        self.__write_lines(item, lines)
+        logging.debug(f"Converted {item.filepath}")
+
+    def convert(self, stages: list = None):
+        """
+        Runs all conversion stages on each topic in a single pass: each file is read once, transformed
+        and written once.
+
+        The result is identical to calling `replace_href_anchors()`, `update_links()`, `replace_discourse_metadata()`,
+        `replace_discourse_notes()` and `generate_tocs()` in sequence. Run after `update_index_pages()`.
+
+        By default, each file is loaded in memory. If `config['streaming']` is set, lines are streamed from the file
+        through the stages into a temporary file, which then replaces the original.
+
+        If `config['jobs']` is higher than 1, topics are converted in a pool of worker processes (at most one per
+        CPU core). Each topic only depends on its own file and on the read-only link targets, so the output
+        is identical to a serial run.
+
+        Parameters
+        ----------
+        stages : list, optional
+            Stages to run, by default `pipeline_stages()`. Must be picklable if `config['jobs']` is higher than 1.
+        """
+        logging.info("\nConverting topics...")
+        if stages is None:
+            stages = self.pipeline_stages()
+
+        self.unresolved_links = []
+        self.link_records = {}
+        self.__build_link_targets()
+        self.__build_toctrees()
+
+        topics = self.__topics()
+        jobs = min(int(self.config.get('jobs', 1)), os.cpu_count() or 1, len(topics))
+
+        if jobs > 1:
+            chunksize = max(1, len(topics) // (jobs * 4))
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_init_convert_worker,
+                                     initargs=(self, stages)) as executor:
+                for unresolved_links, link_records, io in executor.map(_convert_worker, topics, chunksize=chunksize):
+                    self.unresolved_links.extend(unresolved_links)
+                    self.link_records.update(link_records)
+                    io_counters.add(**io)
+        else:
+            for item in topics:
+                self._convert_item(item, stages)
+
+        self.report_unresolved_links()
+
+    def write_change_manifest(self) -> dict:
+        """
+        Lists the output files that changed since the previous run, in `<docs_directory>/.doh-changes.json`.
+
+        Files are compared by the digest of their contents, so a topic that was downloaded and converted again
+        to identical contents is not reported. The modification time of such files is restored, so that
+        an incremental Sphinx build skips them. Index files whose toctree lists other files than in the previous
+        run are reported as 'toctree_changed', and keep their new modification time so that Sphinx reads them again.
+        Output files of the previous run that this run no longer produces are deleted, along with the folders
+        that this leaves empty, and reported as 'removed'. Other files in the docs directory are left alone.
+
+        Must run after `update_index_pages()` and `convert()`, and before `DiscourseHandler.save_manifest()`,
+        which records the digests for the next run.
+
+        Returns
+        -------
+        dict
+            Lists of paths relative to the docs directory, under the 'added', 'modified', 'removed'
+            and 'toctree_changed' keys.
+        """
+        if self.plan is None:
+            logging.warning("WARNING: No output plan. Run update_index_pages() before write_change_manifest().")
+            return {}
+
+        manifest = self._discourse_docs._manifest
+        docs_directory = Path(self.config['docs_directory'])
+        unchanged_topics = {str(item.filepath.with_suffix('.md').relative_to(docs_directory))
+                            for item in self._discourse_docs.topics() if not item.isChanged}
+
+        outputs = {}
+        for entry in self.plan.files:
+            path = entry['path']
+            if path in outputs:
+                continue
+            if path in unchanged_topics and path in manifest.outputs:
+                outputs[path] = manifest.outputs[path] # not rewritten by this run
+                continue
+            try:
+                outputs[path] = digest_file(docs_directory / path)
+            except FileNotFoundError:
+                continue # failed download without a previous version
+            io_counters.add(bytes_read=(docs_directory / path).stat().st_size, files_touched=1)
+
+        toctrees = toctree_entries(list(outputs))
+        if not self.config.get('explicit_toctrees'):
+            toctrees = {index: sorted(children) for index, children in toctrees.items()} # order of the `*` glob
+        changes = {
+            'added': sorted(path for path in outputs if path not in manifest.outputs),
+            'modified': sorted(path for path, digest in outputs.items()
+                               if path in manifest.outputs and manifest.outputs[path] != digest),
+            'removed': sorted(path for path in manifest.outputs if path not in outputs),
+            'toctree_changed': sorted(path for path, children in toctrees.items()
+                                      if path in manifest.toctrees and manifest.toctrees[path] != children),
+        }
+
+        for path, digest in outputs.items():
+            if manifest.outputs.get(path) == digest and path in manifest.output_times \
+                    and path not in changes['toctree_changed']:
+                os.utime(docs_directory / path, ns=manifest.output_times[path])
+
+        for path in changes['removed']:
+            self.__remove_output(docs_directory / path)
+
+        manifest.outputs = outputs
+        manifest.toctrees = toctrees
+        atomic_write_lines(docs_directory / CHANGES_FILENAME, [json.dumps(changes, indent=1)])
+
+        logging.info(f"\nChanged files: {len(changes['added'])} added, {len(changes['modified'])} modified, "
+                     f"{len(changes['removed'])} removed, {len(changes['toctree_changed'])} toctrees changed. "
+                     f"See {self.output_path(docs_directory / CHANGES_FILENAME)}.")
+        return changes
+
+    def __remove_output(self, path: Path) -> None:
+        """
+        Deletes a stale output file, and its parent folders up to the docs directory if they are left empty.
+        """
+        docs_directory = Path(self.config['docs_directory'])
+        path.unlink(missing_ok=True)
+        io_counters.add(files_touched=1)
+        logging.debug(f"Deleted {path}, which is no longer in the navigation table.")
+
+        for folder in path.parents:
+            if folder == docs_directory or docs_directory not in folder.parents:
+                break
+            try:
+                folder.rmdir()
+            except OSError:
+                break # not empty
+
+    def write_link_graph(self) -> dict:
+        """
+        Saves the links recorded during the conversion as a graph in `<docs_directory>/.doh-links.json`,
+        and writes a report of its orphan pages, broken links, unresolved links and links to topics outside
+        the navigation table to `.doh-link-report.json` (see `LinkGraph.report()`).
+
+        Topics that were not converted by this run (e.g. unchanged topics of an incremental run) keep the links
+        recorded by the previous run. External links are only counted, not checked.
+
+        Returns
+        -------
+        dict
+            The report.
+        """
+        docs_directory = Path(self.config['docs_directory'])
+        topics = self._discourse_docs.topics()
+
+        graph = LinkGraph(docs_directory)
+        graph.update([item.topic_id for item in topics if item.topic_id], self.link_records)
+        report = graph.report(self.config['home_topic_id'],
+                              missing={item.topic_id for item in topics if not item.raw_digest and not item.isChanged})
+        graph.save(report)
+
+        log_link_report(report, self.output_path(docs_directory / LINK_REPORT_FILENAME))
+        return report
@@ -0,0 +1,258 @@
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from .files import io_counters
+
+INDEX_FILENAME = 'index.json'
+
+# Open stores, by resolved directory, so that all handlers of a process share one index and its locks
+_stores = {}
+_stores_lock = threading.Lock()
+
+def open_store(directory) -> 'TopicStore':
+    """
+    Returns the `TopicStore` for a directory, shared by all handlers in the process.
+
+    Parameters
+    ----------
+    directory : str or Path
+        Directory that holds the store. Created if it doesn't exist.
+    """
+    key = Path(directory).resolve()
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = TopicStore(key)
+        return _stores[key]
+
+class TopicStore:
+    """
+    Content-addressed store of raw topics, shared by documentation sets and by runs.
+
+    Each distinct raw markdown is stored once, as `objects/<xx>/<digest>`, where `<digest>` is its SHA-256 hex digest.
+    `index.json` maps each topic (`<instance>/<topic_id>`) to the digest of its last downloaded version,
+    the backend it was fetched with, and the validators of the response (`ETag`/`Last-Modified`), if any.
+
+    The store saves requests, not disk space:
+    - A topic is fetched at most once per process. Other documentation sets that list the same topic
+      reuse the stored copy without a request.
+    - In later runs, a topic is requested with the validators of the index. A `304 Not Modified` reuses
+      the stored copy.
+    Topic files are materialised from the store (as hardlinks where possible), but the conversion replaces
+    each of them with the converted topic, so every docs directory ends up with its own files. Stored objects
+    are never modified. Failed downloads are not stored, so another documentation set retries them.
+    `gc()` deletes the objects that the index no longer refers to, e.g. previous versions of updated topics.
+
+    Parameters
+    ----------
+    directory : str or Path
+        Directory that holds the store. Created if it doesn't exist.
+
+    Attributes
+    ----------
+    directory : Path
+    topics : dict
+        Topic keys mapped to `{'digest': ..., 'backend': ..., 'validators': {...}}` entries.
+    fetched : int
+        Number of topics downloaded in this process.
+    reused : int
+        Number of topics served from the store without a request, because they were fetched earlier in this process.
+    revalidated : int
+        Number of topics served from the store after a `304 Not Modified` response.
+    """
+
+    def __init__(self, directory) -> None:
+        self.directory = Path(directory)
+        self.objects_directory = self.directory / 'objects'
+        self.objects_directory.mkdir(parents=True, exist_ok=True)
+        self.topics = self.__read_index()
+        self.fetched = 0
+        self.reused = 0
+        self.revalidated = 0
+
+        self._lock = threading.Lock()
+        self._topic_locks = {}
+        self._fetched_keys = set() # topics downloaded or revalidated in this process, by key and backend
+
+    def __read_index(self) -> dict:
+        try:
+            with open(self.directory / INDEX_FILENAME, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            logging.warning(f"WARNING: Could not read the index of the topic store {self.directory}. It will be rebuilt.")
+            return {}
+
+    def object_path(self, digest: str) -> Path:
+        """
+        Returns the path of the object with the given digest.
+        """
+        return self.objects_directory / digest[:2] / digest
+
+    def put(self, text: str) -> str:
+        """
+        Stores raw markdown, unless an identical object exists.
+
+        Returns
+        -------
+        str
+            SHA-256 hex digest of the text.
+        """
+        data = text.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if path.exists():
+            return digest
+
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.lexists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        return digest
+
+    def fetch(self, instance: str, topic_id: str, backend: str, download) -> str:
+        """
+        Returns a topic from the store if it was already fetched in this process, otherwise downloads and stores it.
+
+        If the index has validators for the topic, from a previous run with the same backend, the download is
+        conditional, and the stored copy is reused if the server answers `304 Not Modified`.
+        Concurrent calls for the same topic wait for the first download instead of sending their own request.
+
+        Parameters
+        ----------
+        instance : str
+            Discourse instance, e.g. 'discourse.ubuntu.com'.
+        topic_id : str
+        backend : str
+            Endpoint used to download the topic. A topic fetched from another backend is downloaded again.
+        download : callable
+            Function that takes the validators of the stored copy (a dict, possibly empty) and returns
+            `(text, validators)`: the text of the topic, or an empty string if the download failed,
+            or None if the server answered `304 Not Modified`, and the validators of the response.
+
+        Returns
+        -------
+        str
+            Digest of the topic, or None if the download failed.
+        """
+        key = f"{instance}/{topic_id}"
+        with self._lock:
+            topic_lock = self._topic_locks.setdefault(key, threading.Lock())
+
+        with topic_lock:
+            with self._lock:
+                entry = self.topics.get(key)
+            if (key, backend) in self._fetched_keys:
+                with self._lock:
+                    self.reused += 1
+                logging.debug(f"Reusing topic {key} from the topic store.")
+                return entry['digest']
+
+            validators = {}
+            if entry and entry.get('backend') == backend and self.object_path(entry['digest']).exists():
+                validators = entry.get('validators', {})
+
+            text, response_validators = download(validators)
+            if text is None and validators:
+                digest = entry['digest']
+                logging.debug(f"Topic {key} is unchanged since it was stored.")
+            elif text:
+                digest = self.put(text)
+            else:
+                return None # not stored, so that other documentation sets try again
+
+            with self._lock:
+                self.topics[key] = {'digest': digest, 'backend': backend, 'validators': response_validators}
+                self._fetched_keys.add((key, backend))
+                if text is None:
+                    self.revalidated += 1
+                else:
+                    self.fetched += 1
+
+        return digest
+
+    def materialize(self, digest: str, path: Path) -> int:
+        """
+        Creates or replaces `path` with the object of the given digest, as a hardlink if possible, otherwise as a copy.
+
+        Returns
+        -------
+        int
+            Size of the file in bytes.
+        """
+        source = self.object_path(digest)
+        path = Path(path)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix='.tmp')
+        os.close(fd)
+        os.unlink(tmp_path)
+        try:
+            try:
+                os.link(source, tmp_path)
+            except OSError:
+                shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.lexists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        size = source.stat().st_size
+        io_counters.add(bytes_written=size, files_touched=1)
+        return size
+
+    def save(self) -> None:
+        """
+        Writes the index of the store.
+
+        The index is read again first, and only the topics fetched by this process are updated,
+        so that runs of other doc sets that share the store keep their entries.
+        """
+        with self._lock:
+            topics = self.__read_index()
+            updated_keys = {key for key, _ in self._fetched_keys}
+            topics.update({key: entry for key, entry in self.topics.items() if key in updated_keys})
+            self.topics = topics
+            data = json.dumps(topics, indent=1, sort_keys=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.directory / INDEX_FILENAME)
+
+        logging.debug(f"Saved topic store index {self.directory / INDEX_FILENAME}")
+
+    def gc(self) -> int:
+        """
+        Deletes the objects that no topic of the index refers to, and temporary files left by interrupted writes.
+
+        Must not run while topics are being fetched, since a new object is written before it is added to the index.
+
+        Returns
+        -------
+        int
+            Number of files deleted.
+        """
+        with self._lock:
+            referenced = {entry['digest'] for entry in self.topics.values()}
+
+        removed = 0
+        for path in self.objects_directory.glob('*/*'):
+            if path.name not in referenced:
+                path.unlink(missing_ok=True)
+                removed += 1
+
+        if removed:
+            logging.debug(f"Deleted {removed} unreferenced objects from the topic store {self.directory}.")
+        return removed
@@ -0,0 +1,135 @@
+"""
+Local HTTP stub of a Discourse instance, shared by the tests (`doh/tests/`) and the benchmarks (`benchmarks/`).
+
+    with StubServer({'/raw/123': 'raw markdown'}) as server:
+        session = server.session(config)
+
+    async def main():
+        with StubServer({'/raw/123': 'raw markdown'}) as server:
+            session = server.async_session(config)
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import threading
+from urllib.parse import unquote
+
+from requests.adapters import HTTPAdapter
+
+from .session import DiscourseSession, create_session
+from .async_handler import AsyncDiscourseSession, get_async_session
+
+class _StubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are sent in separate writes: without TCP_NODELAY, the body waits for the client's
+    # delayed ACK of the headers (about 40 ms per request on Linux)
+    disable_nagle_algorithm = True
+    stub = None
+
+    def do_GET(self):
+        path = unquote(self.path)
+        self.stub.requests.append((path, dict(self.headers)))
+        response = self.stub.responses.get(path)
+        if response is None:
+            status, headers, body = 404, {}, b''
+        elif callable(response):
+            status, headers, body = response(self)
+        else:
+            body = response.encode('utf-8') if isinstance(response, str) else response
+            headers = {'ETag': f'"{hashlib.sha256(body).hexdigest()[:16]}"'}
+            status = 200
+            if self.headers.get('If-None-Match') == headers['ETag']:
+                status, body = 304, b''
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class _StubAdapter(HTTPAdapter):
+    """
+    Sends the requests of a session for `https://{instance}/` to the stub server over plain HTTP.
+    """
+
+    def __init__(self, instance: str, base_url: str, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.instance = instance
+        self.base_url = base_url
+
+    def send(self, request, **kwargs):
+        request.url = request.url.replace(f"https://{self.instance}", self.base_url, 1)
+        return super().send(request, **kwargs)
+
+class StubServer:
+    """
+    Local HTTP server that serves canned responses of a Discourse instance.
+
+    Use as a context manager, or call `start()` and `stop()`. The server runs in a background thread
+    on a free port of 127.0.0.1.
+
+    Parameters
+    ----------
+    responses : dict
+        Unquoted paths with their query string (e.g. '/raw/123') mapped to the body of a `200 OK` response (str or bytes),
+        or to a function `respond(handler)` that returns `(status, headers, body)` for the request of `handler`,
+        a `BaseHTTPRequestHandler`. Bodies are sent with an `ETag`, and requests that send it back in
+        `If-None-Match` get a `304 Not Modified`. Other paths get a 404.
+
+    Attributes
+    ----------
+    base_url : str
+    requests : list
+        `(path, headers)` of each request received.
+    """
+
+    def __init__(self, responses: dict) -> None:
+        self.responses = responses
+        self.requests = []
+        handler = type('StubRequestHandler', (_StubRequestHandler,), {'stub': self})
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self) -> 'StubServer':
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> 'StubServer':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def mount(self, session: DiscourseSession, instance: str) -> None:
+        """
+        Routes the requests of a `DiscourseSession` for `https://{instance}/` to this server.
+        """
+        session.mount(f"https://{instance}/", _StubAdapter(instance, self.base_url, pool_connections=session.pool_size,
+                                                           pool_maxsize=session.pool_size))
+
+    def session(self, config: dict) -> DiscourseSession:
+        """
+        Returns a `DiscourseSession` for `config` whose requests to its instance go to this server.
+        """
+        session = create_session(config)
+        self.mount(session, config['instance'])
+        return session
+
+    def async_session(self, config: dict) -> AsyncDiscourseSession:
+        """
+        Returns the `AsyncDiscourseSession` of the instance of `config` on the running event loop,
+        with its requests sent to this server. Call it before any handler of the instance uses the loop.
+        """
+        session = get_async_session(config, base_url=self.base_url)
+        if session.base_url != self.base_url:
+            raise ValueError(f"The running event loop already has a session for {config['instance']}.")
+        return session
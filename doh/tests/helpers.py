@@ -0,0 +1,71 @@
+"""
+Shared fixtures of the tests: documentation set handlers built from a navigation table, snapshots and file trees.
+The local HTTP stub of a Discourse instance, `StubServer`, is in `doh/testing.py`, since the benchmarks use it too.
+"""
+
+from pathlib import Path
+
+import requests
+
+from doh.discourse_handler import DiscourseHandler, search_for_navtable
+from doh.snapshot import Snapshot, open_snapshot
+from doh.testing import StubServer
+
+INSTANCE = 'instance.discourse.io'
+
+def docset_config(docs_directory, **settings) -> dict:
+    """
+    Returns the settings of a test documentation set, with the home topic of the navigation tables of `test_data`.
+    """
+    config = {'instance': INSTANCE, 'home_topic_id': '9729', 'generate_h1': False, 'docs_directory': str(docs_directory)}
+    config.update(settings)
+    return config
+
+def docset_handler(config: dict, navtable: str, write_topics: bool = False, session=None) -> DiscourseHandler:
+    """
+    Returns a handler for a navigation table, after `calculate_item_type()` and `calculate_filepaths()`.
+
+    Parameters
+    ----------
+    config : dict
+    navtable : str
+        Navigation table, with its `[details=Navigation]` markers.
+    write_topics : bool, optional
+        If True, writes the file of each topic with its topic ID as contents, as if it had been downloaded.
+    session : DiscourseSession, optional
+        Session of the handler, e.g. from `StubServer.session()`. By default, a new session for `config`.
+    """
+    discourse_docs = DiscourseHandler(config, search_for_navtable(navtable), session=session)
+    discourse_docs.calculate_item_type()
+    discourse_docs.calculate_filepaths()
+
+    if write_topics:
+        for item in discourse_docs.topics():
+            item.filepath.parent.mkdir(parents=True, exist_ok=True)
+            item.filepath.with_suffix('.md').write_text(item.topic_id)
+    return discourse_docs
+
+def record_snapshot(path, responses: dict) -> Snapshot:
+    """
+    Records `200 OK` responses in a snapshot file, to be replayed by a session with `config['replay']` set.
+
+    Parameters
+    ----------
+    path : str or Path
+        SQLite file of the snapshot.
+    responses : dict
+        URLs mapped to the text of their response.
+    """
+    snapshot = open_snapshot(path)
+    for url, text in responses.items():
+        response = requests.Response()
+        response.status_code, response.reason, response._content = 200, 'OK', text.encode('utf-8')
+        snapshot.record(url, response)
+    return snapshot
+
+def read_tree(directory) -> dict:
+    """
+    Returns the files of a directory, relative to it, mapped to their contents in bytes.
+    """
+    directory = Path(directory)
+    return {str(path.relative_to(directory)): path.read_bytes() for path in sorted(directory.rglob('*')) if path.is_file()}
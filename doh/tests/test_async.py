@@ -0,0 +1,163 @@
+import unittest
+import asyncio
+import tempfile
+import threading
+import time
+import os
+
+from test_data import *
+from helpers import *
+from doh.doh import *
+from doh import AsyncDiscourseHandler
+from doh.async_handler import close_async_sessions, read_response
+
+TOPICS = ['9729', '9722', '9724', '14575', '14783', '15422']
+
+def topic_responses() -> dict:
+    responses = {f"/raw/{topic_id}": f"Topic {topic_id}\n" for topic_id in TOPICS}
+    responses['/raw/9729'] = f"Home\n\n{navtable_diataxis_1_home_0}\n"
+    return responses
+
+async def mirror(config: dict) -> AsyncDiscourseHandler:
+    handler = await AsyncDiscourseHandler.create(config)
+    handler.calculate_item_type()
+    handler.calculate_filepaths()
+    await handler.download_async()
+    return handler
+
+class AsyncDownload(unittest.TestCase):
+    def test_docsets(self):
+        in_flight, peak, clients = [0], [0], set()
+        lock = threading.Lock()
+        responses = topic_responses()
+        def slow(path):
+            def respond(handler):
+                with lock:
+                    in_flight[0] += 1
+                    peak[0] = max(peak[0], in_flight[0])
+                    clients.add(handler.client_address)
+                time.sleep(0.05)
+                with lock:
+                    in_flight[0] -= 1
+                return 200, {}, responses[path].encode('utf-8')
+            return respond
+
+        with tempfile.TemporaryDirectory() as directory, \
+                StubServer({path: slow(path) for path in responses}) as server:
+            configs = [docset_config(os.path.join(directory, name), jobs=3) for name in ['a', 'b', 'c']]
+
+            async def main():
+                session = server.async_session(configs[0])
+                handlers = await asyncio.gather(*(mirror(config) for config in configs))
+                # all doc sets of the instance share one session
+                self.assertTrue(all(handler._session is session for handler in handlers))
+                await close_async_sessions()
+                return handlers
+
+            handlers = asyncio.run(main())
+
+            for handler in handlers:
+                self.assertEqual(handler.get_item('14575').filepath.read_text(), "Topic 14575\n")
+                self.assertEqual(handler.download_statistics['topics'], len(TOPICS))
+            # 3 navigation tables and 3 times 6 topics, at most `jobs` at a time across the doc sets
+            self.assertEqual(len(server.requests), 3 + 3 * len(TOPICS))
+            self.assertEqual(peak[0], 3)
+            # connections are kept alive and reused
+            self.assertLessEqual(len(clients), 3)
+
+    def test_incremental(self):
+        with tempfile.TemporaryDirectory() as directory, StubServer(topic_responses()) as server:
+            config = docset_config(os.path.join(directory, 'docs'), incremental=True, jobs=4)
+
+            async def main():
+                server.async_session(config)
+                handler = await mirror(config)
+                handler.save_manifest()
+                return handler
+
+            asyncio.run(main())
+            handler = asyncio.run(main()) # a new event loop, with a new session
+
+            # the second run revalidates each topic with the ETag of the first
+            self.assertEqual(handler.download_statistics['unchanged'], len(TOPICS))
+            self.assertEqual(len([path for path, headers in server.requests if 'If-None-Match' in headers]),
+                             len(TOPICS))
+
+    def test_retries(self):
+        attempts = []
+        def unavailable_once(handler):
+            attempts.append(1)
+            if len(attempts) == 1:
+                return 503, {'Retry-After': '0'}, b''
+            return 200, {}, b'Topic 9722\n'
+
+        responses = topic_responses()
+        responses['/raw/9722'] = unavailable_once
+        with tempfile.TemporaryDirectory() as directory, StubServer(responses) as server:
+            config = docset_config(os.path.join(directory, 'docs'), jobs=2)
+
+            async def main():
+                session = server.async_session(config)
+                handler = await mirror(config)
+                await close_async_sessions()
+                return handler, session
+
+            handler, session = asyncio.run(main())
+            self.assertEqual(handler.get_item('9722').filepath.read_text(), "Topic 9722\n")
+            self.assertEqual(session.stats.retries, 1)
+            self.assertEqual(session.stats.errors, 0)
+
+    def test_failed_topic(self):
+        responses = topic_responses()
+        del responses['/raw/15422']
+        with tempfile.TemporaryDirectory() as directory, StubServer(responses) as server:
+            config = docset_config(os.path.join(directory, 'docs'), max_retries=0)
+
+            async def main():
+                server.async_session(config)
+                return await mirror(config)
+
+            handler = asyncio.run(main())
+            failed = handler.get_item('15422')
+            self.assertFalse(failed.isChanged)
+            self.assertFalse(failed.filepath.exists())
+
+    def test_unsupported_settings(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = docset_config(directory, store_directory=os.path.join(directory, 'store'))
+            with self.assertRaises(ValueError):
+                asyncio.run(AsyncDiscourseHandler.create(config))
+            with self.assertRaises(ValueError):
+                AsyncDiscourseHandler(docset_config(directory))
+
+class HTTPResponses(unittest.TestCase):
+    def read(self, data: bytes, max_size: int = 1024):
+        async def main():
+            reader = asyncio.StreamReader()
+            reader.feed_data(data)
+            reader.feed_eof()
+            return await read_response(reader, 'https://instance/raw/1', max_size)
+        return asyncio.run(main())
+
+    def test_chunked(self):
+        response, keep_alive = self.read(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n"
+                                         b"Content-Type: text/plain; charset=utf-8\r\n\r\n"
+                                         b"5\r\nTopic\r\n4;ext=1\r\n \xe2\x9c\x93\r\n0\r\n\r\n")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.text, 'Topic ✓')
+        self.assertTrue(keep_alive)
+
+    def test_connection_close(self):
+        response, keep_alive = self.read(b"HTTP/1.1 404 Not Found\r\nConnection: close\r\n\r\nnot found")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.content, b'not found')
+        self.assertFalse(keep_alive)
+
+    def test_max_size(self):
+        with self.assertRaises(ValueError):
+            self.read(b"HTTP/1.1 200 OK\r\nContent-Length: 2048\r\n\r\n", max_size=1024)
+        with self.assertRaises(ValueError):
+            self.read(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n800\r\n", max_size=1024)
+
+if __name__ == '__main__':
+    unittest.main()
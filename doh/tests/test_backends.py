@@ -0,0 +1,36 @@
+import unittest
+import json
+
+from test_data import *
+from helpers import *
+from doh.doh import *
+
+# Recorded Discourse responses from `test_data.py`
+RECORDED_RESPONSES = {
+    '/t/9729.json?include_raw=true': json.dumps(json_topic_response),
+}
+
+class JsonBackend(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StubServer(RECORDED_RESPONSES).start()
+        cls.base_url = cls.server.base_url
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.requests.clear()
+
+    def test_topic_markdown(self):
+        self.assertEqual(get_json_markdown(self.base_url, '9729'), json_topic_result)
+
+        # one request per topic: replies that are not in the first response are not fetched
+        self.assertEqual([path for path, _ in self.server.requests], ['/t/9729.json?include_raw=true'])
+
+    def test_missing_topic(self):
+        self.assertEqual(get_json_markdown(self.base_url, '1'), '')
+
+if __name__ == '__main__':
+    unittest.main()
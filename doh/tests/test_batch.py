@@ -0,0 +1,77 @@
+import unittest
+import tempfile
+import os
+from unittest import mock
+
+from test_data import *
+from helpers import *
+from doh.doh import *
+
+BATCH_FILE = """
+multipass:
+  instance: https://discourse.ubuntu.com
+  home_topic_id: 8294
+  generate_h1: true
+snap:
+  instance: forum.snapcraft.io
+  home_topic_id: "11127"
+  docs_directory: snap-docs
+"""
+
+class BatchFile(unittest.TestCase):
+    def test_load_batch_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'batch.yaml')
+            with open(path, 'w') as f:
+                f.write(BATCH_FILE)
+
+            configs = load_batch_file(path, {'docs_directory': 'docs', 'generate_h1': False, 'jobs': 4})
+
+        self.assertEqual(list(configs), ['multipass', 'snap'])
+        self.assertEqual(configs['multipass']['instance'], 'discourse.ubuntu.com')
+        self.assertEqual(configs['multipass']['home_topic_id'], '8294')
+        self.assertEqual(configs['multipass']['docs_directory'], os.path.join('docs', 'multipass'))
+        self.assertTrue(configs['multipass']['generate_h1'])
+        self.assertEqual(configs['snap']['docs_directory'], 'snap-docs')
+        self.assertFalse(configs['snap']['generate_h1'])
+        self.assertEqual(configs['snap']['jobs'], 4)
+
+class BatchRun(unittest.TestCase):
+    def test_run_batch(self):
+        # 'two' lists the same topics as 'one' under another home topic, and the home topic of 'bad' doesn't exist
+        navtable_two = navtable_diataxis_1_home_0.replace('/t/9729', '/t/9730')
+        topics = {'9722': 'Tutorial', '9724': 'Set up', '14575': 'Deploy on LXD', '14783': 'TLS', '15422': 'Rotate'}
+        responses = {f"https://{INSTANCE}/raw/{topic_id}": f"author | 2024-01-01 00:00:00 UTC | #1\n\n{text}\n"
+                     for topic_id, text in topics.items()}
+        responses[f"https://{INSTANCE}/raw/9729"] = navtable_diataxis_1_home_0
+        responses[f"https://{INSTANCE}/raw/9730"] = navtable_two
+
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot = os.path.join(directory, 'snapshot.db')
+            record_snapshot(snapshot, responses)
+            store = os.path.join(directory, 'store')
+            configs = {name: docset_config(os.path.join(directory, name), home_topic_id=home_topic_id, jobs=2,
+                                           replay=snapshot, store_directory=store, max_retries=0)
+                       for name, home_topic_id in [('one', '9729'), ('two', '9730'), ('bad', '1')]}
+
+            with mock.patch('doh.runner.create_session', wraps=create_session) as sessions, \
+                    self.assertLogs(level='INFO') as logs:
+                self.assertFalse(run_batch(configs, jobs=2))
+
+            # one session for the instance, and each topic is fetched once for both doc sets
+            self.assertEqual(sessions.call_count, 1)
+            self.assertEqual(open_store(store).fetched, 7)
+            self.assertEqual(open_store(store).reused, 5)
+
+            for name in ['one', 'two']:
+                with open(os.path.join(directory, name, 'how-to', 'deploy', 'deploy-on-lxd.md')) as f:
+                    self.assertIn('Deploy on LXD', f.read())
+
+        # rows of the summary table: name, topics, unchanged, KiB, time, unresolved links and status
+        rows = [line.split(':', 2)[2].split() for line in logs.output]
+        summary = {row[0]: row for row in rows if len(row) == 7 and row[0] in configs}
+        self.assertEqual(summary['one'][1], '6')
+        self.assertEqual([summary[name][-1] for name in configs], ['ok', 'ok', 'failed'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from unittest import mock
+import tempfile
+import time
+import os
+
+from test_data import *
+from helpers import *
+from doh.doh import *
+from doh.cache import ResponseCache
+
+class ResponseCaching(unittest.TestCase):
+    def test_validators(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResponseCache(directory)
+            self.assertEqual(cache.validators('https://instance/raw/1'), {})
+
+            cache.store('https://instance/raw/1', 'text', etag='"abc"', last_modified='Mon, 01 Jan 2024 00:00:00 GMT')
+            self.assertEqual(cache.validators('https://instance/raw/1'),
+                             {'If-None-Match': '"abc"', 'If-Modified-Since': 'Mon, 01 Jan 2024 00:00:00 GMT'})
+            self.assertEqual(cache.read('https://instance/raw/1'), 'text')
+
+    def test_eviction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResponseCache(directory, max_size=25)
+            for i in range(3):
+                cache.store(f'https://instance/raw/{i}', 'x' * 10, etag='"abc"')
+                time.sleep(0.01)
+
+            self.assertIsNone(cache.read('https://instance/raw/0'))
+            self.assertEqual(cache.read('https://instance/raw/2'), 'x' * 10)
+
+    def test_failed_write(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResponseCache(directory)
+            with mock.patch('doh.cache.os.replace', side_effect=OSError('disk full')):
+                with self.assertRaises(OSError):
+                    cache.store('https://instance/raw/1', 'text', etag='"abc"')
+
+            # no temporary file is left behind
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_session(self):
+        with tempfile.TemporaryDirectory() as directory, StubServer({'/raw/1': 'raw markdown'}) as server:
+            session = DiscourseSession(cache=ResponseCache(directory))
+            url = f"{server.base_url}/raw/1"
+            self.assertEqual(get_raw_markdown(url, session), 'raw markdown')
+            self.assertNotIn('If-None-Match', server.requests[0][1])
+            self.assertIn('If-None-Match', session.cache.validators(url))
+
+            # the second request is conditional, and its 304 is answered with the cached body
+            self.assertEqual(get_raw_markdown(url, session), 'raw markdown')
+            self.assertEqual(server.requests[1][1]['If-None-Match'], session.cache.validators(url)['If-None-Match'])
+            self.assertEqual(session.cache.hits, 1)
+            self.assertEqual(session.stats.bytes, len('raw markdown'))
+
+if __name__ == '__main__':
+    unittest.main()
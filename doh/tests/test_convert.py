@@ -0,0 +1,69 @@
+import unittest
+import tempfile
+import os
+from unittest import mock
+
+from test_data import *
+from helpers import *
+from doh.doh import *
+
+def raw_topic(topic_id: str) -> str:
+    """
+    Raw markdown of a topic that goes through every conversion stage: comments, headings with anchors,
+    links to topics inside and outside the navigation table, and notes.
+    """
+    return (f"author | 2024-01-01 00:00:00 UTC | #1\n\n"
+            f"Topic {topic_id}.\n\n"
+            '<a href="#heading--setup"><h2 id="heading--setup">Setup</h2></a>\n\n'
+            "See [setup](#heading--setup), [Deploy on LXD](/t/deploy-on-lxd-5/14575#heading--setup),\n"
+            "[the environment](/t/9724) and [a topic outside the navigation table](/t/other/123).\n\n"
+            '[note type="caution"]\nCheck the configuration first.\n[/note]\n\n'
+            "-------------------------\n\n"
+            "reader | 2024-01-02 00:00:00 UTC | #2\n\nA comment.\n")
+
+class ConversionModes(unittest.TestCase):
+    def convert(self, directory, steps: bool = False, **settings):
+        """
+        Converts the test documentation set in `directory`, and returns the output files and the handler.
+        """
+        config = docset_config(directory, **settings)
+        discourse_docs = docset_handler(config, navtable_diataxis_1_home_0)
+        for item in discourse_docs.topics():
+            item.filepath.parent.mkdir(parents=True, exist_ok=True)
+            text = raw_topic(item.topic_id) if not item.isHomeTopic else navtable_diataxis_1_home_0
+            item.filepath.with_suffix('.md').write_text(text)
+
+        sphinx_docs = SphinxHandler(discourse_docs, config)
+        sphinx_docs.update_index_pages(plan_output(discourse_docs))
+        if steps:
+            sphinx_docs.replace_href_anchors()
+            sphinx_docs.update_links()
+            sphinx_docs.replace_discourse_metadata(truncate_comments=True)
+            sphinx_docs.replace_discourse_notes()
+            sphinx_docs.generate_tocs()
+        else:
+            sphinx_docs.convert(sphinx_docs.pipeline_stages(truncate_comments=True))
+        return read_tree(directory), sphinx_docs
+
+    def test_identical_output(self):
+        with tempfile.TemporaryDirectory() as directory:
+            expected, steps = self.convert(os.path.join(directory, 'steps'), steps=True)
+            streamed, streaming = self.convert(os.path.join(directory, 'streaming'), streaming=True)
+            # at least two CPU cores, so that the topics go through the process pool
+            with mock.patch('os.cpu_count', return_value=4), \
+                    mock.patch('doh.sphinx_handler.ProcessPoolExecutor', wraps=ProcessPoolExecutor) as executor:
+                pooled, pool = self.convert(os.path.join(directory, 'pool'), jobs=4)
+            self.assertTrue(executor.called)
+
+        self.assertEqual(len(expected), 8)
+        self.assertIn(b'```{caution}', expected['tutorial/1-set-up-the-environment.md'])
+        self.assertEqual(streamed, expected)
+        self.assertEqual(pooled, expected)
+
+        # unresolved links and link records are collected from the worker processes too
+        self.assertEqual(len(pool.unresolved_links), len(steps.unresolved_links))
+        self.assertEqual(pool.link_records, steps.link_records)
+        self.assertEqual(streaming.link_records, steps.link_records)
+
+if __name__ == '__main__':
+    unittest.main()
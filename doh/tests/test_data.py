@@ -96,3 +96,32 @@ navtable_mixed_landing_pages = \
 | 1 | test | |
 |  | test2 | |
 [/details]"""
+
+
+## test_json_backend()
+# Recorded responses of the Discourse JSON API, trimmed to the fields used by doh
+json_topic_response = \
+{
+    "id": 9729,
+    "title": "Charmed OpenSearch Documentation",
+    "post_stream": {
+        "posts": [
+            {"id": 21101, "username": "alice", "post_number": 1, "version": 42,
+             "updated_at": "2024-05-02T10:20:30.123Z", "raw": "# OpenSearch\n\nWelcome!"},
+            {"id": 21102, "username": "bob", "post_number": 2, "version": 1,
+             "updated_at": "2024-05-03T08:00:00.000Z", "raw": "First comment"},
+        ],
+        "stream": [21101, 21102, 21103],
+    },
+}
+
+json_topic_result = \
+"""alice | 2024-05-02 10:20:30 UTC | #1
+
+# OpenSearch
+
+Welcome!
+
+-------------------------
+
+"""
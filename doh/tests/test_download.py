@@ -0,0 +1,149 @@
+import unittest
+import tempfile
+import threading
+import time
+import os
+
+from test_data import *
+from helpers import *
+from doh.doh import *
+
+class StreamingDownload(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        snapshot = record_snapshot(os.path.join(self.directory.name, 'snapshot.db'), {'https://instance/raw/123': 'x' * 1000})
+        self.session = DiscourseSession(snapshot=snapshot, replay=True, max_retries=0)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_size_limit(self):
+        path = os.path.join(self.directory.name, 'topic.md')
+        self.assertEqual(download_topic(path, 'https://instance/raw/123', self.session, 1000), 1000)
+
+        # a topic over the limit leaves the previous file in place, and no temporary file
+        self.assertEqual(download_topic(path, 'https://instance/raw/123', self.session, 999), 0)
+        self.assertEqual(os.path.getsize(path), 1000)
+        self.assertFalse([name for name in os.listdir(self.directory.name) if name.endswith('.tmp')])
+
+        self.assertEqual(get_raw_markdown('https://instance/raw/123', self.session, 999), '')
+
+class ConditionalDownload(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer({'/raw/1': 'raw markdown'}).start()
+        self.base_url = self.server.base_url
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_not_modified(self):
+        with tempfile.TemporaryDirectory() as directory:
+            session = DiscourseSession()
+            tmp_path, digest, size, validators = stream_raw_markdown(f"{self.base_url}/raw/1", directory, session)
+            self.assertEqual((digest, size, list(validators)), (digest_text('raw markdown'), 12, ['If-None-Match']))
+            os.unlink(tmp_path)
+
+            # nothing is downloaded or written when the validators of the previous download still match
+            download = stream_raw_markdown(f"{self.base_url}/raw/1", directory, session, validators=validators)
+            self.assertEqual(download, (None, None, 0, validators))
+            self.assertEqual(self.server.requests[-1][1]['If-None-Match'], validators['If-None-Match'])
+            self.assertEqual(os.listdir(directory), [])
+            self.assertEqual(session.stats.bytes, 12)
+
+class ConcurrentDownload(unittest.TestCase):
+    def setUp(self):
+        # every topic except 'Rotate TLS/CA certificates' (15422), whose download fails
+        topics = ['9729', '9722', '9724', '14575', '14783']
+        self.server = StubServer({f"/raw/{topic_id}": f"Topic {topic_id}\n" for topic_id in topics}).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def download(self, directory, jobs: int) -> DiscourseHandler:
+        config = docset_config(directory, jobs=jobs, max_retries=0)
+        discourse_docs = docset_handler(config, navtable_diataxis_1_home_0, session=self.server.session(config))
+        discourse_docs.download()
+        return discourse_docs
+
+    def test_jobs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            serial = self.download(os.path.join(directory, 'serial'), jobs=1)
+            parallel = self.download(os.path.join(directory, 'parallel'), jobs=4)
+
+            # the file layout and contents don't depend on the number of jobs
+            self.assertEqual(read_tree(os.path.join(directory, 'parallel')), read_tree(os.path.join(directory, 'serial')))
+            with open(os.path.join(directory, 'parallel', 'how-to', 'deploy', 'deploy-on-lxd.md')) as f:
+                self.assertEqual(f.read(), 'Topic 14575\n')
+
+        self.assertEqual(len(self.server.requests), 12)
+        self.assertEqual(parallel.download_statistics['topics'], 6)
+        self.assertEqual(parallel.download_statistics['bytes'], serial.download_statistics['bytes'])
+
+        # a failed download leaves no file, and the topic is not converted
+        failed = parallel.get_item('15422')
+        self.assertFalse(failed.isChanged)
+        self.assertFalse(failed.filepath.with_suffix('.md').exists())
+
+    def test_concurrency(self):
+        lock = threading.Lock()
+        in_flight = [0, 0] # current, maximum
+
+        def slow(topic_id: str):
+            def respond(handler) -> tuple:
+                with lock:
+                    in_flight[0] += 1
+                    in_flight[1] = max(in_flight)
+                time.sleep(0.05)
+                with lock:
+                    in_flight[0] -= 1
+                return 200, {}, f"Topic {topic_id}\n".encode('utf-8')
+            return respond
+        self.server.responses.update({path: slow(path.split('/')[-1]) for path in self.server.responses})
+
+        with tempfile.TemporaryDirectory() as directory:
+            discourse_docs = self.download(directory, jobs=4)
+
+        # the pool holds a connection per job, and up to 4 topics are downloaded at once
+        self.assertGreaterEqual(discourse_docs._session.pool_size, 4)
+        self.assertGreater(in_flight[1], 1)
+        self.assertLessEqual(in_flight[1], 4)
+        self.assertEqual(discourse_docs.download_statistics['topics'], 6)
+
+    def test_timeout(self):
+        def hang(handler) -> tuple:
+            time.sleep(1)
+            return 200, {}, b'Topic 14575\n'
+        self.server.responses['/raw/14575'] = hang
+
+        with tempfile.TemporaryDirectory() as directory:
+            config = docset_config(directory, jobs=4, max_retries=0, timeout=0.2)
+            discourse_docs = docset_handler(config, navtable_diataxis_1_home_0, session=self.server.session(config))
+            start = time.perf_counter()
+            discourse_docs.download()
+
+            # the topic that timed out is skipped, the others are downloaded
+            self.assertLess(time.perf_counter() - start, 1)
+            self.assertFalse(discourse_docs.get_item('14575').filepath.exists())
+            self.assertTrue(discourse_docs.get_item('14783').filepath.exists())
+        self.assertEqual(discourse_docs._session.stats.errors, 1)
+
+    def test_retries(self):
+        failures = set()
+        def unavailable(handler) -> tuple:
+            if handler.path not in failures:
+                failures.add(handler.path)
+                return 503, {'Retry-After': '0'}, b''
+            return 200, {}, b'Topic 14575\n'
+        self.server.responses['/raw/14575'] = unavailable
+
+        with tempfile.TemporaryDirectory() as directory:
+            config = docset_config(directory, jobs=4, max_retries=1)
+            discourse_docs = docset_handler(config, navtable_diataxis_1_home_0, session=self.server.session(config))
+            discourse_docs.download()
+
+            with open(discourse_docs.get_item('14575').filepath) as f:
+                self.assertEqual(f.read(), 'Topic 14575\n')
+        self.assertEqual(discourse_docs._session.stats.retries, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,21 @@
 import unittest
 
 from test_data import *
+from helpers import *
 from doh.doh import *
 
 class FilepathGeneration(unittest.TestCase):
     def test_filepath_generation(self):
         pass
 
+    def test_item_queries(self):
+        config = docset_config('docs/src')
+        discourse_docs = docset_handler(config, navtable_diataxis_1_home_0)
+
+        self.assertEqual(discourse_docs.home_item().title, 'Home')
+        self.assertEqual([item.topic_id for item in discourse_docs.topics()], ['9729', '9722', '9724', '14575', '14783', '15422'])
+        self.assertEqual([item.title for item in discourse_docs.folders()], ['Tutorial', 'How To', 'Deploy', 'TLS encryption'])
+        self.assertEqual(discourse_docs.get_item_by_path('docs/src/how-to/deploy/deploy-on-lxd.md').topic_id, '14575')
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
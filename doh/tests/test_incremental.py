@@ -0,0 +1,139 @@
+import unittest
+import tempfile
+import os
+
+from test_data import *
+from helpers import *
+from doh.doh import *
+from doh.manifest import SyncManifest, digest_text
+
+class FakeItem:
+    isTopic = True
+    validators = {}
+    def __init__(self, topic_id, filepath, text):
+        self.topic_id = topic_id
+        self.filepath = filepath
+        self.raw_digest = digest_text(text)
+
+class IncrementalManifest(unittest.TestCase):
+    def test_unchanged_topic(self):
+        with tempfile.TemporaryDirectory() as docs:
+            item = FakeItem('123', Path(docs) / 'page.md', 'text')
+            item.filepath.write_text('converted')
+
+            manifest = SyncManifest(docs)
+            manifest.check_layout('layout')
+            manifest.save([item])
+
+            manifest = SyncManifest(docs)
+            self.assertTrue(manifest.check_layout('layout'))
+            self.assertTrue(manifest.is_unchanged('123', digest_text('text')))
+            self.assertFalse(manifest.is_unchanged('123', digest_text('new text')))
+
+    def test_validators(self):
+        with tempfile.TemporaryDirectory() as docs:
+            item = FakeItem('123', Path(docs) / 'page.md', 'text')
+            item.validators = {'If-None-Match': '"abc"'}
+            item.filepath.write_text('converted')
+
+            manifest = SyncManifest(docs)
+            manifest.check_layout('layout')
+            manifest.save([item])
+
+            manifest = SyncManifest(docs)
+            self.assertEqual(manifest.validators('123'), {})
+            manifest.check_layout('layout')
+            self.assertEqual(manifest.validators('123'), {'If-None-Match': '"abc"'})
+
+            # without the converted file, the topic has to be downloaded again
+            item.filepath.unlink()
+            self.assertEqual(manifest.validators('123'), {})
+
+    def test_layout_change(self):
+        with tempfile.TemporaryDirectory() as docs:
+            item = FakeItem('123', Path(docs) / 'page.md', 'text')
+            item.filepath.write_text('converted')
+
+            manifest = SyncManifest(docs)
+            manifest.check_layout('layout')
+            manifest.save([item])
+
+            manifest = SyncManifest(docs)
+            self.assertFalse(manifest.check_layout('other layout'))
+            self.assertFalse(manifest.is_unchanged('123', digest_text('text')))
+
+class IncrementalDownload(unittest.TestCase):
+    def test_not_modified_without_manifest(self):
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot = record_snapshot(os.path.join(directory, 'snapshot.db'),
+                                       {f"https://{INSTANCE}/raw/{topic_id}": f"Topic {topic_id}\n"
+                                        for topic_id in ['9729', '9722', '9724', '14575', '14783', '15422']})
+            not_modified = requests.Response()
+            not_modified.status_code, not_modified.reason, not_modified._content = 304, 'Not Modified', b''
+            snapshot.record(f"https://{INSTANCE}/raw/15422", not_modified)
+
+            # a 304 for a topic that the docs directory has no copy of is a failed download
+            config = docset_config(os.path.join(directory, 'docs'), incremental=True,
+                                   replay=os.path.join(directory, 'snapshot.db'))
+            discourse_docs = docset_handler(config, navtable_diataxis_1_home_0)
+            discourse_docs.download()
+
+            failed = discourse_docs.get_item('15422')
+            self.assertFalse(failed.isChanged)
+            self.assertEqual(failed.raw_digest, '')
+            self.assertFalse(failed.filepath.exists())
+            self.assertTrue(discourse_docs.get_item('14575').filepath.exists())
+
+class ChangeManifest(unittest.TestCase):
+    def run_docset(self, docs, navtable):
+        config = docset_config(docs)
+        discourse_docs = docset_handler(config, navtable, write_topics=True)
+
+        sphinx_docs = SphinxHandler(discourse_docs, config)
+        sphinx_docs.update_index_pages()
+        changes = sphinx_docs.write_change_manifest()
+        discourse_docs.save_manifest()
+        return changes
+
+    def test_changes(self):
+        with tempfile.TemporaryDirectory() as docs:
+            changes = self.run_docset(docs, navtable_diataxis_1_home_0)
+            self.assertEqual(len(changes['added']), 8)
+
+            unchanged_file = os.path.join(docs, 'tutorial', 'index.md')
+            os.utime(unchanged_file, ns=(0, 0))
+
+            # remove 'Deploy on LXD' from the 'Deploy' folder
+            navtable = navtable_diataxis_1_home_0.replace("| 3 | h-deploy-lxd | [Deploy on LXD](/t/14575) |\n", "")
+            changes = self.run_docset(docs, navtable)
+            self.assertEqual(changes['added'], [])
+            self.assertEqual(changes['modified'], [])
+            self.assertEqual(changes['removed'], ['how-to/deploy/deploy-on-lxd.md'])
+            self.assertEqual(changes['toctree_changed'], ['how-to/deploy/index.md'])
+
+            # the removed file is deleted, so that Sphinx no longer builds it
+            self.assertFalse(os.path.exists(os.path.join(docs, 'how-to', 'deploy', 'deploy-on-lxd.md')))
+            self.assertTrue(os.path.exists(os.path.join(docs, 'how-to', 'deploy', 'index.md')))
+
+            # rewritten with identical contents, so its modification time is restored
+            self.assertEqual(os.stat(unchanged_file).st_mtime_ns, 0)
+
+    def test_removed_folder(self):
+        with tempfile.TemporaryDirectory() as docs:
+            self.run_docset(docs, navtable_diataxis_1_home_0)
+            Path(docs, 'notes.txt').write_text('not an output file')
+
+            # remove the 'TLS encryption' folder and its page
+            navtable = navtable_diataxis_1_home_0.replace("| 2 | h-tls| [TLS encryption](/t/14783) |\n", "")
+            navtable = navtable.replace("| 3 | h-rotate-tls-ca-certificates   | [Rotate TLS/CA certificates](/t/15422) |\n", "")
+            changes = self.run_docset(docs, navtable)
+            self.assertEqual(changes['removed'], ['how-to/tls-encryption/index.md',
+                                                  'how-to/tls-encryption/rotate-tls-ca-certificates.md'])
+
+            # the folder left empty is deleted too, other files are kept
+            self.assertFalse(os.path.exists(os.path.join(docs, 'how-to', 'tls-encryption')))
+            self.assertTrue(os.path.exists(os.path.join(docs, 'how-to', 'index.md')))
+            self.assertTrue(os.path.exists(os.path.join(docs, 'notes.txt')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
 import unittest
+import tempfile
+import os
 
 from test_data import *
+from helpers import *
 from doh.doh import *
 
 class IndexGeneration(unittest.TestCase):
@@ -11,5 +14,47 @@ class IndexGeneration(unittest.TestCase):
     def test_mixed_index_files(self):
         pass
 
+    def test_plan_output(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = docset_config(directory)
+            discourse_docs = docset_handler(config, navtable_diataxis_1_home_0)
+
+            # planning touches no files
+            plan = plan_output(discourse_docs)
+            self.assertEqual(os.listdir(directory), [])
+            self.assertEqual(plan.to_dict()['renames'][1], {'source': 'tutorial/tutorial.md', 'target': 'tutorial/index.md'})
+            self.assertEqual(plan.to_dict()['index_files'], ['how-to/index.md', 'how-to/deploy/index.md'])
+            self.assertEqual(plan.link_targets['14783'], '/how-to/tls-encryption/index')
+
+            for item in discourse_docs.topics():
+                item.filepath.parent.mkdir(parents=True, exist_ok=True)
+                item.filepath.with_suffix('.md').write_text(item.topic_id)
+            SphinxHandler(discourse_docs, config).update_index_pages(plan)
+
+            for entry in plan.files:
+                self.assertTrue(os.path.exists(os.path.join(directory, entry['path'])), entry['path'])
+            with open(os.path.join(directory, 'how-to', 'tls-encryption', 'index.md')) as f:
+                self.assertEqual(f.read(), '14783')
+
+    def test_failed_landing_page(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = docset_config(directory)
+            discourse_docs = docset_handler(config, navtable_diataxis_1_home_0)
+            plan = plan_output(discourse_docs)
+
+            for item in discourse_docs.topics():
+                item.filepath.parent.mkdir(parents=True, exist_ok=True)
+                if item.topic_id == '14783':
+                    # what `_download_item()` leaves behind when the first download of a topic fails
+                    item.isChanged = False
+                    item.raw_digest = ''
+                else:
+                    item.filepath.with_suffix('.md').write_text(item.topic_id)
+            SphinxHandler(discourse_docs, config).update_index_pages(plan)
+
+            with open(os.path.join(directory, 'how-to', 'tls-encryption', 'index.md')) as f:
+                self.assertEqual(f.read(), '\n# Tls-Encryption\n')
+            self.assertTrue(discourse_docs.get_item('14783').isChanged)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
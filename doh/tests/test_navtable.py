@@ -11,5 +11,18 @@ class NavigationParser(unittest.TestCase):
         topics = parse_discourse_navigation_table(different_link_types)
         self.assertEqual(topics, different_link_types_result)
 
+        topics = parse_discourse_navigation_table(markdown_variations)
+        self.assertEqual(topics, markdown_variations_result)
+
+    def test_malformed_rows(self):
+        table = "| Level | Path | Navlink |\n|--|--|--|\n| 1 | a | [A](/t/1) | extra |\nnot a row\n| x | b | [B](/t/2) |"
+        with self.assertLogs(level='WARNING') as logs:
+            with self.assertRaises(SystemExit):
+                tokenize_navigation_table(table, first_line=10)
+
+        self.assertIn('line 12 has 4 columns', logs.output[0])
+        self.assertIn('line 13 is not a table row', logs.output[1])
+        self.assertIn('line 14', logs.output[2])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
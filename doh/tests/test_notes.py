@@ -0,0 +1,32 @@
+import unittest
+
+from test_data import *
+from doh.doh import *
+from doh.sphinx_handler import DISCOURSE_TAGS, DiscourseTagRewriter
+
+class NoteReplacement(unittest.TestCase):
+    def test_note_types(self):
+        self.assertEqual(DISCOURSE_TAGS.sub('[note]\n'), '```{note}\n')
+        self.assertEqual(DISCOURSE_TAGS.sub('[note type="caution"]\n'), '```{caution}\n')
+        self.assertEqual(DISCOURSE_TAGS.sub('[note type="information"]\n'), '```{note}\n')
+        self.assertEqual(DISCOURSE_TAGS.sub('[note type="negative"]\n'), '```{warning}\n')
+        self.assertEqual(DISCOURSE_TAGS.sub('[note type="positive"]\n'), '```{tip}\n')
+        self.assertEqual(DISCOURSE_TAGS.sub('[/note]\n'), '```\n')
+        self.assertEqual(DISCOURSE_TAGS.sub('Inline [note]text[/note].\n'), 'Inline ```{note}text```.\n')
+        self.assertEqual(DISCOURSE_TAGS.sub('[note type="unknown"] [link](/t/1)\n'), '[note type="unknown"] [link](/t/1)\n')
+
+    def test_tabs(self):
+        lines = ['[tabs]\n', '[tab version="Juju 3"]\n', '[note]\n', 'Text\n', '[/note]\n', '[/tab]\n', '[/tabs]\n']
+        self.assertEqual([DISCOURSE_TAGS.sub(line) for line in lines],
+                         ['`````{tabs}\n', '````{group-tab} Juju 3\n', '```{note}\n', 'Text\n', '```\n', '````\n', '`````\n'])
+        self.assertEqual(DISCOURSE_TAGS.sub('[tab]\n'), '[tab]\n')
+
+    def test_new_tag(self):
+        rewriter = DiscourseTagRewriter({
+            'tab': lambda closing, attributes: '</tab>' if closing else '<tab>',
+            'tabs': lambda closing, attributes: '</tabs>' if closing else '<tabs>',
+        })
+        self.assertEqual(rewriter.sub('[tabs][tab name="A"]a[/tab][/tabs]'), '<tabs><tab>a</tab></tabs>')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+import tempfile
+import json
+import os
+from pathlib import Path
+
+from test_data import *
+from doh.doh import *
+from doh.profiling import StageProfiler, percentile
+
+class StageProfiling(unittest.TestCase):
+    def test_percentile(self):
+        latencies = [0.1 * i for i in range(1, 11)]
+        self.assertAlmostEqual(percentile(latencies, 0.5), 0.5)
+        self.assertAlmostEqual(percentile(latencies, 0.9), 0.9)
+        self.assertAlmostEqual(percentile(latencies, 1.0), 1.0)
+        self.assertEqual(percentile([], 0.5), 0.0)
+
+    def test_stage(self):
+        session = DiscourseSession()
+        profiler = StageProfiler(session)
+        with tempfile.TemporaryDirectory() as directory:
+            with profiler.stage('write'):
+                write_topic(Path(directory) / 'topic', 'raw markdown')
+                session.stats.add_latency(0.25)
+
+        stage = profiler.stages[0]
+        self.assertEqual(stage['name'], 'write')
+        self.assertEqual(stage['bytes_written'], len('raw markdown'))
+        self.assertEqual(stage['files_touched'], 1)
+        self.assertEqual(stage['requests'], 1)
+        self.assertEqual(stage['latency_p50'], 0.25)
+
+    def test_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for cprofile in (False, True):
+                profiler = StageProfiler(cprofile=cprofile)
+                with profiler.stage('sum'):
+                    sum(range(1000))
+                profiler.save_report(os.path.join(directory, 'report.json'))
+
+                # the report says whether the times include the overhead of cProfile
+                with open(os.path.join(directory, 'report.json')) as f:
+                    report = json.load(f)
+                self.assertEqual(report['cprofile'], cprofile)
+                self.assertEqual([stage['name'] for stage in report['stages']], ['sum'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 import unittest
+import tempfile
 
 from test_data import *
+from helpers import *
 from doh.doh import *
 
 class ReferenceReplacement(unittest.TestCase):
@@ -10,6 +12,54 @@ class ReferenceReplacement(unittest.TestCase):
         pass
     def test_different_file_headings(self):
         pass
+    def test_topic_outside_navtable(self):
+        config = docset_config('docs/src')
+        discourse_docs = docset_handler(config, navtable_diataxis_1_home_0)
+        sphinx_docs = SphinxHandler(discourse_docs, config)
+
+        item = discourse_docs.get_item('9724')
+        lines = ["See [Deploy](/t/h-deploy-lxd/14575) and [Other](/t/other/123).\n"]
+        updated_lines = list(sphinx_docs._update_links_stage(item, lines))
+
+        self.assertEqual(updated_lines, ["See [Deploy](/how-to/deploy/deploy-on-lxd) and [Other](https://instance.discourse.io/t/other/123).\n"])
+        self.assertEqual(sphinx_docs.unresolved_links, [{'file': str(item.filepath), 'text': 'Other', 'link': '/t/other/123'}])
+
+    def test_slug_with_digits(self):
+        config = docset_config('docs/src')
+        discourse_docs = docset_handler(config, navtable_diataxis_1_home_0)
+        sphinx_docs = SphinxHandler(discourse_docs, config)
+
+        item = discourse_docs.get_item('9724')
+        lines = ["[Deploy](/t/deploy-on-lxd-5/14575#heading--setup), [TLS](/t/14783/2) and [Other](/t/topic-9724/123).\n"]
+        record = new_link_record('')
+        updated_lines = list(sphinx_docs._update_links_stage(item, lines))
+        record_links(record, lines[0], config['instance'])
+
+        self.assertEqual(updated_lines, ["[Deploy](/how-to/deploy/deploy-on-lxd), [TLS](/how-to/tls-encryption/tls-encryption) and "
+                                         "[Other](https://instance.discourse.io/t/topic-9724/123).\n"])
+        self.assertEqual(record['unresolved'], [])
+
+    def test_link_graph(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = docset_config(directory)
+            discourse_docs = docset_handler(config, navtable_diataxis_1_home_0)
+            sphinx_docs = SphinxHandler(discourse_docs, config)
+
+            source = discourse_docs.get_item('9724')
+            target = discourse_docs.get_item('14575')
+            lines = ['<a href="#heading--intro"><h2 id="heading--intro">Intro</h2></a>\n',
+                     "See [intro](#heading--intro), [missing](#heading--missing), [LXD](/t/h-deploy-lxd/14575#heading--setup),\n",
+                     "[forum](https://instance.discourse.io/c/docs), [other](/t/other/123) and [site](https://example.com).\n"]
+            list(sphinx_docs._update_links_stage(source, sphinx_docs._replace_href_anchors_stage(source, lines)))
+            list(sphinx_docs._replace_href_anchors_stage(target, ['## Setup\n']))
+
+            report = sphinx_docs.write_link_graph()
+            self.assertEqual(report['broken'], [{'file': 'tutorial/1-set-up-the-environment.md', 'link': '#missing'}])
+            self.assertEqual(report['unresolved'], [{'file': 'tutorial/1-set-up-the-environment.md', 'link': 'https://instance.discourse.io/c/docs'}])
+            self.assertEqual(report['outside_navtable'], [{'file': 'tutorial/1-set-up-the-environment.md', 'link': '/t/other/123'}])
+            self.assertEqual(report['external'], 1)
+            self.assertNotIn('how-to/deploy/deploy-on-lxd.md', report['orphans'])
+            self.assertIn('tutorial/1-set-up-the-environment.md', report['orphans'])
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
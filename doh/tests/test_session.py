@@ -0,0 +1,125 @@
+import unittest
+import threading
+import time
+
+from test_data import *
+from helpers import *
+from doh.doh import *
+from doh.session import DEFAULT_POOL_SIZE, DiscourseSession, RequestScheduler
+
+def rate_limited(seen: set):
+    """
+    Returns a stub response that rejects the first request to each path with a 429, then answers normally.
+    """
+    def respond(handler) -> tuple:
+        if handler.path not in seen:
+            seen.add(handler.path)
+            return 429, {'Retry-After': '0'}, b''
+        return 200, {}, b'raw markdown'
+    return respond
+
+class RateLimits(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        respond = rate_limited(set())
+        cls.server = StubServer({'/raw/1': respond, '/raw/2': respond}).start()
+        cls.base_url = cls.server.base_url
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def test_retry_after(self):
+        session = DiscourseSession(pool_size=4)
+        self.assertEqual(get_raw_markdown(f"{self.base_url}/raw/1", session), 'raw markdown')
+        self.assertEqual(session.stats.requests, 2)
+        self.assertEqual(session.stats.retries, 1)
+        self.assertEqual(session.stats.throttled, 1)
+        self.assertEqual(session.scheduler.limit, 2.5) # halved, then increased by one request per window
+
+    def test_no_retries(self):
+        session = DiscourseSession(max_retries=0)
+        self.assertEqual(get_raw_markdown(f"{self.base_url}/raw/2", session), '')
+        self.assertEqual(session.stats.errors, 1)
+
+class Scheduling(unittest.TestCase):
+    def test_throttled_time(self):
+        scheduler = RequestScheduler(1)
+        scheduler.pause(0.3)
+        throttled = []
+        start = time.monotonic()
+        waiter = threading.Thread(target=lambda: throttled.append(scheduler.acquire()))
+        waiter.start()
+
+        # wake the waiter up several times during the pause
+        while waiter.is_alive():
+            scheduler.pause(0)
+            time.sleep(0.05)
+        elapsed = time.monotonic() - start
+
+        # only the time actually waited is counted
+        self.assertGreaterEqual(throttled[0], 0.25)
+        self.assertLessEqual(throttled[0], elapsed)
+
+    def test_streamed_slot(self):
+        with StubServer({'/raw/1': 'raw markdown', '/raw/2': 'raw markdown'}) as server:
+            session = DiscourseSession(pool_size=1)
+            response = session.get(f"{server.base_url}/raw/1", stream=True)
+
+            # the slot is held until the body of the streamed response is consumed and the response closed
+            second = threading.Thread(target=session.get, args=(f"{server.base_url}/raw/2",))
+            second.start()
+            second.join(0.2)
+            self.assertTrue(second.is_alive())
+
+            with response:
+                self.assertEqual(response.text, 'raw markdown')
+            second.join(2)
+            self.assertFalse(second.is_alive())
+
+            response.close() # closing again doesn't free another slot
+            self.assertEqual(session.scheduler._active, 0)
+
+class SessionPooling(unittest.TestCase):
+    # client ports of the connections opened by the current test
+    ports = set()
+
+    @classmethod
+    def setUpClass(cls):
+        def respond(handler) -> tuple:
+            cls.ports.add(handler.client_address[1])
+            return 200, {}, b'raw markdown'
+        cls.server = StubServer({f"/raw/{i}": respond for i in range(20)}).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.ports.clear()
+
+    def test_pool_size(self):
+        self.assertEqual(create_session({}).pool_size, DEFAULT_POOL_SIZE)
+        self.assertEqual(create_session({'jobs': 16}).pool_size, 16)
+        self.assertEqual(create_session({'jobs': 4, 'pool_size': 2}).pool_size, 4)
+
+    def test_keep_alive(self):
+        session = create_session({})
+        for i in range(5):
+            self.assertEqual(get_raw_markdown(f"{self.server.base_url}/raw/{i}", session), 'raw markdown')
+
+        # all requests go through one connection
+        self.assertEqual(len(self.ports), 1)
+        self.assertEqual(session.stats.requests, 5)
+
+    def test_concurrent_requests(self):
+        session = create_session({'jobs': 4})
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            texts = list(executor.map(lambda i: get_raw_markdown(f"{self.server.base_url}/raw/{i}", session), range(20)))
+
+        # connections are reused by the threads, at most one per job
+        self.assertEqual(texts, ['raw markdown'] * 20)
+        self.assertLessEqual(len(self.ports), 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import tempfile
+import os
+
+import requests
+from test_data import *
+from helpers import *
+from doh.doh import *
+from doh.snapshot import Snapshot
+
+class SnapshotReplay(unittest.TestCase):
+    def test_replay(self):
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot = Snapshot(os.path.join(directory, 'snapshot.db'))
+            response = requests.Response()
+            response.status_code, response.reason, response._content = 200, 'OK', 'Topic ✓'.encode('utf-8')
+            response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+            snapshot.record('https://instance/raw/123', response)
+
+            session = DiscourseSession(snapshot=snapshot, replay=True, max_retries=0)
+            self.assertEqual(get_raw_markdown('https://instance/raw/123', session), 'Topic ✓')
+            self.assertEqual(get_raw_markdown('https://instance/raw/456', session), '')
+
+class SnapshotRecording(unittest.TestCase):
+    def test_incremental_recording(self):
+        topics = ['9729', '9722', '9724', '14575', '14783', '15422']
+        with tempfile.TemporaryDirectory() as directory, \
+                StubServer({f"/raw/{topic_id}": f"Topic {topic_id}\n" for topic_id in topics}) as server:
+            snapshot_path = os.path.join(directory, 'snapshot.db')
+            for _ in range(2):
+                config = docset_config(os.path.join(directory, 'docs'), incremental=True, record=snapshot_path)
+                discourse_docs = docset_handler(config, navtable_diataxis_1_home_0, session=server.session(config))
+                discourse_docs.download()
+                discourse_docs.save_manifest()
+
+            # the second run sent no validators, so every topic was downloaded (and recorded) in full again
+            self.assertEqual(len(server.requests), 12)
+            self.assertFalse([path for path, headers in server.requests if 'If-None-Match' in headers])
+
+    def test_not_modified(self):
+        with tempfile.TemporaryDirectory() as directory, StubServer({'/raw/1': 'raw markdown'}) as server:
+            snapshot = Snapshot(os.path.join(directory, 'snapshot.db'))
+            session = DiscourseSession(snapshot=snapshot)
+            etag = session.get(f"{server.base_url}/raw/1").headers['ETag']
+            self.assertEqual(session.get(f"{server.base_url}/raw/1", headers={'If-None-Match': etag}).status_code, 304)
+
+            # the 304 doesn't replace the recorded topic
+            self.assertEqual(snapshot.lookup(f"{server.base_url}/raw/1")[0], 200)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+from unittest import mock
+import tempfile
+import shutil
+import errno
+import os
+
+from test_data import *
+from helpers import *
+from doh.doh import *
+from doh.files import StagedDirectory, exchange_paths, fsync_directory
+
+class StagedOutput(unittest.TestCase):
+    def test_commit_and_discard(self):
+        with tempfile.TemporaryDirectory() as directory:
+            docs = os.path.join(directory, 'docs')
+            os.makedirs(os.path.join(docs, 'how-to'))
+            with open(os.path.join(docs, 'how-to', 'guide.md'), 'w') as f:
+                f.write('old')
+
+            # a discarded run leaves the docs directory as it was
+            staging = StagedDirectory(docs)
+            atomic_write_lines(os.path.join(staging.create(), 'how-to', 'guide.md'), ['new'])
+            staging.discard()
+            with open(os.path.join(docs, 'how-to', 'guide.md')) as f:
+                self.assertEqual(f.read(), 'old')
+
+            staging = StagedDirectory(docs)
+            staging_path = staging.create()
+            atomic_write_lines(os.path.join(staging_path, 'index.md'), ['new'])
+            with open(os.path.join(docs, 'how-to', 'guide.md')) as f:
+                self.assertEqual(f.read(), 'old')
+            self.assertFalse(os.path.exists(os.path.join(docs, 'index.md')))
+
+            staging.commit()
+            self.assertEqual(sorted(os.listdir(docs)), ['how-to', 'index.md'])
+
+            # the docs directory is now a symlink to the new build, and the previous folder is gone
+            self.assertTrue(os.path.islink(docs))
+            self.assertEqual(sorted(os.listdir(directory)), sorted(['docs', os.readlink(docs)]))
+
+    def test_atomic_swap(self):
+        with tempfile.TemporaryDirectory() as directory:
+            docs = os.path.join(directory, 'docs')
+            os.makedirs(docs)
+            missing = []
+
+            def checked(function):
+                # fails the test if the docs directory is missing before or after any step of the swap
+                def wrapper(*args, **kwargs):
+                    missing.extend([function.__name__] if not os.path.isdir(docs) else [])
+                    result = function(*args, **kwargs)
+                    missing.extend([function.__name__] if not os.path.isdir(docs) else [])
+                    return result
+                return wrapper
+
+            # the first run turns the folder into a symlink, the next ones replace the symlink
+            for run in range(3):
+                staging = StagedDirectory(docs)
+                atomic_write_lines(os.path.join(staging.create(), 'index.md'), [f"run {run}"])
+                with mock.patch('doh.files.os.replace', checked(os.replace)), \
+                        mock.patch('doh.files.os.rename', checked(os.rename)), \
+                        mock.patch('doh.files.shutil.rmtree', checked(shutil.rmtree)), \
+                        mock.patch('doh.files.exchange_paths', checked(exchange_paths)), \
+                        mock.patch('doh.files.fsync_directory', checked(fsync_directory)):
+                    staging.commit()
+
+                self.assertEqual(missing, [])
+                with open(os.path.join(docs, 'index.md')) as f:
+                    self.assertEqual(f.read(), f"run {run}")
+                self.assertEqual(sorted(os.listdir(directory)), sorted(['docs', os.readlink(docs)]))
+
+    def test_swap_without_exchange(self):
+        with tempfile.TemporaryDirectory() as directory:
+            docs = os.path.join(directory, 'docs')
+            os.makedirs(docs)
+            staging = StagedDirectory(docs)
+            atomic_write_lines(os.path.join(staging.create(), 'index.md'), ['new'])
+
+            # where renameat2() is not supported, the folder is replaced with two renames
+            with mock.patch('doh.files.exchange_paths', side_effect=OSError(errno.ENOSYS, 'not supported')):
+                staging.commit()
+            self.assertTrue(os.path.islink(docs))
+            self.assertEqual(sorted(os.listdir(directory)), sorted(['docs', os.readlink(docs)]))
+
+    def test_report_paths(self):
+        with tempfile.TemporaryDirectory() as directory:
+            docs = os.path.join(directory, 'docs')
+            config = docset_config(docs, staged=True)
+            with staged_output(config):
+                self.assertNotEqual(config['docs_directory'], docs)
+                discourse_docs = docset_handler(config, navtable_diataxis_1_home_0)
+                sphinx_docs = SphinxHandler(discourse_docs, config)
+                list(sphinx_docs._update_links_stage(discourse_docs.get_item('9724'), ["[Other](/t/other/123)\n"]))
+
+            # the scratch copy is gone, so reports point to the docs directory
+            self.assertEqual(sphinx_docs.unresolved_links[0]['file'], os.path.join(docs, 'tutorial', '1-set-up-the-environment.md'))
+            self.assertEqual(config['docs_directory'], docs)
+            self.assertNotIn('output_directory', config)
+
+if __name__ == '__main__':
+    unittest.main()
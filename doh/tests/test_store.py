@@ -0,0 +1,119 @@
+import unittest
+import tempfile
+import os
+from unittest import mock
+from pathlib import Path
+
+from test_data import *
+from helpers import *
+from doh.doh import *
+import doh.store
+from doh.store import TopicStore
+
+class TopicStorage(unittest.TestCase):
+    def test_fetch_once(self):
+        downloads = []
+        def download(validators):
+            downloads.append(validators)
+            return 'raw markdown', {'If-None-Match': '"abc"'}
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = TopicStore(directory)
+            first = store.fetch('instance', '123', 'raw', download)
+            second = store.fetch('instance', '123', 'raw', download)
+
+            self.assertEqual(first, second)
+            self.assertEqual(first, digest_text('raw markdown'))
+            self.assertEqual(downloads, [{}])
+            self.assertEqual(store.reused, 1)
+
+    def test_failed_download(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = TopicStore(directory)
+            self.assertIsNone(store.fetch('instance', '123', 'raw', lambda validators: ('', {})))
+
+            # the failure is not stored, so the next doc set downloads the topic again
+            digest = store.fetch('instance', '123', 'raw', lambda validators: ('raw markdown', {}))
+            self.assertEqual(digest, digest_text('raw markdown'))
+            self.assertEqual(store.fetched, 1)
+            self.assertEqual(store.reused, 0)
+
+    def test_revalidation(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = TopicStore(directory)
+            digest = store.fetch('instance', '123', 'raw', lambda validators: ('raw markdown', {'If-None-Match': '"abc"'}))
+            store.save()
+
+            # the next run sends the stored validators, and reuses the stored copy on a 304
+            downloads = []
+            def not_modified(validators):
+                downloads.append(validators)
+                return None, validators
+
+            store = TopicStore(directory)
+            self.assertEqual(store.fetch('instance', '123', 'raw', not_modified), digest)
+            self.assertEqual(downloads, [{'If-None-Match': '"abc"'}])
+            self.assertEqual(store.revalidated, 1)
+            self.assertEqual(store.fetched, 0)
+
+            # a topic fetched from another backend is downloaded without validators
+            store = TopicStore(directory)
+            store.fetch('instance', '123', 'json', lambda validators: downloads.append(validators) or ('json markdown', {}))
+            self.assertEqual(downloads[-1], {})
+
+    def test_gc(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = TopicStore(directory)
+            old = store.fetch('instance', '123', 'raw', lambda validators: ('old version', {}))
+            store.save()
+
+            store = TopicStore(directory)
+            new = store.fetch('instance', '123', 'raw', lambda validators: ('new version', {}))
+            kept = store.put('unrelated')
+            store.topics['instance/456'] = {'digest': kept, 'backend': 'raw', 'validators': {}}
+
+            # the previous version of the topic is no longer referenced
+            self.assertEqual(store.gc(), 1)
+            self.assertFalse(store.object_path(old).exists())
+            self.assertTrue(store.object_path(new).exists())
+            self.assertTrue(store.object_path(kept).exists())
+
+    def test_materialize(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = TopicStore(Path(directory) / 'store')
+            digest = store.put('raw markdown')
+
+            paths = [Path(directory) / 'a.md', Path(directory) / 'b.md']
+            for path in paths:
+                self.assertEqual(store.materialize(digest, path), len('raw markdown'))
+            self.assertTrue(os.path.samefile(paths[0], paths[1]))
+
+            # writing a topic file replaces it and leaves the stored object intact
+            write_topic(paths[0], 'converted')
+            self.assertEqual(store.object_path(digest).read_text(), 'raw markdown')
+            self.assertEqual(paths[1].read_text(), 'raw markdown')
+
+class StoreDownload(unittest.TestCase):
+    def test_runs(self):
+        topics = ['9729', '9722', '9724', '14575', '14783', '15422']
+        with tempfile.TemporaryDirectory() as directory, mock.patch.dict('doh.store._stores'), \
+                StubServer({f"/raw/{topic_id}": f"Topic {topic_id}\n" for topic_id in topics}) as server:
+            store_directory = os.path.join(directory, 'store')
+            for run in range(2):
+                for name in ['a', 'b']:
+                    config = docset_config(os.path.join(directory, name), store_directory=store_directory)
+                    discourse_docs = docset_handler(config, navtable_diataxis_1_home_0,
+                                                    session=server.session(config))
+                    discourse_docs.download()
+                    discourse_docs.save_manifest()
+                    self.assertEqual(discourse_docs.get_item('14575').filepath.read_text(), "Topic 14575\n")
+                doh.store._stores.clear() # as in a new process
+
+            # each topic is downloaded once in the first run, and revalidated once in the second
+            requests_sent = [(path, headers.get('If-None-Match')) for path, headers in server.requests]
+            self.assertEqual(len(requests_sent), 2 * len(topics))
+            self.assertTrue(all(etag is None for _, etag in requests_sent[:len(topics)]))
+            self.assertTrue(all(etag for _, etag in requests_sent[len(topics):]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
 import unittest
+import tempfile
+import os
 
 from test_data import *
+from helpers import *
 from doh.doh import *
 
 class ToctreeGeneration(unittest.TestCase):
@@ -9,5 +12,20 @@ class ToctreeGeneration(unittest.TestCase):
     def test_index_toctree(self):
         pass
 
+    def test_explicit_toctrees(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = docset_config(directory, explicit_toctrees=True)
+            discourse_docs = docset_handler(config, navtable_diataxis_1_home_0, write_topics=True)
+
+            sphinx_docs = SphinxHandler(discourse_docs, config)
+            sphinx_docs.update_index_pages()
+            sphinx_docs.generate_tocs()
+
+            # navigation table order, not alphabetical
+            with open(os.path.join(directory, 'index.md')) as f:
+                self.assertTrue(f.read().endswith("Home <self>\ntutorial/index\nhow-to/index\n"))
+            with open(os.path.join(directory, 'how-to', 'index.md')) as f:
+                self.assertTrue(f.read().endswith(":hidden:\n\ndeploy/index\ntls-encryption/index\n"))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file